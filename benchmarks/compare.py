@@ -0,0 +1,74 @@
+"""
+Compare two benchmark result files produced by `benchmarks.run`.
+
+Exits with a non-zero status when any scenario regresses by more than the
+given threshold on throughput or p95 latency.
+
+Usage:
+    python -m benchmarks.compare baseline.json candidate.json --threshold 10
+"""
+
+import argparse
+import json
+import sys
+
+
+def pct_change(old, new):
+    if old in (None, 0) or new is None:
+        return None
+    return (new - old) / old * 100
+
+
+def format_change(change):
+    return "n/a" if change is None else f"{change:+.1f}%"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare benchmark results")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=10.0,
+        help="Allowed regression in percent before failing",
+    )
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = {s["name"]: s for s in json.load(f)["scenarios"]}
+    with open(args.candidate) as f:
+        candidate = {s["name"]: s for s in json.load(f)["scenarios"]}
+
+    regressions = []
+    print(f"{'scenario':<14}{'rps':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'cpu/req':>10}")
+    for name, new in candidate.items():
+        old = baseline.get(name)
+        if old is None:
+            continue
+
+        rps = pct_change(old["throughput_rps"], new["throughput_rps"])
+        p50 = pct_change(old["latency_ms"]["p50"], new["latency_ms"]["p50"])
+        p95 = pct_change(old["latency_ms"]["p95"], new["latency_ms"]["p95"])
+        p99 = pct_change(old["latency_ms"]["p99"], new["latency_ms"]["p99"])
+        cpu = pct_change(old.get("cpu_ms_per_request"), new.get("cpu_ms_per_request"))
+
+        print(
+            f"{name:<14}{format_change(rps):>10}{format_change(p50):>10}"
+            f"{format_change(p95):>10}{format_change(p99):>10}{format_change(cpu):>10}"
+        )
+
+        if rps is not None and rps < -args.threshold:
+            regressions.append(f"{name}: throughput {format_change(rps)}")
+        if p95 is not None and p95 > args.threshold:
+            regressions.append(f"{name}: p95 latency {format_change(p95)}")
+
+    if regressions:
+        print("\nRegressions:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""
+Concurrency check of the span handling in `datadog_filter_pipeline`.
+
+Interleaves hundreds of inlet/outlet pairs on one event loop, with random
+delays between each request's inlet and outlet, and checks that every
+outlet finished the span its own inlet opened. A second phase sends
+inlets whose outlet never comes and checks that their spans are finished
+once `span_timeout` passes instead of leaking.
+
+LLMObs is replaced by a recorder after the pipeline is created, so no data
+is sent to Datadog; `ddtrace` must still be installed to import the filter.
+
+Usage:
+    python -m benchmarks.datadog_concurrency --requests 500
+"""
+
+import argparse
+import asyncio
+import importlib.util
+import os
+import random
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PIPELINE_PATH = os.path.join(
+    ROOT_DIR, "examples", "filters", "datadog_filter_pipeline.py"
+)
+
+
+class RecordedSpan:
+    def __init__(self, model_name, session_id):
+        self.model_name = model_name
+        self.session_id = session_id
+        self.input_data = None
+        self.output_data = None
+        self.tags = None
+        self.finished = 0
+
+    def finish(self, finish_time=None):
+        self.finished += 1
+
+
+class RecordingLLMObs:
+    def __init__(self):
+        self.spans = []
+        self.flushes = 0
+
+    def llm(self, model_name=None, session_id=None, **kwargs):
+        span = RecordedSpan(model_name, session_id)
+        self.spans.append(span)
+        return span
+
+    def annotate(self, span=None, input_data=None, output_data=None, tags=None):
+        if input_data is not None:
+            span.input_data = input_data
+        if output_data is not None:
+            span.output_data = output_data
+        if tags:
+            span.tags = tags
+
+    def flush(self):
+        self.flushes += 1
+
+
+def load_pipeline():
+    sys.path.insert(0, ROOT_DIR)
+    spec = importlib.util.spec_from_file_location("datadog_filter_pipeline", PIPELINE_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    os.environ.setdefault("DD_API_KEY", "unused")
+    pipeline = module.Pipeline()
+    pipeline.LLMObs = RecordingLLMObs()
+    pipeline.export_queue.flush = pipeline.LLMObs.flush
+    pipeline.export_queue.start()
+    return pipeline
+
+
+async def conversation(pipeline, chat, turns, max_delay):
+    user = {"id": f"user-{chat}", "role": "user"}
+    for turn in range(turns):
+        message_id = f"message-{chat}-{turn}"
+        question = f"question {chat}/{turn}"
+        await pipeline.inlet(
+            {
+                "model": "llama3",
+                "chat_id": f"chat-{chat}",
+                "messages": [{"role": "user", "content": question}],
+                "metadata": {"chat_id": f"chat-{chat}", "message_id": message_id},
+            },
+            user,
+        )
+        await asyncio.sleep(random.random() * max_delay)
+        await pipeline.outlet(
+            {
+                "model": "llama3",
+                "chat_id": f"chat-{chat}",
+                "id": message_id,
+                "messages": [
+                    {"role": "user", "content": question},
+                    {"role": "assistant", "content": f"answer {chat}/{turn}"},
+                ],
+            },
+            user,
+        )
+
+
+def check_pairs(spans) -> int:
+    mismatched = 0
+    for span in spans:
+        expected = span.input_data.replace("question", "answer")
+        if span.output_data != expected or span.finished != 1:
+            mismatched += 1
+    return mismatched
+
+
+async def run(args):
+    random.seed(0)
+
+    # Interleaved inlet/outlet pairs
+    pipeline = load_pipeline()
+    started_at = time.perf_counter()
+    await asyncio.gather(
+        *(
+            conversation(pipeline, chat, args.turns, args.max_delay)
+            for chat in range(args.requests)
+        )
+    )
+    duration = time.perf_counter() - started_at
+    pipeline.export_queue.join()
+
+    spans = pipeline.LLMObs.spans
+    mismatched = check_pairs(spans)
+    print(
+        f"interleaved: spans={len(spans)} mismatched={mismatched} "
+        f"open={len(pipeline.spans)} flushes={pipeline.LLMObs.flushes} "
+        f"duration={duration:.2f}s"
+    )
+
+    # Inlets whose outlet never comes
+    # Applied directly, as on_valves_updated would also enable LLMObs
+    pipeline.valves.span_timeout = 1
+    pipeline.spans.configure(pipeline.valves.max_open_chats, pipeline.valves.span_timeout)
+    user = {"id": "user", "role": "user"}
+    for chat in range(args.requests):
+        await pipeline.inlet(
+            {
+                "model": "llama3",
+                "chat_id": f"abandoned-{chat}",
+                "messages": [{"role": "user", "content": "question"}],
+                "metadata": {"chat_id": f"abandoned-{chat}", "message_id": "m"},
+            },
+            user,
+        )
+    open_before = len(pipeline.spans)
+    time.sleep(1.1)
+    pipeline.spans.expire()
+    pipeline.export_queue.stop()
+
+    abandoned = spans[-args.requests :]
+    evicted = sum(1 for span in abandoned if span.finished == 1 and span.tags)
+    print(
+        f"abandoned: open_before={open_before} open_after={len(pipeline.spans)} "
+        f"finished_on_timeout={evicted}"
+    )
+
+    ok = mismatched == 0 and evicted == args.requests and not pipeline.spans
+    print("ok" if ok else "FAILED")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=500, help="Concurrent chats")
+    parser.add_argument("--turns", type=int, default=3, help="Turns per chat")
+    parser.add_argument("--max-delay", type=float, default=0.05)
+    args = parser.parse_args()
+    sys.exit(0 if asyncio.run(run(args)) else 1)
+
+
+if __name__ == "__main__":
+    main()
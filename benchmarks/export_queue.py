@@ -0,0 +1,127 @@
+"""
+Benchmark of the latency observability filters add to `inlet`/`outlet`.
+
+Compares exporting inline, as the Datadog filter did (annotate, finish and a
+synchronous flush per request), with submitting the same work to
+`utils.pipelines.export.ExportQueue`. The exporter is simulated: it
+serializes the request body and, on flush, sleeps for `--flush-ms` to stand
+in for the HTTP request to the backend. A second run with a small queue
+shows drop-oldest backpressure when the backend falls behind.
+
+Usage:
+    python -m benchmarks.export_queue --requests 2000 --flush-ms 5
+"""
+
+import argparse
+import json
+import time
+
+from benchmarks.load import percentile
+from utils.pipelines.export import ExportQueue
+
+
+class FakeExporter:
+    def __init__(self, flush_ms: float):
+        self.flush_ms = flush_ms
+        self.buffered = []
+        self.sent = 0
+
+    def export(self, body: dict):
+        self.buffered.append(json.dumps(body))
+
+    def flush(self):
+        time.sleep(self.flush_ms / 1000)
+        self.sent += len(self.buffered)
+        self.buffered = []
+
+
+def request_body(n: int) -> dict:
+    return {
+        "model": "llama3",
+        "chat_id": f"chat-{n}",
+        "messages": [
+            {"role": "user" if i % 2 == 0 else "assistant", "content": "hello " * 50}
+            for i in range(20)
+        ],
+    }
+
+
+def summarize(name, latencies, exporter, queue=None):
+    latencies = sorted(latencies)
+    result = {
+        "name": name,
+        "requests": len(latencies),
+        "latency_us": {
+            "p50": round(percentile(latencies, 50), 2),
+            "p99": round(percentile(latencies, 99), 2),
+            "max": round(latencies[-1], 2),
+        },
+        "sent": exporter.sent,
+    }
+    if queue is not None:
+        result["queue"] = queue.stats()
+    return result
+
+
+def run_inline(requests, flush_ms):
+    exporter = FakeExporter(flush_ms)
+    latencies = []
+    for n in range(requests):
+        body = request_body(n)
+        started_at = time.perf_counter()
+        exporter.export(body)
+        exporter.flush()
+        latencies.append((time.perf_counter() - started_at) * 1e6)
+    return summarize("inline", latencies, exporter)
+
+
+def run_queued(name, requests, flush_ms, max_size, interval_ms):
+    exporter = FakeExporter(flush_ms)
+    queue = ExportQueue(flush=exporter.flush, max_size=max_size, name="bench")
+    queue.start()
+    latencies = []
+    for n in range(requests):
+        body = request_body(n)
+        started_at = time.perf_counter()
+        queue.submit(exporter.export, body)
+        latencies.append((time.perf_counter() - started_at) * 1e6)
+        if interval_ms:
+            time.sleep(interval_ms / 1000)
+    queue.stop()
+    return summarize(name, latencies, exporter, queue)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--flush-ms", type=float, default=5.0)
+    parser.add_argument(
+        "--interval-ms", type=float, default=0.5, help="Time between requests"
+    )
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    results = [
+        run_inline(args.requests, args.flush_ms),
+        run_queued("queued", args.requests, args.flush_ms, 10000, args.interval_ms),
+        # A burst into a small queue while the backend is slow
+        run_queued("queued_overload", args.requests, args.flush_ms * 20, 100, 0),
+    ]
+
+    for result in results:
+        latency = result["latency_us"]
+        queue = result.get("queue", {})
+        print(
+            f"{result['name']:<16} p50={latency['p50']}us p99={latency['p99']}us "
+            f"max={latency['max']}us sent={result['sent']} "
+            f"flushes={queue.get('flushes', result['requests'])} "
+            f"dropped={queue.get('dropped', 0)}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
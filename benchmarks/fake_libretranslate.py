@@ -0,0 +1,66 @@
+"""
+A local LibreTranslate stand-in for testing and benchmarking the
+translation filters.
+
+It answers `POST /translate` like LibreTranslate, with `q` either a string
+or a list of strings. The "translation" prefixes the text with the target
+language (`[es] Hello`), after a configurable delay per request and per
+text, and the number of requests and texts received is counted.
+
+Usage:
+    python -m benchmarks.fake_libretranslate --port 5000 --latency-ms 50
+"""
+
+import argparse
+import asyncio
+
+from aiohttp import web
+
+
+def fake_translate(text: str, target: str) -> str:
+    return f"[{target}] {text}"
+
+
+class FakeLibreTranslate:
+    def __init__(self, latency_ms: float = 50.0, per_text_ms: float = 1.0):
+        self.latency_ms = latency_ms
+        self.per_text_ms = per_text_ms
+        self.requests = 0
+        self.texts = 0
+
+    async def handle_translate(self, request: web.Request) -> web.Response:
+        data = await request.json()
+        q = data.get("q")
+        if q is None or "target" not in data:
+            return web.json_response({"error": "Invalid request"}, status=400)
+
+        texts = q if isinstance(q, list) else [q]
+        self.requests += 1
+        self.texts += len(texts)
+        await asyncio.sleep((self.latency_ms + self.per_text_ms * len(texts)) / 1000)
+
+        translated = [fake_translate(text, data["target"]) for text in texts]
+        return web.json_response(
+            {"translatedText": translated if isinstance(q, list) else translated[0]}
+        )
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/translate", self.handle_translate)
+        return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LibreTranslate stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--per-text-ms", type=float, default=1.0)
+    args = parser.parse_args()
+
+    server = FakeLibreTranslate(args.latency_ms, args.per_text_ms)
+    web.run_app(server.create_app(), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
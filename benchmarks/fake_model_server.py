@@ -0,0 +1,119 @@
+"""
+A fake OpenAI-compatible model server, standing in for `litellm` or
+`mlx_lm.server` in benchmarks. It accepts (and mostly ignores) their
+command line arguments:
+
+    python benchmarks/fake_model_server.py --port 4001 --model some/model
+
+Its behaviour is set with environment variables:
+
+- FAKE_SERVER_STARTUP_S: seconds to wait before listening, as loading a
+  model does;
+- FAKE_SERVER_NOISE_KB: KB written to both stdout and stderr before
+  listening, as a verbose server logs;
+- FAKE_SERVER_CRASH_AFTER_S: seconds after which it exits with 1;
+- FAKE_SERVER_MEMORY_MB: MB it allocates and touches, as model weights;
+- FAKE_SERVER_RESPONSE_S: seconds each chat completion takes.
+
+It serves `GET /health`, `GET /health/liveliness`, `GET /v1/models`,
+`GET /stats` (how many times `/v1/models` was requested) and
+`POST /v1/chat/completions`, answering with the model's name.
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class Handler(BaseHTTPRequestHandler):
+    model = "fake-model"
+    models_requests = 0
+    lock = threading.Lock()
+
+    def send_json(self, data: dict, status: int = 200):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path in ("/health", "/health/liveliness"):
+            self.send_json({"status": "ok"})
+        elif self.path == "/v1/models":
+            with Handler.lock:
+                Handler.models_requests += 1
+            self.send_json({"data": [{"id": self.model, "object": "model"}]})
+        elif self.path == "/stats":
+            self.send_json({"models_requests": Handler.models_requests})
+        else:
+            self.send_json({"error": "not found"}, 404)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if self.path != "/v1/chat/completions":
+            self.send_json({"error": "not found"}, 404)
+            return
+        time.sleep(float(os.environ.get("FAKE_SERVER_RESPONSE_S", 0)))
+        self.send_json(
+            {
+                "object": "chat.completion",
+                "model": self.model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {
+                            "role": "assistant",
+                            "content": f"Hello from {self.model}",
+                        },
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": {"prompt_tokens": len(request.get("messages", []))},
+            }
+        )
+
+    def log_message(self, format, *args):
+        print(f"{self.address_string()} {format % args}", file=sys.stderr, flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, required=True)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--model", default="fake-model")
+    args, _ = parser.parse_known_args()
+
+    # Touched page by page, so it counts in the resident set
+    memory = bytearray(int(float(os.environ.get("FAKE_SERVER_MEMORY_MB", 0)) * 2**20))
+    for i in range(0, len(memory), 4096):
+        memory[i] = 1
+
+    noise = "x" * 99 + "\n"
+    for _ in range(int(os.environ.get("FAKE_SERVER_NOISE_KB", 0)) * 1024 // 100):
+        sys.stdout.write(noise)
+        sys.stderr.write(noise)
+    sys.stdout.flush()
+    sys.stderr.flush()
+
+    time.sleep(float(os.environ.get("FAKE_SERVER_STARTUP_S", 0)))
+
+    crash_after = float(os.environ.get("FAKE_SERVER_CRASH_AFTER_S", 0))
+    if crash_after:
+        threading.Timer(crash_after, os._exit, args=(1,)).start()
+
+    Handler.model = args.model
+    server = ThreadingHTTPServer((args.host, args.port), Handler)
+    print(f"Listening on {args.host}:{args.port} with {args.model}", flush=True)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
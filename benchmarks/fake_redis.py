@@ -0,0 +1,301 @@
+"""
+An in-process stand-in for a Redis server, used to exercise the Redis
+protocol backends (`utils.pipelines.state.RedisStateStore`,
+`utils.pipelines.ratelimit.RedisRateLimiter`) without a real server.
+
+It speaks RESP2 (and the subset of RESP3 needed by redis-py) over TCP and implements the handful of commands those
+backends use. Lua is not available, so EVAL/EVALSHA run Python ports of the
+known scripts, registered by the SHA1 of their source.
+
+Usage:
+    server = FakeRedis()
+    url = server.start()  # redis://127.0.0.1:<port>/0
+    ...
+    server.stop()
+"""
+
+import asyncio
+import hashlib
+import threading
+import time
+
+from utils.pipelines.ratelimit import RATE_LIMIT_SCRIPT
+from utils.pipelines.state import REDIS_INCR_SCRIPT
+
+
+class RedisError(Exception):
+    pass
+
+
+def sha1(script: str) -> str:
+    return hashlib.sha1(script.encode("utf-8")).hexdigest()
+
+
+def rate_limit_script(call, keys, args):
+    mode, incr, buckets = args[0], int(args[1]), int(args[2])
+    totals, allowed = [], 1
+    for i, key in enumerate(keys):
+        base = 3 + i * 3
+        bucket = int(args[base])
+        fields = call("HGETALL", key)
+        total = 0
+        for j in range(0, len(fields), 2):
+            if int(fields[j]) <= bucket - buckets:
+                call("HDEL", key, fields[j])
+            else:
+                total += int(fields[j + 1])
+        totals.append(total)
+        if mode == "hit" and total >= int(args[base + 2]):
+            allowed = 0
+
+    if mode == "hit":
+        incr = allowed
+
+    if incr > 0:
+        for i, key in enumerate(keys):
+            base = 3 + i * 3
+            call("HINCRBY", key, args[base], incr)
+            call("PEXPIRE", key, args[base + 1])
+            totals[i] += incr
+
+    return [allowed, *totals]
+
+
+def incr_script(call, keys, args):
+    value = call("INCRBY", keys[0], args[0])
+    if int(args[1]) > 0 and call("PTTL", keys[0]) < 0:
+        call("PEXPIRE", keys[0], args[1])
+    return value
+
+
+SCRIPTS = {
+    sha1(RATE_LIMIT_SCRIPT): rate_limit_script,
+    sha1(REDIS_INCR_SCRIPT): incr_script,
+}
+
+
+class FakeRedis:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.host = host
+        self.port = port
+        self.data = {}
+        self.expires = {}
+        self.commands = 0
+        self.loop = None
+        self.server = None
+        self.thread = None
+        self.connections = set()
+
+    # Storage
+
+    def _alive(self, key: str) -> bool:
+        expires_at = self.expires.get(key)
+        if expires_at is not None and expires_at <= time.time():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return key in self.data
+
+    def call(self, command, *args):
+        command = command.decode() if isinstance(command, bytes) else command
+        args = [a.decode() if isinstance(a, bytes) else str(a) for a in args]
+        handler = getattr(self, f"cmd_{command.lower()}", None)
+        if handler is None:
+            raise RedisError(f"ERR unknown command '{command}'")
+        return handler(*args)
+
+    def cmd_ping(self, *args):
+        return "PONG"
+
+    def cmd_client(self, *args):
+        return "OK"
+
+    def cmd_select(self, db):
+        return "OK"
+
+    def cmd_flushall(self, *args):
+        self.data.clear()
+        self.expires.clear()
+        return "OK"
+
+    def cmd_get(self, key):
+        return self.data[key] if self._alive(key) else None
+
+    def cmd_set(self, key, value, *options):
+        self.data[key] = value
+        self.expires.pop(key, None)
+        options = [o.upper() for o in options]
+        for unit, scale in (("PX", 1000), ("EX", 1)):
+            if unit in options:
+                ttl = float(options[options.index(unit) + 1])
+                self.expires[key] = time.time() + ttl / scale
+        return "OK"
+
+    def cmd_del(self, *keys):
+        deleted = 0
+        for key in keys:
+            if self._alive(key):
+                del self.data[key]
+                self.expires.pop(key, None)
+                deleted += 1
+        return deleted
+
+    def cmd_incrby(self, key, amount):
+        value = int(self.data[key]) if self._alive(key) else 0
+        value += int(amount)
+        self.data[key] = str(value)
+        return value
+
+    def cmd_pexpire(self, key, ms, *options):
+        if not self._alive(key):
+            return 0
+        self.expires[key] = time.time() + int(ms) / 1000
+        return 1
+
+    def cmd_pttl(self, key):
+        if not self._alive(key):
+            return -2
+        if key not in self.expires:
+            return -1
+        return int((self.expires[key] - time.time()) * 1000)
+
+    def cmd_hgetall(self, key):
+        if not self._alive(key):
+            return []
+        return [item for pair in self.data[key].items() for item in pair]
+
+    def cmd_hdel(self, key, *fields):
+        if not self._alive(key):
+            return 0
+        deleted = sum(1 for f in fields if self.data[key].pop(f, None) is not None)
+        if not self.data[key]:
+            self.cmd_del(key)
+        return deleted
+
+    def cmd_hincrby(self, key, field, amount):
+        if not self._alive(key):
+            self.data[key] = {}
+        value = int(self.data[key].get(field, 0)) + int(amount)
+        self.data[key][field] = str(value)
+        return value
+
+    def cmd_script(self, subcommand, *args):
+        subcommand = subcommand.upper()
+        if subcommand == "LOAD":
+            digest = sha1(args[0])
+            if digest not in SCRIPTS:
+                raise RedisError("ERR script not supported by the stand-in")
+            return digest
+        if subcommand == "EXISTS":
+            return [1 if digest in SCRIPTS else 0 for digest in args]
+        return "OK"
+
+    def cmd_evalsha(self, digest, numkeys, *args):
+        script = SCRIPTS.get(digest)
+        if script is None:
+            raise RedisError("NOSCRIPT No matching script.")
+        numkeys = int(numkeys)
+        return script(self.call, list(args[:numkeys]), list(args[numkeys:]))
+
+    def cmd_eval(self, source, numkeys, *args):
+        return self.cmd_evalsha(sha1(source), numkeys, *args)
+
+    # Protocol
+
+    def encode(self, value, protocol: int = 2) -> bytes:
+        if isinstance(value, dict):
+            items = [item for pair in value.items() for item in pair]
+            if protocol == 3:
+                return f"%{len(value)}\r\n".encode() + b"".join(
+                    self.encode(v, protocol) for v in items
+                )
+            value = items
+        if value is None:
+            return b"_\r\n" if protocol == 3 else b"$-1\r\n"
+        if isinstance(value, bool):
+            value = int(value)
+        if isinstance(value, int):
+            return f":{value}\r\n".encode()
+        if isinstance(value, (list, tuple)):
+            return f"*{len(value)}\r\n".encode() + b"".join(
+                self.encode(v, protocol) for v in value
+            )
+        if value in ("OK", "PONG"):
+            return f"+{value}\r\n".encode()
+        data = str(value).encode()
+        return b"$%d\r\n%s\r\n" % (len(data), data)
+
+    async def read_command(self, reader: asyncio.StreamReader):
+        line = await reader.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            return line.decode().split()
+        args = []
+        for _ in range(int(line[1:])):
+            length = int((await reader.readline())[1:])
+            args.append((await reader.readexactly(length + 2))[:-2])
+        return args
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        protocol = 2
+        self.connections.add(asyncio.current_task())
+        try:
+            while True:
+                command = await self.read_command(reader)
+                if command is None:
+                    break
+                self.commands += 1
+                try:
+                    if command[0].upper() in (b"HELLO", "HELLO"):
+                        # RESP3 replies only differ from RESP2 for maps and nulls here
+                        protocol = int(command[1]) if len(command) > 1 else protocol
+                        response = self.encode(
+                            {"server": "redis", "version": "7.0.0", "proto": protocol},
+                            protocol,
+                        )
+                    else:
+                        response = self.encode(self.call(*command), protocol)
+                except RedisError as e:
+                    response = f"-{e}\r\n".encode()
+                except Exception as e:
+                    response = f"-ERR {e}\r\n".encode()
+                writer.write(response)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            self.connections.discard(asyncio.current_task())
+            writer.close()
+
+    def start(self) -> str:
+        """Starts the server in a background thread and returns its url."""
+        started = threading.Event()
+
+        def run():
+            self.loop = asyncio.new_event_loop()
+            self.server = self.loop.run_until_complete(
+                asyncio.start_server(self.handle, self.host, self.port)
+            )
+            self.port = self.server.sockets[0].getsockname()[1]
+            started.set()
+            self.loop.run_forever()
+
+        self.thread = threading.Thread(target=run, name="fake-redis", daemon=True)
+        self.thread.start()
+        started.wait()
+        return f"redis://{self.host}:{self.port}/0"
+
+    async def _shutdown(self):
+        self.server.close()
+        for task in list(self.connections):
+            task.cancel()
+        await asyncio.gather(*self.connections, return_exceptions=True)
+
+    def stop(self):
+        if self.loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop).result(5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(5)
+        self.loop.close()
+        self.loop = None
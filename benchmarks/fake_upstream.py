@@ -0,0 +1,172 @@
+"""
+A local fake OpenAI-compatible upstream used by the benchmark harness.
+
+It answers `/v1/models` and `/v1/chat/completions` (stream and non-stream)
+with synthetic tokens. The time to first token, the token rate and the number
+of tokens per completion are configurable so pipelines can be benchmarked
+without hitting a real provider. With `--sentence-length N`, every Nth token
+ends a sentence.
+
+Usage:
+    python -m benchmarks.fake_upstream --port 9199 --ttft-ms 50 --tokens 64 --tokens-per-second 200
+"""
+
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+from aiohttp import web
+
+
+def completion_chunk(model: str, completion_id: str, content=None, finish_reason=None):
+    return {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [
+            {
+                "index": 0,
+                "delta": {"content": content} if content is not None else {},
+                "logprobs": None,
+                "finish_reason": finish_reason,
+            }
+        ],
+    }
+
+
+class FakeUpstream:
+    def __init__(
+        self,
+        ttft_ms: float = 50.0,
+        tokens: int = 64,
+        tokens_per_second: float = 200.0,
+        token: str = "lorem ",
+        models: list = None,
+        sentence_length: int = 0,
+    ):
+        self.ttft_ms = ttft_ms
+        self.tokens = tokens
+        self.tokens_per_second = tokens_per_second
+        self.token = token
+        self.models = models or ["fake-model"]
+        self.sentence_length = sentence_length
+
+    def token_text(self, i: int) -> str:
+        if self.sentence_length and (i + 1) % self.sentence_length == 0:
+            return f"{self.token.rstrip()}. "
+        return self.token
+
+    def token_delay(self) -> float:
+        if self.tokens_per_second <= 0:
+            return 0.0
+        return 1.0 / self.tokens_per_second
+
+    async def handle_models(self, request: web.Request) -> web.Response:
+        return web.json_response(
+            {
+                "object": "list",
+                "data": [
+                    {
+                        "id": model,
+                        "object": "model",
+                        "created": int(time.time()),
+                        "owned_by": "fake-upstream",
+                    }
+                    for model in self.models
+                ],
+            }
+        )
+
+    async def handle_chat_completions(self, request: web.Request):
+        body = await request.json()
+        model = body.get("model", self.models[0])
+        completion_id = f"chatcmpl-{uuid.uuid4()}"
+
+        await asyncio.sleep(self.ttft_ms / 1000)
+
+        if not body.get("stream", False):
+            await asyncio.sleep(self.token_delay() * max(self.tokens - 1, 0))
+            return web.json_response(
+                {
+                    "id": completion_id,
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {
+                                "role": "assistant",
+                                "content": "".join(
+                                    self.token_text(i) for i in range(self.tokens)
+                                ),
+                            },
+                            "logprobs": None,
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": {
+                        "prompt_tokens": sum(
+                            len(str(m.get("content", "")).split())
+                            for m in body.get("messages", [])
+                        ),
+                        "completion_tokens": self.tokens,
+                    },
+                }
+            )
+
+        response = web.StreamResponse(
+            headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"}
+        )
+        await response.prepare(request)
+
+        delay = self.token_delay()
+        for i in range(self.tokens):
+            if i > 0 and delay:
+                await asyncio.sleep(delay)
+            chunk = completion_chunk(model, completion_id, self.token_text(i))
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+
+        chunk = completion_chunk(model, completion_id, finish_reason="stop")
+        await response.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/v1/models", self.handle_models)
+        app.router.add_get("/models", self.handle_models)
+        app.router.add_post("/v1/chat/completions", self.handle_chat_completions)
+        app.router.add_post("/chat/completions", self.handle_chat_completions)
+        return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake OpenAI-compatible upstream")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9199)
+    parser.add_argument("--ttft-ms", type=float, default=50.0)
+    parser.add_argument("--tokens", type=int, default=64)
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--models", default="fake-model")
+    parser.add_argument("--sentence-length", type=int, default=0)
+    args = parser.parse_args()
+
+    upstream = FakeUpstream(
+        ttft_ms=args.ttft_ms,
+        tokens=args.tokens,
+        tokens_per_second=args.tokens_per_second,
+        models=args.models.split(","),
+        sentence_length=args.sentence_length,
+    )
+    web.run_app(
+        upstream.create_app(), host=args.host, port=args.port, print=None
+    )
+
+
+if __name__ == "__main__":
+    main()
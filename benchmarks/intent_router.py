@@ -0,0 +1,203 @@
+"""
+Benchmark of the `function_calling_blueprint` pre-router on
+`function_calling_filter_pipeline`'s tools (time, weather, calculator).
+
+Sends `--requests` messages, drawn from a labeled set where about a third
+need a tool, through the pipeline's `inlet`, `--concurrency` at a time. A
+local fake task model answers each request after `--task-model-ms`, without
+tool calls (tool execution is not measured here). It compares three runs:
+
+- before: `PRE_ROUTER` off, every message goes to the task model;
+- after: `PRE_ROUTER` on, with the rules built from the tools' docstrings
+  and `@tool_patterns`;
+- after (classifier): the same, plus a toy `intent_classifier` standing in
+  for a local model.
+
+It reports task model requests, the skip ratio, tool messages that were
+wrongly skipped, mean inlet latency and the router's estimate of the
+latency saved.
+
+Usage:
+    python -m benchmarks.intent_router --requests 300 --task-model-ms 300
+"""
+
+import argparse
+import asyncio
+import contextlib
+import contextvars
+import io
+import json
+import os
+import random
+import sys
+import time
+
+from aiohttp import web
+
+from benchmarks.streaming_translation import serve_in_thread
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from examples.filters.function_calling_filter_pipeline import (  # noqa: E402
+    Pipeline as FunctionCallingPipeline,
+)
+
+CHIT_CHAT = [
+    "Hi there!",
+    "Write a short poem about spring.",
+    "Explain recursion like I'm five.",
+    "Thanks, that was helpful.",
+    "Can you summarize the plot of Hamlet?",
+    "Translate 'good morning' into Spanish.",
+    "What's a good name for a golden retriever?",
+    "Tell me a joke about programmers.",
+    "How do I reverse a list in Python?",
+    "What are the main causes of the French Revolution?",
+    "Give me three ideas for a birthday party.",
+    "Rewrite this sentence to sound more formal: we gotta go.",
+    "Why is the sky blue?",
+    "Who wrote Pride and Prejudice?",
+]
+
+# (message, tool the task model would pick)
+TOOL_REQUESTS = [
+    ("What time is it?", "get_current_time"),
+    ("What's the weather in Paris?", "get_current_weather"),
+    ("How much is 12 * 7?", "calculator"),
+    ("Weather forecast for Berlin in fahrenheit please", "get_current_weather"),
+    ("Calculate 2^10", "calculator"),
+    ("Is it raining in Oslo?", "get_current_weather"),
+    ("How hot is it in Rome right now?", "get_current_weather"),
+]
+
+
+def toy_classifier(text: str) -> float:
+    """Stands in for a small local intent model."""
+    words = set(text.lower().replace("?", " ").split())
+    return 1.0 if words & {"raining", "rain", "hot", "cold", "sunny"} else 0.0
+
+
+class FakeTaskModel:
+    def __init__(self, latency_ms: float):
+        self.latency = latency_ms / 1000
+        self.requests = 0
+
+    async def handle_chat_completions(self, request: web.Request) -> web.Response:
+        await request.json()
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+        message = {"role": "assistant", "content": None, "tool_calls": []}
+        return web.json_response(
+            {"choices": [{"index": 0, "message": message, "finish_reason": "stop"}]}
+        )
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self.handle_chat_completions)
+        return app
+
+
+# Set by each request, so the pipeline can record whether it reached the task model
+current_request = contextvars.ContextVar("current_request")
+
+
+class BenchmarkPipeline(FunctionCallingPipeline):
+    async def get_tool_calls(self, content: str) -> list:
+        current_request.get()["routed"] = True
+        return await super().get_tool_calls(content)
+
+
+def build_dataset(requests: int) -> list:
+    rng = random.Random(0)
+    dataset = []
+    for _ in range(requests):
+        if rng.random() < 0.3:
+            dataset.append((rng.choice(TOOL_REQUESTS)[0], True))
+        else:
+            dataset.append((rng.choice(CHIT_CHAT), False))
+    return dataset
+
+
+async def run(name: str, args, pre_router: bool, classifier=None) -> dict:
+    model = FakeTaskModel(args.task_model_ms)
+    pipeline = BenchmarkPipeline()
+    pipeline.valves.OPENAI_API_BASE_URL = f"{serve_in_thread(model.create_app())}/v1"
+    pipeline.valves.TOOL_CALLING = "native"
+    pipeline.valves.PRE_ROUTER = pre_router
+    pipeline.intent_classifier = classifier
+
+    dataset = build_dataset(args.requests)
+    pending = iter(dataset)
+    latencies = []
+    missed = 0
+
+    async def worker():
+        nonlocal missed
+        for message, needs_tool in pending:
+            body = {"model": "llama3", "messages": [{"role": "user", "content": message}]}
+            request = {"routed": False}
+            current_request.set(request)
+            started_at = time.perf_counter()
+            await pipeline.inlet(body, {"id": "bench-user"})
+            latencies.append((time.perf_counter() - started_at) * 1000)
+            if needs_tool and not request["routed"]:
+                missed += 1
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    duration = time.perf_counter() - started_at
+
+    stats = pipeline.tool_router.stats() if pipeline.tool_router else {}
+    await pipeline.on_shutdown()
+    return {
+        "name": name,
+        "requests": len(dataset),
+        "tool_requests": sum(needs_tool for _, needs_tool in dataset),
+        "duration_s": round(duration, 2),
+        "mean_ms": round(sum(latencies) / len(latencies), 1),
+        "task_model_requests": model.requests,
+        "missed_tool_requests": missed,
+        "skip_ratio": stats.get("skip_ratio", 0.0),
+        "saved_ms": stats.get("saved_ms", 0.0),
+    }
+
+
+async def benchmark(args) -> list:
+    return [
+        await run("before", args, pre_router=False),
+        await run("after", args, pre_router=True),
+        await run("after (classifier)", args, pre_router=True, classifier=toy_classifier),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--task-model-ms", type=float, default=300.0)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    # Silence the pipeline's request logging
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = asyncio.run(benchmark(args))
+
+    for result in results:
+        print(
+            f"{result['name']:<19} requests={result['requests']} "
+            f"tool_requests={result['tool_requests']} "
+            f"task_model_requests={result['task_model_requests']} "
+            f"skip_ratio={result['skip_ratio']} "
+            f"missed_tool_requests={result['missed_tool_requests']} "
+            f"mean={result['mean_ms']}ms duration={result['duration_s']}s "
+            f"saved={result['saved_ms']}ms"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Load generator for the Pipelines server.
+
+Each scenario drives a single endpoint with a fixed number of concurrent
+clients and collects per-request latency, time to first token (for streaming
+completions) and error counts.
+"""
+
+import asyncio
+import json
+import time
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional
+
+import aiohttp
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100
+    lower = int(k)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (k - lower)
+
+
+def summarize(values: List[float]) -> dict:
+    return {
+        "min": min(values) if values else None,
+        "mean": sum(values) / len(values) if values else None,
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values) if values else None,
+    }
+
+
+@dataclass
+class ScenarioResult:
+    name: str
+    concurrency: int
+    requests: int = 0
+    errors: int = 0
+    duration_s: float = 0.0
+    latencies_ms: List[float] = field(default_factory=list)
+    ttfts_ms: List[float] = field(default_factory=list)
+    cpu_s: Optional[float] = None
+
+    def to_dict(self) -> dict:
+        completed = self.requests - self.errors
+        return {
+            "name": self.name,
+            "concurrency": self.concurrency,
+            "requests": self.requests,
+            "errors": self.errors,
+            "duration_s": self.duration_s,
+            "throughput_rps": (
+                completed / self.duration_s if self.duration_s > 0 else None
+            ),
+            "latency_ms": summarize(self.latencies_ms),
+            "ttft_ms": summarize(self.ttfts_ms) if self.ttfts_ms else None,
+            "cpu_ms_per_request": (
+                self.cpu_s * 1000 / completed
+                if self.cpu_s is not None and completed
+                else None
+            ),
+        }
+
+
+def chat_body(model: str, stream: bool, history: int = 1) -> dict:
+    messages = []
+    for i in range(history - 1):
+        messages.append({"role": "user", "content": f"Question {i}"})
+        messages.append({"role": "assistant", "content": f"Answer {i}"})
+    messages.append({"role": "user", "content": "Tell me something interesting."})
+    return {"model": model, "messages": messages, "stream": stream}
+
+
+async def request_chat_completion(
+    session: aiohttp.ClientSession, base_url: str, body: dict, result: ScenarioResult
+):
+    start = time.perf_counter()
+    async with session.post(f"{base_url}/v1/chat/completions", json=body) as r:
+        r.raise_for_status()
+        if body.get("stream", False):
+            first = None
+            async for line in r.content:
+                if first is None and line.startswith(b"data:"):
+                    first = time.perf_counter()
+            if first is not None:
+                result.ttfts_ms.append((first - start) * 1000)
+        else:
+            await r.read()
+    result.latencies_ms.append((time.perf_counter() - start) * 1000)
+
+
+async def request_models(
+    session: aiohttp.ClientSession, base_url: str, body: dict, result: ScenarioResult
+):
+    start = time.perf_counter()
+    async with session.get(f"{base_url}/v1/models") as r:
+        r.raise_for_status()
+        await r.read()
+    result.latencies_ms.append((time.perf_counter() - start) * 1000)
+
+
+def request_filter(direction: str, filter_id: str):
+    async def request(
+        session: aiohttp.ClientSession,
+        base_url: str,
+        body: dict,
+        result: ScenarioResult,
+    ):
+        start = time.perf_counter()
+        payload = {"body": body, "user": {"id": "bench-user", "role": "user"}}
+        async with session.post(
+            f"{base_url}/v1/{filter_id}/filter/{direction}", json=payload
+        ) as r:
+            r.raise_for_status()
+            await r.read()
+        result.latencies_ms.append((time.perf_counter() - start) * 1000)
+
+    return request
+
+
+async def run_scenario(
+    name: str,
+    base_url: str,
+    api_key: str,
+    request: Callable,
+    body: dict,
+    concurrency: int,
+    total_requests: int,
+    cpu_sampler: Optional[Callable[[], Optional[float]]] = None,
+) -> ScenarioResult:
+    result = ScenarioResult(name=name, concurrency=concurrency)
+    remaining = total_requests
+    lock = asyncio.Lock()
+
+    async def take() -> bool:
+        nonlocal remaining
+        async with lock:
+            if remaining <= 0:
+                return False
+            remaining -= 1
+            return True
+
+    async def worker(session: aiohttp.ClientSession):
+        while await take():
+            result.requests += 1
+            try:
+                await request(session, base_url, json.loads(json.dumps(body)), result)
+            except Exception:
+                result.errors += 1
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    headers = {"Authorization": f"Bearer {api_key}"}
+    timeout = aiohttp.ClientTimeout(total=300)
+    async with aiohttp.ClientSession(
+        connector=connector, headers=headers, timeout=timeout
+    ) as session:
+        cpu_before = cpu_sampler() if cpu_sampler else None
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+        result.duration_s = time.perf_counter() - start
+        cpu_after = cpu_sampler() if cpu_sampler else None
+
+    if cpu_before is not None and cpu_after is not None:
+        result.cpu_s = cpu_after - cpu_before
+    return result
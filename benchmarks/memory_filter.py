@@ -0,0 +1,224 @@
+"""
+Test and benchmark of `mem0_memory_filter_pipeline` with a simulated mem0
+store.
+
+`--users` users each send `--turns` messages, one after another, all users
+at once. It compares two approaches:
+
+- before: the filter's previous inlet, run on the event loop: one message
+  buffer shared by all users, a blocking `join` on the previous memory
+  write and a blocking `search` on every turn;
+- after: the filter's `inlet`, with per-user buffers, a background write
+  worker and a cached, time-budgeted async search.
+
+The simulated store spends `--add-ms` per `add` (mem0 runs an LLM to extract
+memories) and `--search-ms` per `search`, with every `--slow-search-every`th
+search taking `--slow-search-ms`. The benchmark reports wall time, inlet
+latency, the number of writes and messages stored, and writes mixing
+messages of several users.
+
+Usage:
+    python -m benchmarks.memory_filter --users 8 --turns 20
+"""
+
+import argparse
+import asyncio
+import contextlib
+import importlib.util
+import io
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+
+from benchmarks.load import percentile
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PIPELINE_PATH = os.path.join(
+    ROOT_DIR, "examples", "filters", "mem0_memory_filter_pipeline.py"
+)
+
+
+class SimulatedMemory:
+    def __init__(self, add_ms, search_ms, slow_search_every, slow_search_ms):
+        self.add_ms = add_ms
+        self.search_ms = search_ms
+        self.slow_search_every = slow_search_every
+        self.slow_search_ms = slow_search_ms
+        self.searches = itertools.count(1)
+        self.lock = threading.Lock()
+        self.added = []
+
+    def add(self, data: str, user_id: str):
+        time.sleep(self.add_ms / 1000)
+        with self.lock:
+            self.added.append((user_id, data))
+
+    def search(self, query: str, user_id: str):
+        n = next(self.searches)
+        slow = self.slow_search_every and n % self.slow_search_every == 0
+        time.sleep((self.slow_search_ms if slow else self.search_ms) / 1000)
+        with self.lock:
+            stored = any(added_user == user_id for added_user, _ in self.added)
+        return [{"memory": f"facts about {user_id}"}] if stored else []
+
+
+def load_pipeline(memory: SimulatedMemory):
+    sys.path.insert(0, ROOT_DIR)
+    spec = importlib.util.spec_from_file_location(
+        "mem0_memory_filter_pipeline", PIPELINE_PATH
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    # Stands in for the qdrant and ollama backed mem0 store
+    module.Pipeline.init_mem_zero = lambda self: memory
+    return module.Pipeline()
+
+
+def user_message(user: int, turn: int) -> str:
+    # Users come back to the same few questions
+    return f"user-{user} question {turn % 4}"
+
+
+class PreviousFilter:
+    """The filter's previous inlet, kept for comparison."""
+
+    def __init__(self, m, store_cycles: int):
+        self.m = m
+        self.store_cycles = store_cycles
+        self.user_messages = []
+        self.thread = None
+
+    async def inlet(self, body: dict, user: dict) -> dict:
+        last_message = body["messages"][-1]["content"]
+        self.user_messages.append(last_message)
+
+        if len(self.user_messages) == self.store_cycles:
+            message_text = ""
+            for message in self.user_messages:
+                message_text += message + " "
+            if self.thread and self.thread.is_alive():
+                self.thread.join()
+            self.thread = threading.Thread(
+                target=self.m.add, kwargs={"data": message_text, "user_id": "user"}
+            )
+            self.thread.start()
+            self.user_messages.clear()
+
+        memories = self.m.search(last_message, user_id="user")
+        if memories:
+            body["messages"].insert(
+                0, {"role": "system", "content": memories[0]["memory"]}
+            )
+        return body
+
+
+async def run(name, filter, memory, users, turns):
+    latencies = []
+
+    async def chat(user: int):
+        for turn in range(turns):
+            body = {"messages": [{"role": "user", "content": user_message(user, turn)}]}
+            started_at = time.perf_counter()
+            await filter.inlet(body, {"id": f"user-{user}", "role": "user"})
+            latencies.append((time.perf_counter() - started_at) * 1000)
+            # Lets the other users' requests in, as the server does between requests
+            await asyncio.sleep(0)
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*(chat(user) for user in range(users)))
+    duration = time.perf_counter() - started_at
+
+    return {
+        "name": name,
+        "duration_s": round(duration, 2),
+        "p50_ms": round(percentile(latencies, 50), 1),
+        "p99_ms": round(percentile(latencies, 99), 1),
+    }
+
+
+def count_writes(memory: SimulatedMemory) -> dict:
+    mixed = sum(
+        1
+        for _, data in memory.added
+        if len({word for word in data.split() if word.startswith("user-")}) > 1
+    )
+    return {
+        "writes": len(memory.added),
+        "mixed_writes": mixed,
+        "messages_stored": sum(data.count("question") for _, data in memory.added),
+    }
+
+
+async def benchmark(args):
+    results = []
+
+    memory = SimulatedMemory(
+        args.add_ms, args.search_ms, args.slow_search_every, args.slow_search_ms
+    )
+    previous = PreviousFilter(memory, args.store_cycles)
+    result = await run("before", previous, memory, args.users, args.turns)
+    if previous.thread:
+        previous.thread.join()
+    results.append({**result, **count_writes(memory)})
+
+    memory = SimulatedMemory(
+        args.add_ms, args.search_ms, args.slow_search_every, args.slow_search_ms
+    )
+    pipeline = load_pipeline(memory)
+    pipeline.valves.store_cycles = args.store_cycles
+    pipeline.valves.per_user_memories = True
+    await pipeline.on_startup()
+    result = await run("after", pipeline, memory, args.users, args.turns)
+    await pipeline.on_shutdown()
+    results.append(
+        {
+            **result,
+            **count_writes(memory),
+            "search_timeouts": pipeline.search_timeouts,
+            "search_cache": pipeline.search_cache.stats()["hits"],
+        }
+    )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--store-cycles", type=int, default=5)
+    parser.add_argument("--add-ms", type=float, default=1000.0)
+    parser.add_argument("--search-ms", type=float, default=50.0)
+    parser.add_argument("--slow-search-every", type=int, default=10)
+    parser.add_argument("--slow-search-ms", type=float, default=3000.0)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    # Silence the filter's request logging
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = asyncio.run(benchmark(args))
+
+    for result in results:
+        print(
+            f"{result['name']:<7} duration={result['duration_s']}s "
+            f"p50={result['p50_ms']}ms p99={result['p99_ms']}ms "
+            f"writes={result['writes']} mixed_writes={result['mixed_writes']} "
+            f"messages_stored={result['messages_stored']}"
+            + (
+                f" search_timeouts={result['search_timeouts']} "
+                f"search_cache_hits={result['search_cache']}"
+                if "search_timeouts" in result
+                else ""
+            )
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
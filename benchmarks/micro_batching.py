@@ -0,0 +1,149 @@
+"""
+Benchmark of `utils.pipelines.batching.MicroBatcher` as used by
+`detoxify_filter_pipeline`.
+
+For 1, 16 and 128 concurrent requests, compares scoring each message with
+its own `predict` call on the event loop (the filter's previous behaviour)
+with submitting it to a `MicroBatcher`, and reports throughput, latency and
+the mean batch size.
+
+`--backend detoxify` uses the real Detoxify model (requires `detoxify` and
+its checkpoint download). The default `simulated` backend stands in for a
+model on CPU: a fixed cost per call (`--call-ms`, for framework dispatch
+and tokenizer setup, spent outside the GIL) plus a matrix product over
+hashed token features whose cost grows with the batch.
+
+Usage:
+    python -m benchmarks.micro_batching --requests 512 --concurrency 1 16 128
+"""
+
+import argparse
+import asyncio
+import json
+import time
+import zlib
+
+from benchmarks.load import percentile
+from utils.pipelines.batching import MicroBatcher
+
+
+class SimulatedModel:
+    def __init__(self, call_ms: float, features: int = 2048, hidden: int = 512):
+        import numpy as np
+
+        self.np = np
+        self.call_ms = call_ms
+        self.features = features
+        rng = np.random.default_rng(0)
+        self.w1 = rng.standard_normal((features, hidden), dtype=np.float32)
+        self.w2 = rng.standard_normal((hidden, 6), dtype=np.float32)
+
+    def predict(self, texts):
+        np = self.np
+        time.sleep(self.call_ms / 1000)
+        x = np.zeros((len(texts), self.features), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for token in text.split():
+                x[i, zlib.crc32(token.encode()) % self.features] += 1
+        logits = np.maximum(x @ self.w1, 0) @ self.w2
+        scores = 1 / (1 + np.exp(-logits / 100))
+        return [{"toxicity": float(row[0])} for row in scores]
+
+
+class DetoxifyModel:
+    def __init__(self):
+        from detoxify import Detoxify
+
+        self.model = Detoxify("original")
+
+    def predict(self, texts):
+        scores = self.model.predict(texts)
+        return [
+            {label: values[i] for label, values in scores.items()}
+            for i in range(len(texts))
+        ]
+
+
+def message(n: int) -> str:
+    return f"message {n}: " + " ".join(f"word{(n * 7 + i) % 500}" for i in range(60))
+
+
+async def run(name, score, requests, concurrency):
+    latencies = []
+    next_request = iter(range(requests))
+
+    async def worker():
+        for n in next_request:
+            started_at = time.perf_counter()
+            await score(message(n))
+            latencies.append((time.perf_counter() - started_at) * 1000)
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    duration = time.perf_counter() - started_at
+
+    latencies.sort()
+    return {
+        "name": name,
+        "concurrency": concurrency,
+        "requests": requests,
+        "throughput_rps": round(requests / duration, 1),
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50), 2),
+            "p95": round(percentile(latencies, 95), 2),
+        },
+    }
+
+
+async def benchmark(args, model):
+    results = []
+    for concurrency in args.concurrency:
+
+        async def unbatched(text):
+            # The previous filter called predict on the event loop
+            return model.predict([text])[0]
+
+        results.append(await run("unbatched", unbatched, args.requests, concurrency))
+
+        batcher = MicroBatcher(
+            model.predict,
+            max_batch_size=args.max_batch_size,
+            max_wait_ms=args.max_wait_ms,
+        )
+        result = await run("batched", batcher.submit, args.requests, concurrency)
+        result["mean_batch_size"] = round(batcher.mean_batch_size, 1)
+        results.append(result)
+        await batcher.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--backend", choices=["simulated", "detoxify"], default="simulated")
+    parser.add_argument("--requests", type=int, default=512)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 128])
+    parser.add_argument("--max-batch-size", type=int, default=32)
+    parser.add_argument("--max-wait-ms", type=float, default=2.0)
+    parser.add_argument("--call-ms", type=float, default=5.0)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    model = DetoxifyModel() if args.backend == "detoxify" else SimulatedModel(args.call_ms)
+    model.predict([message(0)])  # warm up
+
+    results = asyncio.run(benchmark(args, model))
+    for result in results:
+        print(
+            f"{result['name']:<10} concurrency={result['concurrency']:<4} "
+            f"rps={result['throughput_rps']:<8} p50={result['latency_ms']['p50']}ms "
+            f"p95={result['latency_ms']['p95']}ms "
+            f"batch={result.get('mean_batch_size', 1)}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"backend": args.backend, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
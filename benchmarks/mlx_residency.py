@@ -0,0 +1,217 @@
+"""
+Test and benchmark of model residency in `mlx_manifold_pipeline`, with
+`benchmarks/fake_model_server.py` standing in for `mlx_lm.server`. Each
+fake server takes `--load-s` to load its model, holds `--model-mb` MB and
+takes `--response-ms` per answer. It compares two approaches:
+
+- before: one loaded model (`MLX_MAX_MODELS=1`), as the pipeline's single
+  server, restarted whenever a request is for another model;
+- after: up to `--max-models` loaded models within a memory budget of
+  `--budget-models` times `--model-mb`, least recently used ones stopped.
+
+It runs two workloads: `--requests` sequential requests alternating between
+two models, and `--requests` requests from `--concurrency` threads for
+three models, the first one asked most. It reports wall time, model loads
+and evictions, and the peak number and memory of running servers, sampled
+every 20 ms. It then checks that concurrent requests for a model that is
+loading wait for a single load, and that no request fails.
+
+Usage:
+    python -m benchmarks.mlx_residency --requests 20 --load-s 1 --model-mb 200
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+import psutil
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from benchmarks.supervisor import install_fake_servers, kill_children  # noqa: E402
+from examples.pipelines.providers.mlx_manifold_pipeline import Pipeline  # noqa: E402
+from utils.pipelines.residency import (  # noqa: E402
+    ModelResidency,
+    process_memory_mb,
+)
+
+MODELS = [
+    {"id": f"fake-model-{name}", "name": f"mlx-community/fake-model-{name}"}
+    for name in ("a", "b", "c")
+]
+BODY = {"stream": False}
+MESSAGES = [{"role": "user", "content": "Hello"}]
+
+
+class ServerSampler:
+    """Samples the running fake servers' count and memory in a thread."""
+
+    def __init__(self):
+        self.peak_servers = 0
+        self.peak_mb = 0.0
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        while not self.stopping.wait(0.02):
+            servers = []
+            for process in psutil.Process().children(recursive=True):
+                with contextlib.suppress(psutil.Error):
+                    if any("fake_model_server" in arg for arg in process.cmdline()):
+                        servers.append(process.pid)
+            memory_mb = sum(process_memory_mb(pid) for pid in servers)
+            self.peak_servers = max(self.peak_servers, len(servers))
+            self.peak_mb = max(self.peak_mb, memory_mb)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopping.set()
+        self.thread.join()
+
+
+def new_pipeline(max_models: int, budget_mb: float) -> Pipeline:
+    # on_startup, which preloads the default model, is not run
+    pipeline = Pipeline()
+    pipeline.residency = ModelResidency(
+        pipeline.get_server_command, host=pipeline.host, name="mlx"
+    )
+    pipeline.models = MODELS
+    pipeline.valves.MLX_MAX_MODELS = max_models
+    pipeline.valves.MLX_MEMORY_BUDGET_MB = budget_mb
+    pipeline.valves.MLX_READY_TIMEOUT = 60.0
+    pipeline.configure_residency()
+    return pipeline
+
+
+def workloads(args) -> dict:
+    rng = random.Random(0)
+    alternating = [MODELS[i % 2]["id"] for i in range(args.requests)]
+    skewed = rng.choices(
+        [model["id"] for model in MODELS], weights=[6, 3, 1], k=args.requests
+    )
+    return {"alternating": (alternating, 1), "skewed": (skewed, args.concurrency)}
+
+
+def run(name: str, workload: str, model_ids, concurrency: int, max_models: int, args):
+    pipeline = new_pipeline(max_models, args.budget_models * args.model_mb)
+    errors = []
+
+    def request(model_id: str):
+        answer = pipeline.pipe("Hello", model_id, MESSAGES, BODY)
+        if isinstance(answer, str):
+            errors.append(answer)
+        elif not answer["model"].endswith(model_id):
+            errors.append(f"{model_id} answered by {answer['model']}")
+
+    with ServerSampler() as sampler:
+        started_at = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as executor:
+            list(executor.map(request, model_ids))
+        duration = time.perf_counter() - started_at
+        stats = pipeline.residency.stats()
+        pipeline.stop_mlx_server()
+    kill_children()
+
+    return {
+        "name": name,
+        "workload": workload,
+        "requests": len(model_ids),
+        "duration_s": round(duration, 2),
+        "loads": stats["loads"],
+        "evictions": stats["evictions"],
+        "errors": errors,
+        "peak_servers": sampler.peak_servers,
+        "peak_mb": round(sampler.peak_mb),
+    }
+
+
+def check_queueing(args) -> dict:
+    """Concurrent requests for a cold model wait for one load."""
+    pipeline = new_pipeline(args.max_models, args.budget_models * args.model_mb)
+    model_id = MODELS[0]["id"]
+    try:
+        with ThreadPoolExecutor(8) as executor:
+            answers = list(
+                executor.map(
+                    lambda _: pipeline.pipe("Hello", model_id, MESSAGES, BODY), range(8)
+                )
+            )
+        stats = pipeline.residency.stats()
+    finally:
+        pipeline.stop_mlx_server()
+        kill_children()
+    if stats["loads"] != 1 or any(isinstance(answer, str) for answer in answers):
+        raise AssertionError(f"Requests during a load did not share it: {stats}")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--load-s", type=float, default=1.0)
+    parser.add_argument("--model-mb", type=int, default=200)
+    parser.add_argument("--response-ms", type=float, default=50.0)
+    parser.add_argument("--max-models", type=int, default=3)
+    parser.add_argument("--budget-models", type=float, default=2.5)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    install_fake_servers(work_dir)
+    os.environ["FAKE_SERVER_STARTUP_S"] = str(args.load_s)
+    os.environ["FAKE_SERVER_MEMORY_MB"] = str(args.model_mb)
+    os.environ["FAKE_SERVER_RESPONSE_S"] = str(args.response_ms / 1000)
+
+    try:
+        # Silence the pipeline's logging
+        with contextlib.redirect_stdout(io.StringIO()):
+            results = [
+                run(name, workload, model_ids, concurrency, max_models, args)
+                for workload, (model_ids, concurrency) in workloads(args).items()
+                for name, max_models in (("before", 1), ("after", args.max_models))
+            ]
+            queueing = check_queueing(args)
+    finally:
+        kill_children()
+        shutil.rmtree(work_dir)
+
+    budget_mb = args.budget_models * args.model_mb
+    for result in results:
+        print(
+            f"{result['workload']:<11} {result['name']:<7} "
+            f"requests={result['requests']} duration={result['duration_s']}s "
+            f"loads={result['loads']} evictions={result['evictions']} "
+            f"errors={len(result['errors'])} peak_servers={result['peak_servers']} "
+            f"peak={result['peak_mb']}MB"
+        )
+    print(f"8 concurrent requests for a cold model: {queueing['loads']} load")
+
+    for result in results:
+        if result["errors"]:
+            raise AssertionError(f"Failed requests: {result['errors'][:3]}")
+        # A server's memory is counted while it loads, at its usual size
+        if result["name"] == "after" and result["peak_mb"] > budget_mb:
+            raise AssertionError(f"Servers used {result['peak_mb']} MB over {budget_mb}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"results": results, "queueing": queueing}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
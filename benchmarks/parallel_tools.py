@@ -0,0 +1,248 @@
+"""
+Test and benchmark of tool execution in `function_calling_blueprint`.
+
+A local fake task model asks for five tool calls in one turn: two sync and
+two async tools that each sleep `--tool-ms`, and one sync tool that sleeps
+past the blueprint's `TOOL_TIMEOUT`. It compares two approaches:
+
+- before: the calls run one after another on the event loop, without a
+  timeout, as the blueprint ran its single tool call;
+- after: the blueprint's `inlet`, which runs them concurrently (async tools
+  on the loop, sync tools in its thread pool) and skips the slow one.
+
+The "after" run is repeated against a task model that supports native tool
+calls and one that rejects `tools`, so the blueprint falls back to the JSON
+prompt. The benchmark checks that every tool result that finished in time
+reached the system prompt.
+
+Usage:
+    python -m benchmarks.parallel_tools --tool-ms 500 --timeout 1
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+
+from aiohttp import web
+
+from benchmarks.streaming_translation import serve_in_thread
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from blueprints.function_calling_blueprint import (  # noqa: E402
+    Pipeline as FunctionCallingBlueprint,
+)
+
+TOOL_CALLS = [
+    {"name": "get_weather", "parameters": {"location": "Paris"}},
+    {"name": "get_calendar", "parameters": {"day": "monday"}},
+    {"name": "search_docs", "parameters": {"query": "holidays"}},
+    {"name": "get_stock", "parameters": {"symbol": "ACME"}},
+    {"name": "build_report", "parameters": {}},
+]
+
+
+class FakeTaskModel:
+    """Answers chat completions with TOOL_CALLS, natively or as JSON content."""
+
+    def __init__(self, native: bool):
+        self.native = native
+        self.requests = 0
+
+    async def handle_chat_completions(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        self.requests += 1
+        if "tools" in body:
+            if not self.native:
+                return web.json_response(
+                    {"error": {"message": "tools are not supported"}}, status=400
+                )
+            message = {
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [
+                    {
+                        "id": f"call_{i}",
+                        "type": "function",
+                        "function": {
+                            "name": call["name"],
+                            "arguments": json.dumps(call["parameters"]),
+                        },
+                    }
+                    for i, call in enumerate(TOOL_CALLS)
+                ],
+            }
+        else:
+            message = {"role": "assistant", "content": json.dumps(TOOL_CALLS)}
+        return web.json_response(
+            {"choices": [{"index": 0, "message": message, "finish_reason": "stop"}]}
+        )
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self.handle_chat_completions)
+        return app
+
+
+def build_tools_class(tool_seconds: float, slow_seconds: float) -> type:
+    class Tools:
+        def __init__(self, pipeline) -> None:
+            self.pipeline = pipeline
+
+        def get_weather(self, location: str) -> str:
+            """
+            Get the current weather for a location.
+
+            :param location: The location to get the weather for.
+            """
+            time.sleep(tool_seconds)
+            return f"weather in {location}: sunny"
+
+        def get_calendar(self, day: str) -> str:
+            """
+            Get the events of a day.
+
+            :param day: The day of the week.
+            """
+            time.sleep(tool_seconds)
+            return f"events on {day}: standup"
+
+        async def search_docs(self, query: str) -> str:
+            """
+            Search the documentation.
+
+            :param query: The text to look for.
+            """
+            await asyncio.sleep(tool_seconds)
+            return f"docs about {query}: 3 pages"
+
+        async def get_stock(self, symbol: str) -> dict:
+            """
+            Get the price of a stock.
+
+            :param symbol: The ticker symbol.
+            """
+            await asyncio.sleep(tool_seconds)
+            return {"symbol": symbol, "price": 42}
+
+        def build_report(self) -> str:
+            """
+            Build the weekly report.
+            """
+            time.sleep(slow_seconds)
+            return "weekly report"
+
+    return Tools
+
+
+class BenchmarkPipeline(FunctionCallingBlueprint):
+    def __init__(self, tools_class: type, base_url: str, timeout: float):
+        super().__init__()
+        self.valves.OPENAI_API_BASE_URL = f"{base_url}/v1"
+        self.valves.TOOL_TIMEOUT = timeout
+        self.tools = tools_class(self)
+
+
+def body() -> dict:
+    return {
+        "model": "llama3",
+        "messages": [
+            {"role": "user", "content": "What does my week look like?"},
+        ],
+    }
+
+
+async def run_sequential(pipeline: BenchmarkPipeline) -> dict:
+    started_at = time.perf_counter()
+    results = []
+    for call in TOOL_CALLS:
+        function = getattr(pipeline.tools, call["name"])
+        result = function(**call["parameters"])
+        if asyncio.iscoroutine(result):
+            result = await result
+        results.append(result)
+    return {
+        "name": "before",
+        "duration_s": round(time.perf_counter() - started_at, 2),
+        "tool_results": len(results),
+    }
+
+
+async def run_blueprint(name: str, pipeline: BenchmarkPipeline, model: FakeTaskModel):
+    started_at = time.perf_counter()
+    output = await pipeline.inlet(body(), {"id": "bench-user"})
+    duration = time.perf_counter() - started_at
+
+    system_prompt = output["messages"][0]["content"]
+    expected = [
+        "weather in Paris",
+        "events on monday",
+        "docs about holidays",
+        '"symbol": "ACME"',
+    ]
+    missing = [text for text in expected if text not in system_prompt]
+    if missing or "weekly report" in system_prompt:
+        raise AssertionError(f"Unexpected tool results in {system_prompt!r}")
+
+    return {
+        "name": name,
+        "duration_s": round(duration, 2),
+        "tool_results": len(expected),
+        "task_model_requests": model.requests,
+    }
+
+
+async def benchmark(args) -> list:
+    tools_class = build_tools_class(args.tool_ms / 1000, args.timeout * 3)
+    results = []
+
+    native_model = FakeTaskModel(native=True)
+    native_url = serve_in_thread(native_model.create_app())
+    pipeline = BenchmarkPipeline(tools_class, native_url, args.timeout)
+    results.append(await run_sequential(pipeline))
+    results.append(await run_blueprint("after (native)", pipeline, native_model))
+    await pipeline.on_shutdown()
+
+    prompt_model = FakeTaskModel(native=False)
+    prompt_url = serve_in_thread(prompt_model.create_app())
+    pipeline = BenchmarkPipeline(tools_class, prompt_url, args.timeout)
+    results.append(await run_blueprint("after (prompt)", pipeline, prompt_model))
+    # The blueprint remembers the fallback, so later turns take one request
+    prompt_model.requests = 0
+    results.append(await run_blueprint("after (prompt, 2nd turn)", pipeline, prompt_model))
+    await pipeline.on_shutdown()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--tool-ms", type=float, default=500.0)
+    parser.add_argument("--timeout", type=float, default=1.0)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    # Silence the blueprint's request logging
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = asyncio.run(benchmark(args))
+
+    for result in results:
+        print(
+            f"{result['name']:<25} duration={result['duration_s']}s "
+            f"tool_results={result['tool_results']} "
+            f"task_model_requests={result.get('task_model_requests', '-')}"
+        )
+    print("tool results ok")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
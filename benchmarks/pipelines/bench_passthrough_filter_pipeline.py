@@ -0,0 +1,35 @@
+"""
+title: Benchmark Passthrough Filter
+author: open-webui
+date: 2026-10-19
+version: 1.0
+license: MIT
+description: A filter that returns the body unchanged, used to measure filter inlet/outlet overhead.
+"""
+
+from typing import List, Optional
+from pydantic import BaseModel
+
+
+class Pipeline:
+    class Valves(BaseModel):
+        pipelines: List[str] = []
+        priority: int = 0
+
+    def __init__(self):
+        self.type = "filter"
+        # self.id = "bench_passthrough_filter_pipeline"
+        self.name = "Benchmark Passthrough Filter"
+        self.valves = self.Valves(**{"pipelines": ["*"]})
+
+    async def on_startup(self):
+        print(f"on_startup:{__name__}")
+
+    async def on_shutdown(self):
+        print(f"on_shutdown:{__name__}")
+
+    async def inlet(self, body: dict, user: Optional[dict] = None) -> dict:
+        return body
+
+    async def outlet(self, body: dict, user: Optional[dict] = None) -> dict:
+        return body
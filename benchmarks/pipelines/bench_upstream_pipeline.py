@@ -0,0 +1,63 @@
+"""
+title: Benchmark Upstream Pipeline
+author: open-webui
+date: 2026-10-19
+version: 1.0
+license: MIT
+description: A pipe that proxies chat completions to the benchmark fake upstream.
+"""
+
+from typing import List, Union, Generator, Iterator
+from pydantic import BaseModel
+import os
+import requests
+
+
+class Pipeline:
+    class Valves(BaseModel):
+        BENCH_UPSTREAM_URL: str = "http://127.0.0.1:9199/v1"
+        BENCH_UPSTREAM_MODEL: str = "fake-model"
+
+    def __init__(self):
+        # self.id = "bench_upstream_pipeline"
+        self.name = "Benchmark Upstream"
+        self.valves = self.Valves(
+            **{
+                "BENCH_UPSTREAM_URL": os.getenv(
+                    "BENCH_UPSTREAM_URL", "http://127.0.0.1:9199/v1"
+                ),
+                "BENCH_UPSTREAM_MODEL": os.getenv(
+                    "BENCH_UPSTREAM_MODEL", "fake-model"
+                ),
+            }
+        )
+        self.session = requests.Session()
+
+    async def on_startup(self):
+        print(f"on_startup:{__name__}")
+
+    async def on_shutdown(self):
+        print(f"on_shutdown:{__name__}")
+        self.session.close()
+
+    def pipe(
+        self, user_message: str, model_id: str, messages: List[dict], body: dict
+    ) -> Union[str, Generator, Iterator]:
+        payload = {**body, "model": self.valves.BENCH_UPSTREAM_MODEL}
+        for key in ("user", "chat_id", "title"):
+            payload.pop(key, None)
+
+        try:
+            r = self.session.post(
+                url=f"{self.valves.BENCH_UPSTREAM_URL}/chat/completions",
+                json=payload,
+                stream=body.get("stream", False),
+            )
+            r.raise_for_status()
+
+            if body.get("stream", False):
+                return r.iter_lines()
+            else:
+                return r.json()
+        except Exception as e:
+            return f"Error: {e}"
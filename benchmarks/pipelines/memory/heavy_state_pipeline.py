@@ -0,0 +1,55 @@
+"""
+title: Heavy State Pipeline
+author: open-webui
+date: 2026-10-19
+version: 1.0
+license: MIT
+description: A pipe holding a large read-only index, used by the pre-fork memory benchmark.
+"""
+
+from typing import List, Union, Generator, Iterator
+from pydantic import BaseModel
+import os
+
+
+class Pipeline:
+    class Valves(BaseModel):
+        HEAVY_STATE_ENTRIES: int = 1_000_000
+
+    def __init__(self):
+        # self.id = "heavy_state_pipeline"
+        self.name = "Heavy State"
+        self.valves = self.Valves(
+            **{
+                "HEAVY_STATE_ENTRIES": int(
+                    os.getenv("HEAVY_STATE_ENTRIES", 1_000_000)
+                )
+            }
+        )
+        self.index = None
+        self.embeddings = None
+
+    def build(self):
+        entries = self.valves.HEAVY_STATE_ENTRIES
+        # A vocabulary-like dict and a flat embedding matrix
+        self.index = {f"token-{i}": i for i in range(entries)}
+        self.embeddings = bytes(entries * 64)
+
+    async def on_prefork(self):
+        # Runs once in the master process when started with prefork.py
+        print(f"on_prefork:{__name__}")
+        self.build()
+
+    async def on_startup(self):
+        print(f"on_startup:{__name__}")
+        if self.index is None:
+            self.build()
+
+    async def on_shutdown(self):
+        print(f"on_shutdown:{__name__}")
+
+    def pipe(
+        self, user_message: str, model_id: str, messages: List[dict], body: dict
+    ) -> Union[str, Generator, Iterator]:
+        tokens = [self.index.get(f"token-{len(word)}", -1) for word in user_message.split()]
+        return f"{len(self.index)} entries, lookups: {tokens}"
@@ -0,0 +1,173 @@
+"""
+Memory benchmark for pre-fork loading.
+
+Starts the server with the heavy state pipeline twice, once with uvicorn's
+regular workers (each worker imports and builds the pipeline) and once with
+prefork.py (built once in the master and shared copy-on-write), then reports
+RSS, USS and PSS per process. USS is the memory private to a process and PSS
+splits shared pages between the processes sharing them, so the sum of PSS is
+the real footprint of the deployment.
+
+Usage:
+    python -m benchmarks.prefork_memory --workers 4 --entries 1000000
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+import psutil
+
+from benchmarks.run import ROOT_DIR, BENCH_API_KEY, free_port, wait_for
+
+
+HEAVY_PIPELINE = os.path.join(
+    ROOT_DIR, "benchmarks", "pipelines", "memory", "heavy_state_pipeline.py"
+)
+
+MB = 1024 * 1024
+
+
+def touch_state(base_url: str, requests: int):
+    """Sends a few completions so the workers actually read the shared state."""
+    body = json.dumps(
+        {
+            "model": "heavy_state_pipeline",
+            "messages": [{"role": "user", "content": "a few words to look up"}],
+            "stream": False,
+        }
+    ).encode()
+    for _ in range(requests):
+        request = urllib.request.Request(
+            f"{base_url}/v1/chat/completions",
+            data=body,
+            headers={
+                "Content-Type": "application/json",
+                "Authorization": f"Bearer {BENCH_API_KEY}",
+            },
+        )
+        with urllib.request.urlopen(request, timeout=60):
+            pass
+
+
+def measure(pid: int) -> dict:
+    root = psutil.Process(pid)
+    processes = []
+    for p in [root, *root.children(recursive=True)]:
+        try:
+            info = p.memory_full_info()
+        except psutil.NoSuchProcess:
+            continue
+        processes.append(
+            {
+                "pid": p.pid,
+                "role": "master" if p.pid == pid else "worker",
+                "rss_mb": round(info.rss / MB, 1),
+                "uss_mb": round(info.uss / MB, 1),
+                "pss_mb": round(getattr(info, "pss", 0) / MB, 1),
+            }
+        )
+
+    # Ignore helper processes such as the multiprocessing resource tracker
+    workers = [p for p in processes if p["role"] == "worker" and p["rss_mb"] > 20]
+    return {
+        "processes": processes,
+        "workers": len(workers),
+        "worker_rss_mb": (
+            round(sum(p["rss_mb"] for p in workers) / len(workers), 1)
+            if workers
+            else None
+        ),
+        "worker_uss_mb": (
+            round(sum(p["uss_mb"] for p in workers) / len(workers), 1)
+            if workers
+            else None
+        ),
+        "total_pss_mb": round(sum(p["pss_mb"] for p in processes), 1),
+    }
+
+
+def run_mode(mode: str, args) -> dict:
+    pipelines_dir = tempfile.mkdtemp(prefix="pipelines-prefork-")
+    shutil.copy(HEAVY_PIPELINE, pipelines_dir)
+    port = free_port()
+
+    env = {
+        **os.environ,
+        "PIPELINES_DIR": pipelines_dir,
+        "PIPELINES_API_KEY": BENCH_API_KEY,
+        "PIPELINES_WORKERS": str(args.workers),
+        "HEAVY_STATE_ENTRIES": str(args.entries),
+        "HOST": "127.0.0.1",
+        "PORT": str(port),
+        "GLOBAL_LOG_LEVEL": "WARNING",
+    }
+    if mode == "prefork":
+        command = [sys.executable, "prefork.py"]
+    else:
+        command = [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "main:app",
+            "--host",
+            "127.0.0.1",
+            "--port",
+            str(port),
+            "--workers",
+            str(args.workers),
+        ]
+
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        command, cwd=ROOT_DIR, env=env, stdout=subprocess.DEVNULL
+    )
+    try:
+        base_url = f"http://127.0.0.1:{port}"
+        wait_for(f"{base_url}/", timeout=300)
+        # Wait until every worker has finished its startup
+        touch_state(base_url, args.workers * 4)
+        ready_s = time.perf_counter() - start
+
+        touch_state(base_url, args.requests)
+        time.sleep(1)
+        return {"mode": mode, "ready_s": round(ready_s, 2), **measure(process.pid)}
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        shutil.rmtree(pipelines_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-fork memory benchmark")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--entries", type=int, default=1_000_000)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    report = {
+        "workers": args.workers,
+        "entries": args.entries,
+        "modes": [run_mode("spawn", args), run_mode("prefork", args)],
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Benchmark of `presidio_filter_pipeline` over a long conversation.
+
+Replays a conversation of `--turns` turns, where each turn resends the
+whole history as chat clients do. It compares two approaches:
+
+- before: redacting every user message on every turn, as the filter did;
+- after: the filter's `inlet`, which analyzes only new messages, in one
+  batched pass, and reuses cached redactions for the history.
+
+Presidio loads the `en_core_web_lg` spaCy model by default. `--spacy-model`
+selects another installed model or a path. `--blank` uses an empty
+English pipeline, where only the pattern recognizers (emails, phone
+numbers, cards, ...) run; this is useful where models cannot be
+downloaded.
+
+Usage:
+    python -m benchmarks.presidio_redaction --turns 50
+"""
+
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PIPELINE_PATH = os.path.join(
+    ROOT_DIR, "examples", "filters", "presidio_filter_pipeline.py"
+)
+
+
+def load_pipeline(spacy_model=None):
+    sys.path.insert(0, ROOT_DIR)
+    spec = importlib.util.spec_from_file_location("presidio_filter_pipeline", PIPELINE_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    if spacy_model:
+        from presidio_analyzer import AnalyzerEngine
+        from presidio_analyzer.nlp_engine import SpacyNlpEngine
+
+        nlp_engine = SpacyNlpEngine(
+            models=[{"lang_code": "en", "model_name": spacy_model}]
+        )
+        module.AnalyzerEngine = lambda: AnalyzerEngine(nlp_engine=nlp_engine)
+
+    return module.Pipeline()
+
+
+def user_message(turn: int) -> str:
+    return (
+        f"Turn {turn}: my name is Jane Doe and I live in Springfield. "
+        f"Reach me at jane.doe{turn}@example.com or 212-555-{1000 + turn:04d}. "
+        "Can you summarize the report we discussed and suggest next steps "
+        "for the project, keeping the budget and timeline in mind? " * 2
+    )
+
+
+def conversation(turns: int) -> list:
+    messages = []
+    for turn in range(turns):
+        messages.append({"role": "user", "content": user_message(turn)})
+        messages.append(
+            {"role": "assistant", "content": f"Here is the summary for turn {turn}. " * 10}
+        )
+    return messages
+
+
+def before(pipeline, messages):
+    for message in messages:
+        if message.get("role") == "user":
+            message["content"] = pipeline.redact_pii(message["content"])
+
+
+def after(pipeline, messages):
+    asyncio.run(pipeline.inlet({"messages": messages}, {"role": "user"}))
+
+
+def run(name, redact, pipeline, turns):
+    history = conversation(turns)
+    latencies = []
+    outputs = None
+    for turn in range(1, turns + 1):
+        # The client resends the original history, up to the new user message
+        messages = [dict(message) for message in history[: turn * 2 - 1]]
+        started_at = time.perf_counter()
+        redact(pipeline, messages)
+        latencies.append((time.perf_counter() - started_at) * 1000)
+        outputs = messages
+
+    return {
+        "name": name,
+        "turns": turns,
+        "total_ms": round(sum(latencies), 1),
+        "first_turn_ms": round(latencies[0], 2),
+        "last_turn_ms": round(latencies[-1], 2),
+    }, outputs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--turns", type=int, default=50)
+    parser.add_argument("--spacy-model", help="spaCy model name or path")
+    parser.add_argument(
+        "--blank", action="store_true", help="Use an empty English spaCy pipeline"
+    )
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    spacy_model = args.spacy_model
+    if args.blank:
+        import spacy
+
+        spacy_model = os.path.join(tempfile.mkdtemp(), "blank_en")
+        spacy.blank("en").to_disk(spacy_model)
+
+    # Silence the filter's request logging
+    sys.stdout, stdout = open(os.devnull, "w"), sys.stdout
+    try:
+        pipeline = load_pipeline(spacy_model)
+        pipeline.redact_pii(user_message(0))  # warm up
+        before_result, before_messages = run("before", before, pipeline, args.turns)
+        after_result, after_messages = run("after", after, pipeline, args.turns)
+    finally:
+        sys.stdout = stdout
+
+    results = [before_result, after_result]
+    for result in results:
+        print(
+            f"{result['name']:<7} total={result['total_ms']}ms "
+            f"first_turn={result['first_turn_ms']}ms last_turn={result['last_turn_ms']}ms"
+        )
+    print(
+        f"same redactions: {before_messages == after_messages}, "
+        f"speedup: {before_result['total_ms'] / after_result['total_ms']:.1f}x"
+    )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+"""
+Test and benchmark of `llamaindex_pipeline` startup with a persisted index.
+
+Writes a corpus of `--documents` text files and starts the pipeline several
+times against it, with an embedding model that takes `--embed-ms` per batch
+of texts. It compares two approaches:
+
+- before: `VectorStoreIndex.from_documents` on every start, as the pipeline
+  did;
+- after: the pipeline's `PersistedIndex`, started cold (empty storage), warm
+  (unchanged corpus), and after `--changed` files were edited, one added
+  and one deleted.
+
+It reports startup time, texts embedded and the time of the first query
+(which loads a persisted index), and checks that queries find the edited
+content and not the deleted file.
+
+Usage:
+    python -m benchmarks.rag_index --documents 200 --embed-ms 20
+"""
+
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from typing import List
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from llama_index.core import (  # noqa: E402
+    Settings,
+    SimpleDirectoryReader,
+    VectorStoreIndex,
+)
+from llama_index.core.embeddings import BaseEmbedding  # noqa: E402
+
+from examples.pipelines.rag.llamaindex_pipeline import Pipeline  # noqa: E402
+from utils.pipelines.indexes import PersistedIndex  # noqa: E402
+
+EMBED_DIM = 1024
+
+
+class FakeEmbedding(BaseEmbedding):
+    """Hashed bag of words, with the latency of a remote embedding model."""
+
+    latency: float = 0.0
+    texts: int = 0
+
+    def _embed(self, text: str) -> List[float]:
+        vector = [0.0] * EMBED_DIM
+        for word in text.lower().split():
+            digest = hashlib.md5(word.strip(".,?").encode()).digest()
+            vector[int.from_bytes(digest[:4], "big") % EMBED_DIM] += 1.0
+        return vector
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(self.latency)
+        self.texts += len(texts)
+        return [self._embed(text) for text in texts]
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embeddings([text])[0]
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._embed(query)
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embedding(text)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._get_query_embedding(query)
+
+
+def write_corpus(data_dir: str, documents: int):
+    for n in range(documents):
+        with open(os.path.join(data_dir, f"doc_{n:04d}.txt"), "w") as f:
+            f.write(
+                f"Document {n} describes project topic{n}. "
+                + " ".join(f"filler{(n * 7 + i) % 101}" for i in range(150))
+            )
+
+
+def edit_corpus(data_dir: str, changed: int):
+    for n in range(changed):
+        with open(os.path.join(data_dir, f"doc_{n:04d}.txt"), "w") as f:
+            f.write(f"Document {n} now describes revised{n} instead.")
+    with open(os.path.join(data_dir, "doc_new.txt"), "w") as f:
+        f.write("A new document about brandnewtopic.")
+    os.remove(os.path.join(data_dir, f"doc_{changed:04d}.txt"))
+
+
+def top_file(index, query: str) -> str:
+    nodes = index.as_retriever(similarity_top_k=1).retrieve(query)
+    return nodes[0].metadata["file_name"] if nodes else ""
+
+
+async def start(name: str, pipeline: Pipeline, embed_model: FakeEmbedding) -> dict:
+    embed_model.texts = 0
+    started_at = time.perf_counter()
+    await pipeline.on_startup()
+    startup = time.perf_counter() - started_at
+
+    started_at = time.perf_counter()
+    index = pipeline.index.get()
+    first_query = time.perf_counter() - started_at
+    return {
+        "name": name,
+        "startup_s": round(startup, 3),
+        "first_query_load_s": round(first_query, 3),
+        "texts_embedded": embed_model.texts,
+        "refresh": pipeline.index.last_refresh,
+        "index": index,
+    }
+
+
+async def benchmark(args) -> list:
+    embed_model = FakeEmbedding(
+        model_name="fake", latency=args.embed_ms / 1000, embed_batch_size=10
+    )
+    Settings.embed_model = embed_model
+    work_dir = tempfile.mkdtemp()
+    data_dir = os.path.join(work_dir, "data")
+    os.makedirs(data_dir)
+    write_corpus(data_dir, args.documents)
+    results = []
+
+    try:
+        embed_model.texts = 0
+        started_at = time.perf_counter()
+        documents = SimpleDirectoryReader(data_dir).load_data()
+        VectorStoreIndex.from_documents(documents)
+        results.append(
+            {
+                "name": "before (every start)",
+                "startup_s": round(time.perf_counter() - started_at, 3),
+                "first_query_load_s": 0.0,
+                "texts_embedded": embed_model.texts,
+            }
+        )
+
+        def new_pipeline() -> Pipeline:
+            # A fresh instance per start, as after a server restart
+            pipeline = Pipeline()
+            pipeline.data_dir = data_dir
+            pipeline.index = PersistedIndex(os.path.join(work_dir, "storage"))
+            return pipeline
+
+        results.append(await start("after (cold)", new_pipeline(), embed_model))
+        results.append(await start("after (warm)", new_pipeline(), embed_model))
+
+        edit_corpus(data_dir, args.changed)
+        result = await start("after (edited)", new_pipeline(), embed_model)
+        results.append(result)
+
+        index = result["index"]
+        checks = {
+            "revised0": "doc_0000.txt",
+            "brandnewtopic": "doc_new.txt",
+            f"topic{args.changed + 1}": f"doc_{args.changed + 1:04d}.txt",
+        }
+        for query, file_name in checks.items():
+            found = top_file(index, query)
+            if found != file_name:
+                raise AssertionError(f"{query!r} found {found}, not {file_name}")
+        deleted = f"doc_{args.changed:04d}.txt"
+        if any(
+            info.metadata.get("file_name") == deleted
+            for info in index.ref_doc_info.values()
+        ):
+            raise AssertionError(f"{deleted} is still indexed")
+
+        result = await start("after (warm, edited)", new_pipeline(), embed_model)
+        if top_file(result["index"], "revised0") != "doc_0000.txt":
+            raise AssertionError("The edits were not persisted")
+        results.append(result)
+    finally:
+        shutil.rmtree(work_dir)
+
+    for result in results:
+        result.pop("index", None)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--documents", type=int, default=200)
+    parser.add_argument("--changed", type=int, default=2)
+    parser.add_argument("--embed-ms", type=float, default=20.0)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    # Silence the pipeline's logging
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = asyncio.run(benchmark(args))
+
+    for result in results:
+        print(
+            f"{result['name']:<21} startup={result['startup_s']}s "
+            f"first_query_load={result['first_query_load_s']}s "
+            f"texts_embedded={result['texts_embedded']} "
+            f"refresh={result.get('refresh', '-')}"
+        )
+    print("queries ok")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
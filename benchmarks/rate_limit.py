@@ -0,0 +1,139 @@
+"""
+Benchmark of the rate limiting engine used by `rate_limit_filter_pipeline`.
+
+Compares the previous implementation (a list of timestamps per user, pruned
+and rescanned on every request) with `SlidingWindowRateLimiter`, using the
+pipeline's default limits, for a large number of users and for a few heavy
+users close to their hourly limit.
+
+Usage:
+    python -m benchmarks.rate_limit --users 100000 --requests 1000000
+"""
+
+import argparse
+import json
+import random
+import time
+import tracemalloc
+
+from utils.pipelines.ratelimit import SlidingWindowRateLimiter
+
+
+REQUESTS_PER_MINUTE = 10
+REQUESTS_PER_HOUR = 1000
+SLIDING_WINDOW_LIMIT = 100
+SLIDING_WINDOW_MINUTES = 15
+
+
+class TimestampListLimiter:
+    """The timestamp list algorithm previously used by the pipeline."""
+
+    def __init__(self):
+        self.user_requests = {}
+
+    def prune_requests(self, user_id, now):
+        if user_id in self.user_requests:
+            self.user_requests[user_id] = [
+                req
+                for req in self.user_requests[user_id]
+                if now - req < 60
+                or now - req < 3600
+                or now - req < SLIDING_WINDOW_MINUTES * 60
+            ]
+
+    def hit(self, user_id, now):
+        self.prune_requests(user_id, now)
+        user_reqs = self.user_requests.get(user_id, [])
+        if sum(1 for req in user_reqs if now - req < 60) >= REQUESTS_PER_MINUTE:
+            return False
+        if sum(1 for req in user_reqs if now - req < 3600) >= REQUESTS_PER_HOUR:
+            return False
+        if len(user_reqs) >= SLIDING_WINDOW_LIMIT:
+            return False
+        self.user_requests.setdefault(user_id, []).append(now)
+        return True
+
+
+def sliding_window_limiter():
+    return SlidingWindowRateLimiter(
+        [
+            (60, REQUESTS_PER_MINUTE),
+            (3600, REQUESTS_PER_HOUR),
+            (SLIDING_WINDOW_MINUTES * 60, SLIDING_WINDOW_LIMIT),
+        ]
+    )
+
+
+def run(create_limiter, events) -> dict:
+    limiter = create_limiter()
+    start = time.perf_counter()
+    allowed = 0
+    for user_id, now in events:
+        allowed += limiter.hit(user_id, now)
+    duration = time.perf_counter() - start
+
+    # Measure memory in a separate pass, tracemalloc slows down allocations
+    tracemalloc.start()
+    limiter = create_limiter()
+    for user_id, now in events:
+        limiter.hit(user_id, now)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "requests": len(events),
+        "allowed": allowed,
+        "duration_s": round(duration, 3),
+        "us_per_request": round(duration / len(events) * 1e6, 2),
+        "peak_memory_mb": round(peak / 1024 / 1024, 1),
+    }
+
+
+def many_users_events(users: int, requests: int, span: float) -> list:
+    rng = random.Random(0)
+    start = time.time()
+    return [
+        (f"user-{rng.randrange(users)}", start + span * i / requests)
+        for i in range(requests)
+    ]
+
+
+def heavy_users_events(users: int, requests: int, span: float) -> list:
+    # Each heavy user sends a steady stream just below the minute limit
+    start = time.time()
+    return [
+        (f"user-{i % users}", start + span * i / requests) for i in range(requests)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rate limiter benchmark")
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--requests", type=int, default=1_000_000)
+    parser.add_argument("--span", type=float, default=3600.0)
+    parser.add_argument("--heavy-users", type=int, default=10)
+    parser.add_argument("--heavy-requests", type=int, default=50_000)
+    args = parser.parse_args()
+
+    scenarios = {
+        "many_users": many_users_events(args.users, args.requests, args.span),
+        "heavy_users": heavy_users_events(
+            args.heavy_users,
+            args.heavy_requests,
+            # ~9 requests per minute per user
+            args.heavy_requests / args.heavy_users / 9 * 60,
+        ),
+    }
+
+    report = {}
+    for name, events in scenarios.items():
+        report[name] = {
+            "timestamp_list": run(TimestampListLimiter, events),
+            "sliding_window": run(sliding_window_limiter, events),
+        }
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
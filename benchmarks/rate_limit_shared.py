@@ -0,0 +1,134 @@
+"""
+Benchmark of the shared rate limiting backend used by
+`rate_limit_filter_pipeline` when `RATE_LIMIT_BACKEND_URL` is set.
+
+Several workers (threads, each with its own `RedisRateLimiter` and
+connection, as separate uvicorn workers or replicas would have) send
+requests for the same users against one server, and the benchmark checks
+that the limit is enforced globally: exactly in exact mode
+(`batch_size=1`), and within `workers * (batch_size - 1)` with batching. It
+also reports the round trips to the server and the latency per request.
+
+Runs against `benchmarks.fake_redis.FakeRedis` unless `--redis-url` points
+to a real server.
+
+Usage:
+    python -m benchmarks.rate_limit_shared --workers 4 --batch-sizes 1 10 50
+"""
+
+import argparse
+import json
+import threading
+import time
+
+from benchmarks.fake_redis import FakeRedis
+from benchmarks.load import percentile
+from utils.pipelines.ratelimit import RedisRateLimiter
+from utils.pipelines.state import RedisStateStore
+
+
+def run(url, server, workers, users, requests, limit, batch_size):
+    # A fresh key prefix per run, shared by all workers
+    prefix = f"bench:{batch_size}:{time.time()}"
+    limiters = [
+        RedisRateLimiter(
+            RedisStateStore(url),
+            [(3600, limit)],
+            batch_size=batch_size,
+            prefix=prefix,
+        )
+        for _ in range(workers)
+    ]
+    allowed = [0] * workers
+    latencies = [[] for _ in range(workers)]
+    start = threading.Barrier(workers)
+
+    def worker(i):
+        limiter = limiters[i]
+        start.wait()
+        for n in range(requests):
+            user_id = f"user-{n % users}"
+            started_at = time.perf_counter()
+            if limiter.hit(user_id):
+                allowed[i] += 1
+            latencies[i].append((time.perf_counter() - started_at) * 1000)
+        limiter.flush()
+
+    commands = server.commands if server else None
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(workers)]
+    started_at = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.perf_counter() - started_at
+
+    latencies = sorted(l for worker_latencies in latencies for l in worker_latencies)
+    total = workers * requests
+    return {
+        "batch_size": batch_size,
+        "requests": total,
+        "allowed": sum(allowed),
+        "expected_allowed": limit * users,
+        "max_overshoot": workers * (batch_size - 1) * users,
+        "round_trips": server.commands - commands if server else None,
+        "throughput_rps": round(total / duration, 1),
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50), 4),
+            "p95": round(percentile(latencies, 95), 4),
+            "p99": round(percentile(latencies, 99), 4),
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--redis-url", help="Use a real server instead of the stand-in")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=2000, help="Per worker")
+    parser.add_argument("--limit", type=int, default=100, help="Per user and hour")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    server = None
+    url = args.redis_url
+    if url is None:
+        server = FakeRedis()
+        url = server.start()
+
+    results = []
+    try:
+        for batch_size in args.batch_sizes:
+            result = run(
+                url,
+                server,
+                args.workers,
+                args.users,
+                args.requests,
+                args.limit,
+                batch_size,
+            )
+            results.append(result)
+
+            overshoot = result["allowed"] - result["expected_allowed"]
+            status = "ok" if 0 <= overshoot <= result["max_overshoot"] else "FAILED"
+            print(
+                f"batch_size={batch_size:<4} allowed={result['allowed']:<6} "
+                f"expected={result['expected_allowed']:<6} overshoot={overshoot:<4} "
+                f"round_trips={result['round_trips']} "
+                f"rps={result['throughput_rps']:<9} "
+                f"p95={result['latency_ms']['p95']}ms  {status}"
+            )
+    finally:
+        if server:
+            server.stop()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Replay captured traffic against a Pipelines server.
+
+Reads a JSONL file written by the server's request capture
+(`REQUEST_CAPTURE_PATH`) and re-drives each request at its original
+inter-arrival time, optionally scaled up with `--speed`.
+
+Usage:
+    python -m benchmarks.replay captures/requests.jsonl --base-url http://localhost:9099 --speed 4
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+import aiohttp
+
+from benchmarks.load import ScenarioResult
+
+
+def load_records(path: str, limit: int = None) -> list:
+    records = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get("body") is None:
+                continue
+            records.append(record)
+            if limit and len(records) >= limit:
+                break
+    records.sort(key=lambda r: r["timestamp"])
+    return records
+
+
+def scenario_name(path: str) -> str:
+    if path.endswith("/filter/inlet"):
+        return "inlet"
+    if path.endswith("/filter/outlet"):
+        return "outlet"
+    return "chat"
+
+
+async def send(
+    session: aiohttp.ClientSession,
+    base_url: str,
+    record: dict,
+    result: ScenarioResult,
+    model: str = None,
+):
+    body = record["body"]
+    if model and record["path"].endswith("/chat/completions"):
+        body = {**body, "model": model}
+
+    result.requests += 1
+    start = time.perf_counter()
+    try:
+        async with session.post(f"{base_url}{record['path']}", json=body) as r:
+            first = None
+            async for _ in r.content.iter_any():
+                if first is None:
+                    first = time.perf_counter()
+            if r.status >= 400:
+                result.errors += 1
+                return
+        if body.get("stream", False) and first is not None:
+            result.ttfts_ms.append((first - start) * 1000)
+        result.latencies_ms.append((time.perf_counter() - start) * 1000)
+    except Exception:
+        result.errors += 1
+
+
+async def replay(args) -> dict:
+    records = load_records(args.file, args.max_requests)
+    if not records:
+        raise SystemExit(f"No replayable records found in {args.file}")
+
+    results = {}
+    semaphore = asyncio.Semaphore(args.concurrency)
+    headers = {"Authorization": f"Bearer {args.api_key}"}
+    timeout = aiohttp.ClientTimeout(total=300)
+
+    async with aiohttp.ClientSession(headers=headers, timeout=timeout) as session:
+
+        async def run(record: dict, delay: float):
+            if delay > 0:
+                await asyncio.sleep(delay)
+            name = scenario_name(record["path"])
+            result = results.setdefault(
+                name, ScenarioResult(name=name, concurrency=args.concurrency)
+            )
+            async with semaphore:
+                await send(session, args.base_url, record, result, args.model)
+
+        first_timestamp = records[0]["timestamp"]
+        start = time.perf_counter()
+        await asyncio.gather(
+            *(
+                run(
+                    record,
+                    (
+                        (record["timestamp"] - first_timestamp) / args.speed
+                        if args.speed > 0
+                        else 0
+                    ),
+                )
+                for record in records
+            )
+        )
+        duration = time.perf_counter() - start
+
+    for result in results.values():
+        result.duration_s = duration
+
+    return {
+        "file": args.file,
+        "records": len(records),
+        "speed": args.speed,
+        "duration_s": duration,
+        "scenarios": [result.to_dict() for result in results.values()],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay captured Pipelines traffic")
+    parser.add_argument("file", help="JSONL file produced by the request capture")
+    parser.add_argument("--base-url", default="http://localhost:9099")
+    parser.add_argument("--api-key", default="0p3n-w3bu!")
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=1.0,
+        help="Rate multiplier; 1 replays at the original rate, 0 as fast as possible",
+    )
+    parser.add_argument("--concurrency", type=int, default=256)
+    parser.add_argument("--max-requests", type=int, default=None)
+    parser.add_argument(
+        "--model", default=None, help="Override the model of chat completions"
+    )
+    parser.add_argument("--output", default=None, help="Write JSON results here")
+    args = parser.parse_args()
+
+    report = asyncio.run(replay(args))
+    for scenario in report["scenarios"]:
+        print(
+            f"{scenario['name']}: {scenario['requests']} requests, "
+            f"{scenario['errors']} errors",
+            file=sys.stderr,
+        )
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
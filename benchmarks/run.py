@@ -0,0 +1,278 @@
+"""
+Benchmark harness for the Pipelines server.
+
+Starts the fake upstream and a Pipelines server with a configurable set of
+pipelines, drives the selected scenarios and writes the results as JSON.
+
+Usage:
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.run --pipeline examples/filters/rate_limit_filter_pipeline.py --scenarios chat_stream,inlet
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from benchmarks.load import (
+    chat_body,
+    request_chat_completion,
+    request_filter,
+    request_models,
+    run_scenario,
+)
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_PIPELINES_DIR = os.path.join(ROOT_DIR, "benchmarks", "pipelines")
+BENCH_API_KEY = "0p3n-w3bu!"
+
+PIPE_ID = "bench_upstream_pipeline"
+FILTER_ID = "bench_passthrough_filter_pipeline"
+
+SCENARIOS = {
+    "models": lambda args: (request_models, {}),
+    "chat": lambda args: (
+        request_chat_completion,
+        chat_body(args.model, stream=False, history=args.history),
+    ),
+    "chat_stream": lambda args: (
+        request_chat_completion,
+        chat_body(args.model, stream=True, history=args.history),
+    ),
+    "inlet": lambda args: (
+        request_filter("inlet", args.filter),
+        chat_body(args.model, stream=True, history=args.history),
+    ),
+    "outlet": lambda args: (
+        request_filter("outlet", args.filter),
+        chat_body(args.model, stream=True, history=args.history),
+    ),
+}
+
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for(url: str, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1):
+                return
+        except Exception:
+            time.sleep(0.1)
+    raise RuntimeError(f"Timed out waiting for {url}")
+
+
+def git_commit() -> str:
+    try:
+        return (
+            subprocess.check_output(
+                ["git", "rev-parse", "HEAD"], cwd=ROOT_DIR, stderr=subprocess.DEVNULL
+            )
+            .decode()
+            .strip()
+        )
+    except Exception:
+        return None
+
+
+def cpu_sampler(pid: int):
+    if psutil is None:
+        return None
+
+    process = psutil.Process(pid)
+
+    def sample():
+        total = 0.0
+        for p in [process, *process.children(recursive=True)]:
+            try:
+                times = p.cpu_times()
+                total += times.user + times.system
+            except psutil.NoSuchProcess:
+                pass
+        return total
+
+    return sample
+
+
+def prepare_pipelines_dir(extra_pipelines: list) -> str:
+    pipelines_dir = tempfile.mkdtemp(prefix="pipelines-bench-")
+    for filename in os.listdir(BENCH_PIPELINES_DIR):
+        if filename.endswith(".py"):
+            shutil.copy(os.path.join(BENCH_PIPELINES_DIR, filename), pipelines_dir)
+    for path in extra_pipelines:
+        shutil.copy(path, pipelines_dir)
+    return pipelines_dir
+
+
+def start_processes(args, pipelines_dir: str):
+    upstream_port = free_port()
+    server_port = args.server_port or free_port()
+
+    upstream = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "benchmarks.fake_upstream",
+            "--port",
+            str(upstream_port),
+            "--ttft-ms",
+            str(args.ttft_ms),
+            "--tokens",
+            str(args.tokens),
+            "--tokens-per-second",
+            str(args.tokens_per_second),
+        ],
+        cwd=ROOT_DIR,
+    )
+
+    env = {
+        **os.environ,
+        "PIPELINES_DIR": pipelines_dir,
+        "PIPELINES_API_KEY": BENCH_API_KEY,
+        "BENCH_UPSTREAM_URL": f"http://127.0.0.1:{upstream_port}/v1",
+        "GLOBAL_LOG_LEVEL": args.log_level,
+    }
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "main:app",
+            "--host",
+            "127.0.0.1",
+            "--port",
+            str(server_port),
+            "--log-level",
+            "warning",
+            "--no-access-log",
+        ],
+        cwd=ROOT_DIR,
+        env=env,
+        stdout=None if args.verbose else subprocess.DEVNULL,
+    )
+
+    wait_for(f"http://127.0.0.1:{upstream_port}/v1/models")
+    wait_for(f"http://127.0.0.1:{server_port}/")
+    return upstream, server, f"http://127.0.0.1:{server_port}"
+
+
+async def run_all(args, base_url: str, server_pid: int) -> list:
+    sampler = cpu_sampler(server_pid)
+    results = []
+    for name in args.scenarios.split(","):
+        request, body = SCENARIOS[name](args)
+
+        # Warm up connections and lazily initialised pipeline state.
+        await run_scenario(
+            name, base_url, BENCH_API_KEY, request, body, args.concurrency, args.warmup
+        )
+        result = await run_scenario(
+            name,
+            base_url,
+            BENCH_API_KEY,
+            request,
+            body,
+            args.concurrency,
+            args.requests,
+            cpu_sampler=sampler,
+        )
+        print(
+            f"{name}: {result.requests} requests, {result.errors} errors "
+            f"in {result.duration_s:.2f}s",
+            file=sys.stderr,
+        )
+        results.append(result.to_dict())
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pipelines benchmark harness")
+    parser.add_argument(
+        "--pipeline",
+        action="append",
+        default=[],
+        help="Additional pipeline file to load (can be repeated)",
+    )
+    parser.add_argument(
+        "--scenarios",
+        default="models,chat,chat_stream,inlet,outlet",
+        help=f"Comma separated list of scenarios: {','.join(SCENARIOS)}",
+    )
+    parser.add_argument("--model", default=PIPE_ID)
+    parser.add_argument("--filter", default=FILTER_ID)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--history", type=int, default=1)
+    parser.add_argument("--ttft-ms", type=float, default=50.0)
+    parser.add_argument("--tokens", type=int, default=64)
+    parser.add_argument("--tokens-per-second", type=float, default=500.0)
+    parser.add_argument("--server-port", type=int, default=None)
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--output", default=None, help="Write JSON results here")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    pipelines_dir = prepare_pipelines_dir(args.pipeline)
+    upstream, server = None, None
+    try:
+        upstream, server, base_url = start_processes(args, pipelines_dir)
+        results = asyncio.run(run_all(args, base_url, server.pid))
+    finally:
+        for process in (server, upstream):
+            if process is not None:
+                process.terminate()
+                try:
+                    process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+        shutil.rmtree(pipelines_dir, ignore_errors=True)
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": int(time.time()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "pipelines": sorted(os.path.basename(p) for p in args.pipeline),
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "history": args.history,
+            "upstream": {
+                "ttft_ms": args.ttft_ms,
+                "tokens": args.tokens,
+                "tokens_per_second": args.tokens_per_second,
+            },
+        },
+        "scenarios": results,
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
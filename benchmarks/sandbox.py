@@ -0,0 +1,167 @@
+"""
+Test and benchmark of code execution in `python_code_pipeline`.
+
+Runs `--executions` short snippets from `--concurrency` threads, as the
+server's thread pool does, and compares executions per second of two
+approaches:
+
+- before: a new `python -c` interpreter per execution, as the pipeline ran
+  them;
+- after: the pipeline's `SandboxPool` of `--workers` warm workers, replaced
+  after `--max-executions` runs.
+
+It checks that both print the same output, then that the sandbox stops
+code running past its timeout, its CPU time or its memory, that state does
+not leak between executions, and that `pipe` streams output as it is
+printed.
+
+Usage:
+    python -m benchmarks.sandbox --executions 300 --concurrency 4 --workers 4
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from examples.pipelines.integrations.python_code_pipeline import (  # noqa: E402
+    Pipeline,
+)
+
+SNIPPETS = [
+    "print(sum(range(1000)))",
+    "import json\nprint(json.dumps({'a': [1, 2, 3]}))",
+    "import math\nprint(math.factorial(20))",
+    "words = 'the quick brown fox'.split()\nprint(sorted(words, key=len))",
+    "for i in range(3):\n    print(i * i)",
+]
+
+
+def run_subprocess(code: str) -> str:
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+    return result.stdout.strip()
+
+
+def run_sandbox(pipeline: Pipeline):
+    def run(code: str) -> str:
+        stdout, _ = pipeline.execute_python_code(code)
+        return stdout
+
+    return run
+
+
+def measure(name: str, run, args) -> dict:
+    codes = [SNIPPETS[i % len(SNIPPETS)] for i in range(args.executions)]
+    started_at = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as executor:
+        outputs = list(executor.map(run, codes))
+    duration = time.perf_counter() - started_at
+    return {
+        "name": name,
+        "executions": len(codes),
+        "duration_s": round(duration, 2),
+        "executions_per_s": round(len(codes) / duration, 1),
+        "outputs": outputs,
+    }
+
+
+def check_limits(pipeline: Pipeline) -> dict:
+    sandbox = pipeline.sandbox
+    checks = {}
+
+    execution = sandbox.run("import time\ntime.sleep(60)")
+    started_at = time.perf_counter()
+    execution.output()
+    checks["timeout_s"] = round(time.perf_counter() - started_at, 2)
+    if not execution.timed_out:
+        raise AssertionError("A sleeping code was not stopped")
+
+    execution = sandbox.run("while True:\n    pass")
+    execution.output()
+    if not execution.crashed:
+        raise AssertionError("A busy loop was not stopped by the CPU limit")
+
+    execution = sandbox.run("data = bytearray(4 * 1024 ** 3)")
+    execution.output()
+    if execution.returncode != 1 or "MemoryError" not in execution.stderr:
+        raise AssertionError("A 4 GB allocation was not refused")
+
+    sandbox.run("leaked = 42").output()
+    execution = sandbox.run("print(leaked)")
+    execution.output()
+    if "NameError" not in execution.stderr:
+        raise AssertionError("Globals leaked between executions")
+
+    # First output of a code that keeps printing, through pipe
+    code = "import time\nfor i in range(5):\n    print(i, flush=True)\n    time.sleep(0.2)"
+    started_at = time.perf_counter()
+    chunks = pipeline.pipe(code, "python_code_pipeline", [], {})
+    first = next(chunks)
+    checks["first_output_s"] = round(time.perf_counter() - started_at, 2)
+    rest = "".join(chunks)
+    checks["streamed_s"] = round(time.perf_counter() - started_at, 2)
+    if (first + rest).split() != ["0", "1", "2", "3", "4"]:
+        raise AssertionError(f"Unexpected streamed output {first + rest!r}")
+    return checks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--executions", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--max-executions", type=int, default=100)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    pipeline = Pipeline()
+    pipeline.valves.SANDBOX_WORKERS = args.workers
+    pipeline.valves.SANDBOX_MAX_EXECUTIONS = args.max_executions
+    pipeline.valves.SANDBOX_TIMEOUT = 3.0
+    pipeline.valves.SANDBOX_CPU_SECONDS = 1.0
+
+    # Silence the pipeline's logging
+    with contextlib.redirect_stdout(io.StringIO()):
+        asyncio.run(pipeline.on_startup())
+        try:
+            results = [
+                measure("before", run_subprocess, args),
+                measure("after", run_sandbox(pipeline), args),
+            ]
+            stats = pipeline.sandbox.stats()
+            checks = check_limits(pipeline)
+        finally:
+            asyncio.run(pipeline.on_shutdown())
+
+    for result in results:
+        print(
+            f"{result['name']:<7} executions={result['executions']} "
+            f"duration={result['duration_s']}s "
+            f"executions/s={result['executions_per_s']}"
+        )
+    if results[0].pop("outputs") != results[1].pop("outputs"):
+        raise AssertionError("Different outputs")
+    print(f"same outputs, sandbox {stats}")
+    print(
+        f"limits ok: timeout after {checks['timeout_s']}s, "
+        f"first streamed output after {checks['first_output_s']}s "
+        f"of {checks['streamed_s']}s"
+    )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"results": results, "sandbox": stats, "checks": checks}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Memory benchmark of the per-chat state kept by the Langfuse and Opik filters.
+
+Simulates a long-running server seeing `--chats` distinct chats, each with a
+few turns, and stores a trace-like object and model info per chat the way
+`langfuse_filter_pipeline` does: once in plain dicts (the previous,
+unbounded behaviour) and once in `SessionStore`. Reports the memory held at
+the end, the peak, and the time per turn.
+
+Usage:
+    python -m benchmarks.session_store --chats 1000000 --max-sessions 10000
+"""
+
+import argparse
+import json
+import time
+import tracemalloc
+
+from utils.pipelines.sessions import SessionStore
+
+
+class FakeTrace:
+    """Stands in for an SDK trace client: a few ids and a small payload."""
+
+    __slots__ = ("id", "trace_id", "task_manager", "state", "input")
+
+    def __init__(self, chat_id: str):
+        self.id = chat_id
+        self.trace_id = f"trace-{chat_id}"
+        self.task_manager = None
+        self.state = {"name": f"chat:{chat_id}", "session_id": chat_id}
+        self.input = "x" * 256
+
+
+def simulate(chat_traces, model_names, chats, turns):
+    for n in range(chats):
+        chat_id = f"chat-{n}"
+        for _ in range(turns):
+            # inlet
+            if chat_id not in model_names:
+                model_names[chat_id] = {"id": "llama3"}
+            else:
+                model_names[chat_id]["id"] = "llama3"
+            model_names[chat_id]["name"] = "Llama 3"
+            if chat_id not in chat_traces:
+                chat_traces[chat_id] = FakeTrace(chat_id)
+            # outlet
+            chat_traces[chat_id]
+            model_names.get(chat_id, {}).get("id")
+
+
+def run(name, create, chats, turns):
+    # Timing and memory are measured in separate passes, as tracing
+    # allocations slows the simulation down several times
+    chat_traces, model_names = create()
+    started_at = time.perf_counter()
+    simulate(chat_traces, model_names, chats, turns)
+    duration = time.perf_counter() - started_at
+    del chat_traces, model_names
+
+    tracemalloc.start()
+    chat_traces, model_names = create()
+    simulate(chat_traces, model_names, chats, turns)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    result = {
+        "name": name,
+        "chats": chats,
+        "sessions": len(chat_traces),
+        "memory_mb": round(current / 2**20, 1),
+        "peak_mb": round(peak / 2**20, 1),
+        "us_per_turn": round(duration / (chats * turns) * 1e6, 3),
+    }
+    if isinstance(chat_traces, SessionStore):
+        result["stats"] = chat_traces.stats()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--chats", type=int, default=1_000_000)
+    parser.add_argument("--turns", type=int, default=3, help="Turns per chat")
+    parser.add_argument("--max-sessions", type=int, default=10000)
+    parser.add_argument("--ttl", type=float, default=3600)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    results = [
+        run("dict", lambda: ({}, {}), args.chats, args.turns),
+        run(
+            "session_store",
+            lambda: (
+                SessionStore(args.max_sessions, args.ttl),
+                SessionStore(args.max_sessions, args.ttl),
+            ),
+            args.chats,
+            args.turns,
+        ),
+    ]
+
+    for result in results:
+        print(
+            f"{result['name']:<14} sessions={result['sessions']:<8} "
+            f"memory={result['memory_mb']}MB peak={result['peak_mb']}MB "
+            f"{result['us_per_turn']}us/turn"
+        )
+    print(f"evictions: {results[1]['stats']['evictions']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
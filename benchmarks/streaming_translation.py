@@ -0,0 +1,265 @@
+"""
+Test and benchmark of streamed translation through the server's filter
+`stream` hook.
+
+Starts the fake upstream (emitting sentences), the LibreTranslate stand-in
+and a Pipelines server with `libretranslate_filter_pipeline` and
+`libretranslate_stream_filter_pipeline`, then streams `--requests`
+completions twice:
+
+- before: the stream filter is disconnected, and the assistant message is
+  translated by the outlet filter once the stream has finished, as Open
+  WebUI does after a completion;
+- after: the stream filter translates each sentence while the completion
+  streams.
+
+It checks that every sentence of the streamed message was translated, and
+reports the time until the first translated text reaches the client and
+until the message is complete.
+
+Usage:
+    python -m benchmarks.streaming_translation --requests 5 --translate-latency-ms 100
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+import aiohttp
+from aiohttp import web
+
+from benchmarks.fake_libretranslate import FakeLibreTranslate, fake_translate
+from benchmarks.fake_upstream import FakeUpstream
+from benchmarks.run import (
+    BENCH_API_KEY,
+    PIPE_ID,
+    ROOT_DIR,
+    free_port,
+    prepare_pipelines_dir,
+    wait_for,
+)
+
+sys.path.insert(0, ROOT_DIR)
+from utils.pipelines.translation import SENTENCE_SEPARATOR  # noqa: E402
+
+OUTLET_FILTER_ID = "libretranslate_filter_pipeline"
+STREAM_FILTER_ID = "libretranslate_stream_filter_pipeline"
+
+
+def serve_in_thread(app: web.Application) -> str:
+    port = free_port()
+    loop = asyncio.new_event_loop()
+    started = threading.Event()
+
+    async def serve():
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", port).start()
+        started.set()
+
+    def run_loop():
+        loop.run_until_complete(serve())
+        loop.run_forever()
+
+    threading.Thread(target=run_loop, daemon=True).start()
+    started.wait()
+    return f"http://127.0.0.1:{port}"
+
+
+def start_server(upstream_url: str, translate_url: str):
+    pipelines_dir = prepare_pipelines_dir(
+        [
+            os.path.join(ROOT_DIR, "examples", "filters", f"{OUTLET_FILTER_ID}.py"),
+            os.path.join(ROOT_DIR, "examples", "filters", f"{STREAM_FILTER_ID}.py"),
+        ]
+    )
+    port = free_port()
+    env = {
+        **os.environ,
+        "PIPELINES_DIR": pipelines_dir,
+        "PIPELINES_API_KEY": BENCH_API_KEY,
+        "BENCH_UPSTREAM_URL": f"{upstream_url}/v1",
+        "LIBRETRANSLATE_API_BASE_URL": translate_url,
+        "GLOBAL_LOG_LEVEL": "WARNING",
+    }
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "main:app",
+            "--host",
+            "127.0.0.1",
+            "--port",
+            str(port),
+            "--log-level",
+            "warning",
+            "--no-access-log",
+        ],
+        cwd=ROOT_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+    )
+    wait_for(f"http://127.0.0.1:{port}/")
+    return server, f"http://127.0.0.1:{port}"
+
+
+async def update_valves(session, base_url: str, pipeline_id: str, **changes):
+    async with session.get(f"{base_url}/{pipeline_id}/valves") as r:
+        r.raise_for_status()
+        valves = await r.json()
+    async with session.post(
+        f"{base_url}/{pipeline_id}/valves/update", json={**valves, **changes}
+    ) as r:
+        r.raise_for_status()
+
+
+async def stream_completion(session, base_url: str):
+    """Returns the streamed content and when its first text and end arrived."""
+    body = {
+        "model": PIPE_ID,
+        "stream": True,
+        "messages": [{"role": "user", "content": "Tell me a story"}],
+    }
+    started_at = time.perf_counter()
+    first_text_at = None
+    content = []
+    async with session.post(f"{base_url}/v1/chat/completions", json=body) as r:
+        r.raise_for_status()
+        async for line in r.content:
+            line = line.decode("utf-8").strip()
+            if not line.startswith("data:") or line == "data: [DONE]":
+                continue
+            delta = json.loads(line[len("data:") :])["choices"][0]["delta"]
+            if delta.get("content"):
+                first_text_at = first_text_at or time.perf_counter()
+                content.append(delta["content"])
+    return "".join(content), first_text_at - started_at, time.perf_counter() - started_at
+
+
+async def before(session, base_url: str):
+    text, _, stream_s = await stream_completion(session, base_url)
+    outlet_started_at = time.perf_counter()
+    payload = {
+        "body": {
+            "model": PIPE_ID,
+            "messages": [
+                {"role": "user", "content": "Tell me a story"},
+                {"role": "assistant", "content": text},
+            ],
+        },
+        "user": {"id": "bench-user", "role": "user"},
+    }
+    async with session.post(
+        f"{base_url}/{OUTLET_FILTER_ID}/filter/outlet", json=payload
+    ) as r:
+        r.raise_for_status()
+        await r.json()
+    total_s = stream_s + time.perf_counter() - outlet_started_at
+    # Nothing translated is shown before the outlet returns
+    return total_s, total_s
+
+
+async def after(session, base_url: str, expected: str):
+    text, first_text_s, total_s = await stream_completion(session, base_url)
+    if text != expected:
+        raise AssertionError(f"Unexpected stream translation: {text!r}")
+    return first_text_s, total_s
+
+
+def translate_sentences(text: str, target: str) -> str:
+    parts = SENTENCE_SEPARATOR.split(text)
+    return "".join(
+        fake_translate(part.strip(), target) + part[len(part.rstrip()) :]
+        if i % 2 == 0 and part.strip()
+        else part
+        for i, part in enumerate(parts)
+    )
+
+
+async def benchmark(args, base_url: str, upstream: FakeUpstream):
+    expected = translate_sentences(
+        "".join(upstream.token_text(i) for i in range(upstream.tokens)), "es"
+    )
+
+    results = []
+    headers = {"Authorization": f"Bearer {BENCH_API_KEY}"}
+    async with aiohttp.ClientSession(headers=headers) as session:
+        # The fake upstream repeats the same sentences; without the caches,
+        # every one of them costs a translation round trip
+        await update_valves(session, base_url, OUTLET_FILTER_ID, cache_size=0)
+        for name, connected in (("before", False), ("after", True)):
+            await update_valves(
+                session,
+                base_url,
+                STREAM_FILTER_ID,
+                pipelines=["*"] if connected else [],
+                cache_size=0,
+            )
+            first_text, total = [], []
+            for _ in range(args.requests):
+                if connected:
+                    first_text_s, total_s = await after(session, base_url, expected)
+                else:
+                    first_text_s, total_s = await before(session, base_url)
+                first_text.append(first_text_s * 1000)
+                total.append(total_s * 1000)
+            results.append(
+                {
+                    "name": name,
+                    "requests": args.requests,
+                    "first_translated_text_ms": round(statistics.median(first_text), 1),
+                    "complete_ms": round(statistics.median(total), 1),
+                }
+            )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=5)
+    parser.add_argument("--tokens", type=int, default=64)
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--sentence-length", type=int, default=8)
+    parser.add_argument("--translate-latency-ms", type=float, default=100.0)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    upstream = FakeUpstream(
+        ttft_ms=50,
+        tokens=args.tokens,
+        tokens_per_second=args.tokens_per_second,
+        sentence_length=args.sentence_length,
+    )
+    upstream_url = serve_in_thread(upstream.create_app())
+    translate_url = serve_in_thread(
+        FakeLibreTranslate(args.translate_latency_ms).create_app()
+    )
+
+    server, base_url = start_server(upstream_url, translate_url)
+    try:
+        results = asyncio.run(benchmark(args, base_url, upstream))
+    finally:
+        server.terminate()
+        server.wait()
+
+    for result in results:
+        print(
+            f"{result['name']:<7} first_translated_text={result['first_translated_text_ms']}ms "
+            f"complete={result['complete_ms']}ms"
+        )
+    print("translations ok")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
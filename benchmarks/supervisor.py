@@ -0,0 +1,383 @@
+"""
+Test and benchmark of the server processes of `litellm_subprocess_manifold_pipeline`
+and `mlx_manifold_pipeline`, with `benchmarks/fake_model_server.py` standing
+in for `litellm` and `mlx_lm.server`. The fake server takes `--startup-s` to
+start listening, and first writes `--noise-kb` KB to both stdout and stderr.
+It compares two approaches:
+
+- before: the pipelines' previous process handling. The LiteLLM pipeline
+  read the proxy's stderr to the end before its stdout, fetched `/v1/models`
+  on every model list and awaited the proxy's exit when valves were
+  updated. The MLX pipeline slept 5 s after starting its server;
+- after: the pipelines' `ProcessSupervisor`, which drains both pipes, polls
+  a readiness probe and restarts a crashed server, and the model list
+  cached per server process.
+
+For LiteLLM it reports the time until a first successful request (sending
+one every 100 ms until then, and counting the errors), `/v1/models` fetches
+for `--model-lists` model lists, and whether a valve update returns. For
+MLX it reports the time until a first answer, with a server starting in
+`--startup-s` and in 8 s. It then checks that a crashed proxy is restarted,
+and that the model list is fetched again from the new process.
+
+Usage:
+    python -m benchmarks.supervisor --startup-s 1 --noise-kb 256
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import psutil
+import requests
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from examples.pipelines.providers.litellm_subprocess_manifold_pipeline import (  # noqa: E402
+    Pipeline as LiteLLMPipeline,
+)
+from examples.pipelines.providers.mlx_manifold_pipeline import (  # noqa: E402
+    Pipeline as MLXPipeline,
+)
+
+FAKE_SERVER_PATH = os.path.join(ROOT_DIR, "benchmarks", "fake_model_server.py")
+BODY = {"user": {"name": "benchmark", "id": "benchmark"}, "stream": False}
+MESSAGES = [{"role": "user", "content": "Hello"}]
+
+
+class PreviousLiteLLMPipeline(LiteLLMPipeline):
+    """The LiteLLM pipeline's previous process handling, kept for comparison."""
+
+    processes: list = []
+
+    async def on_startup(self):
+        self.processes = []
+        with open(self.valves.LITELLM_CONFIG_DIR, "r") as file:
+            import yaml
+
+            self.valves.litellm_config = yaml.safe_load(file)
+        asyncio.create_task(self.start_litellm_background())
+
+    async def run_background_process(self, command):
+        process = await asyncio.create_subprocess_exec(
+            *command,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        self.background_process = process
+        self.processes.append(process)
+        stderr_output = await process.stderr.read()
+        stderr_text = stderr_output.decode().strip()
+        if stderr_text:
+            print(f"Subprocess STDERR: {stderr_text}")
+        async for line in process.stdout:
+            print(line.decode().strip())
+        await process.wait()
+
+    async def start_litellm_background(self):
+        await self.run_background_process(
+            [
+                "litellm",
+                "--port",
+                str(self.valves.LITELLM_PROXY_PORT),
+                "--host",
+                self.valves.LITELLM_PROXY_HOST,
+                "--telemetry",
+                "False",
+                "--config",
+                self.valves.LITELLM_CONFIG_DIR,
+            ]
+        )
+
+    async def shutdown_litellm_background(self):
+        if self.background_process:
+            self.background_process.terminate()
+            await self.background_process.wait()
+            self.background_process = None
+
+    def get_litellm_models(self):
+        try:
+            r = requests.get(f"{self.get_litellm_url()}/v1/models")
+            return [{"id": m["id"], "name": m["id"]} for m in r.json()["data"]]
+        except Exception:
+            return [{"id": "error", "name": "Could not fetch models from LiteLLM"}]
+
+    def pipe(self, user_message, model_id, messages, body):
+        try:
+            r = requests.post(
+                url=f"{self.get_litellm_url()}/v1/chat/completions",
+                json={**body, "model": model_id, "user": body["user"]["id"]},
+            )
+            r.raise_for_status()
+            return r.json()
+        except Exception as e:
+            return f"Error: {e}"
+
+
+class PreviousMLXPipeline(MLXPipeline):
+    """The MLX pipeline's previous server handling, kept for comparison."""
+
+    def __init__(self):
+        self.current_model = None
+        self.server_process = None
+        self.port = None
+        super().__init__()
+
+    def start_mlx_server(self, model_name):
+        model_id = f"mlx.{model_name.split('/')[-1].lower()}"
+        if self.current_model == model_id and self.server_process:
+            return
+        self.stop_mlx_server()
+        self.port = find_free_port()
+        command = ["mlx_lm.server", "--model", model_name, "--port", str(self.port)]
+        self.server_process = subprocess.Popen(command)
+        self.current_model = model_id
+        time.sleep(5)
+
+    def stop_mlx_server(self):
+        if self.server_process:
+            try:
+                process = psutil.Process(self.server_process.pid)
+                process.terminate()
+                process.wait(timeout=10)
+            except psutil.NoSuchProcess:
+                pass
+            self.server_process = None
+            self.current_model = None
+            self.port = None
+
+    def pipe(self, user_message, model_id, messages, body):
+        if model_id != self.current_model:
+            self.start_mlx_server(self.valves.MLX_DEFAULT_MODEL)
+        try:
+            r = requests.post(
+                f"http://{self.host}:{self.port}/v1/chat/completions",
+                json={"messages": messages, "stop": self.stop_sequence},
+            )
+            r.raise_for_status()
+            return r.json()
+        except Exception as e:
+            return f"Error: {e}"
+
+
+def seconds(value, missing: str) -> str:
+    return missing if value is None else f"{value}s"
+
+
+def find_free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def install_fake_servers(bin_dir: str):
+    """Puts `litellm` and `mlx_lm.server` running the fake server first on PATH."""
+    for name in ("litellm", "mlx_lm.server"):
+        path = os.path.join(bin_dir, name)
+        with open(path, "w") as f:
+            f.write(f'#!/bin/sh\nexec "{sys.executable}" "{FAKE_SERVER_PATH}" "$@"\n')
+        os.chmod(path, 0o755)
+    os.environ["PATH"] = bin_dir + os.pathsep + os.environ["PATH"]
+
+
+def kill_children():
+    for process in psutil.Process().children(recursive=True):
+        with contextlib.suppress(psutil.NoSuchProcess):
+            process.kill()
+
+
+def configure_fake_server(startup_s: float, noise_kb: int = 0, crash_after_s: float = 0):
+    os.environ["FAKE_SERVER_STARTUP_S"] = str(startup_s)
+    os.environ["FAKE_SERVER_NOISE_KB"] = str(noise_kb)
+    os.environ["FAKE_SERVER_CRASH_AFTER_S"] = str(crash_after_s)
+
+
+async def first_success(pipe, deadline_s: float):
+    """Calls `pipe` every 100 ms until it answers; returns seconds and errors."""
+    started_at = time.perf_counter()
+    errors = 0
+    while time.perf_counter() - started_at < deadline_s:
+        answer = await asyncio.to_thread(pipe)
+        if not isinstance(answer, str):
+            return round(time.perf_counter() - started_at, 2), errors
+        errors += 1
+        await asyncio.sleep(0.1)
+    return None, errors
+
+
+async def run_litellm(name: str, cls, config_path: str, args) -> dict:
+    pipeline = cls()
+    pipeline.valves.LITELLM_CONFIG_DIR = config_path
+    pipeline.valves.LITELLM_PROXY_PORT = find_free_port()
+    pipeline.valves.LITELLM_READY_TIMEOUT = args.timeout
+    configure_fake_server(args.startup_s, args.noise_kb)
+
+    started_at = time.perf_counter()
+    await pipeline.on_startup()
+    startup_s = round(time.perf_counter() - started_at, 2)
+
+    ready_s, errors = await first_success(
+        lambda: pipeline.pipe("Hello", "fake-model", MESSAGES, BODY), args.timeout
+    )
+
+    fetches = None
+    if ready_s is not None:
+        for _ in range(args.model_lists):
+            await asyncio.to_thread(pipeline.pipelines)
+        stats = requests.get(f"{pipeline.get_litellm_url()}/stats", timeout=5).json()
+        fetches = stats["models_requests"]
+
+    started_at = time.perf_counter()
+    try:
+        await asyncio.wait_for(pipeline.on_valves_updated(), args.timeout)
+        valves_update_s = round(time.perf_counter() - started_at, 2)
+    except asyncio.TimeoutError:
+        valves_update_s = None
+
+    with contextlib.suppress(Exception):
+        await asyncio.wait_for(pipeline.on_shutdown(), 10)
+    kill_children()
+    # Reaps the previous pipeline's processes and closes their pipes, which
+    # its cancelled readers left open, before the event loop closes
+    for process in getattr(pipeline, "processes", []):
+        await process.wait()
+        process._transport.close()
+    return {
+        "name": name,
+        "startup_s": startup_s,
+        "first_answer_s": ready_s,
+        "errors": errors,
+        "models_fetches": fetches,
+        "valves_update_s": valves_update_s,
+    }
+
+
+def run_mlx(name: str, cls, startup_s: float) -> dict:
+    configure_fake_server(startup_s)
+    started_at = time.perf_counter()
+    pipeline = cls()
+    model_id = pipeline.models[0]["id"]
+    answer = pipeline.pipe("Hello", model_id, MESSAGES, BODY)
+    first_answer_s = round(time.perf_counter() - started_at, 2)
+    pipeline.stop_mlx_server()
+    kill_children()
+    return {
+        "name": name,
+        "startup_s": startup_s,
+        "first_answer_s": first_answer_s,
+        "ok": not isinstance(answer, str),
+    }
+
+
+async def check_restart(config_path: str, args) -> dict:
+    pipeline = LiteLLMPipeline()
+    pipeline.valves.LITELLM_CONFIG_DIR = config_path
+    pipeline.valves.LITELLM_PROXY_PORT = find_free_port()
+    configure_fake_server(0.2, args.noise_kb, crash_after_s=1.5)
+    await pipeline.on_startup()
+    supervisor = pipeline.background_process
+    try:
+        if not await asyncio.to_thread(supervisor.wait_ready, args.timeout):
+            raise AssertionError("The proxy did not get ready")
+        if not await asyncio.to_thread(pipeline.pipelines):
+            raise AssertionError("No models from the first proxy")
+
+        # Crashes after 1.5 s, and is restarted after a 1 s backoff
+        started_at = time.perf_counter()
+        while supervisor.generation < 2 or not supervisor.ready.is_set():
+            if time.perf_counter() - started_at > args.timeout:
+                raise AssertionError(f"The proxy was not restarted: {supervisor.stats()}")
+            await asyncio.sleep(0.05)
+        restart_s = round(time.perf_counter() - started_at, 2)
+
+        models = await asyncio.to_thread(pipeline.pipelines)
+        url = f"{pipeline.get_litellm_url()}/stats"
+        fetches = requests.get(url, timeout=5).json()["models_requests"]
+        if not models or fetches != 1:
+            raise AssertionError("The model list was not fetched from the new proxy")
+        stats = supervisor.stats()
+        if stats["last_returncode"] != 1 or stats["restarts"] < 1:
+            raise AssertionError(f"Unexpected supervisor stats {stats}")
+        log_lines = len(supervisor.logs.tail())
+    finally:
+        await pipeline.on_shutdown()
+        kill_children()
+    return {"restart_s": restart_s, "supervisor": stats, "log_lines": log_lines}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--startup-s", type=float, default=1.0)
+    parser.add_argument("--noise-kb", type=int, default=256)
+    parser.add_argument("--model-lists", type=int, default=50)
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    install_fake_servers(work_dir)
+    config_path = os.path.join(work_dir, "config.yaml")
+    with open(config_path, "w") as f:
+        f.write("model_list: []\n")
+
+    try:
+        # Silence the pipelines' logging
+        with contextlib.redirect_stdout(io.StringIO()):
+            litellm = [
+                asyncio.run(
+                    run_litellm("before", PreviousLiteLLMPipeline, config_path, args)
+                ),
+                asyncio.run(run_litellm("after", LiteLLMPipeline, config_path, args)),
+            ]
+            mlx = [
+                run_mlx(name, cls, startup_s)
+                for startup_s in (args.startup_s, 8.0)
+                for name, cls in (("before", PreviousMLXPipeline), ("after", MLXPipeline))
+            ]
+            restart = asyncio.run(check_restart(config_path, args))
+    finally:
+        kill_children()
+        shutil.rmtree(work_dir)
+
+    for result in litellm:
+        print(
+            f"litellm {result['name']:<7} startup={result['startup_s']}s "
+            f"first_answer={seconds(result['first_answer_s'], 'never')} "
+            f"errors={result['errors']} models_fetches={result['models_fetches']} "
+            f"valves_update={seconds(result['valves_update_s'], 'hung')}"
+        )
+    for result in mlx:
+        print(
+            f"mlx     {result['name']:<7} server_startup={result['startup_s']}s "
+            f"first_answer={result['first_answer_s']}s ok={result['ok']}"
+        )
+    print(
+        f"restarted after a crash in {restart['restart_s']}s, "
+        f"log ring {restart['log_lines']} lines, {restart['supervisor']}"
+    )
+
+    after = litellm[1]
+    if after["first_answer_s"] is None or after["errors"]:
+        raise AssertionError("The supervised proxy did not answer")
+    if after["valves_update_s"] is None:
+        raise AssertionError("The valve update did not return")
+    if not all(result["ok"] for result in mlx if result["name"] == "after"):
+        raise AssertionError("The supervised MLX server did not answer")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"litellm": litellm, "mlx": mlx, "restart": restart}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+"""
+Test and benchmark of `text_to_sql_pipeline` against a local SQLite database.
+
+Creates an `orders` table with `--rows` rows and sends `--requests`
+questions, drawn from a few questions asked with varying case, spacing and
+punctuation, to the pipeline's `pipe` from `--concurrency` threads, as the
+server's thread pool does. A fake LLM takes `--sql-ms` to write the SQL of a
+question and `--answer-ms` to start answering from its result. It compares
+two approaches:
+
+- before: the pipeline's previous `pipe`, which built the SQL database
+  (reflecting the schema), the LLM client, the prompt and the query engine
+  on every request;
+- after: the pipeline's `pipe`, which builds them once, reuses pooled
+  connections and the SQL generated for questions it has seen.
+
+It reports wall time, mean latency, LLM calls writing SQL and schema
+reflection queries, and checks that both return the same answers.
+
+Usage:
+    python -m benchmarks.text_to_sql --requests 200 --concurrency 8
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from llama_index.core import PromptTemplate, SQLDatabase  # noqa: E402
+from llama_index.core.llms import (  # noqa: E402
+    CompletionResponse,
+    CustomLLM,
+    LLMMetadata,
+)
+from llama_index.core.query_engine import NLSQLTableQueryEngine  # noqa: E402
+from llama_index.llms.ollama import Ollama  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+from examples.pipelines.rag.text_to_sql_pipeline import (  # noqa: E402
+    TEXT_TO_SQL_PROMPT,
+    Pipeline,
+    normalize_question,
+)
+
+QUESTIONS = {
+    "How many orders are there?": "SELECT COUNT(*) FROM orders",
+    "What is the total amount per region?": (
+        "SELECT region, ROUND(SUM(amount), 2) FROM orders GROUP BY region ORDER BY region"
+    ),
+    "Who are the top 5 customers by amount?": (
+        "SELECT customer, ROUND(SUM(amount), 2) AS total FROM orders "
+        "GROUP BY customer ORDER BY total DESC LIMIT 5"
+    ),
+    "What is the average order amount?": "SELECT ROUND(AVG(amount), 2) FROM orders",
+    "Which region has the most orders?": (
+        "SELECT region, COUNT(*) AS n FROM orders GROUP BY region ORDER BY n DESC LIMIT 1"
+    ),
+    "How many orders did customer 7 place?": (
+        "SELECT COUNT(*) FROM orders WHERE customer = 'customer 7'"
+    ),
+}
+SQL_BY_QUESTION = {normalize_question(q): sql for q, sql in QUESTIONS.items()}
+
+
+def ask_variant(rng: random.Random, question: str) -> str:
+    variants = [
+        question,
+        question.lower(),
+        question.rstrip("?"),
+        "  " + question.replace(" ", "  ") + " ",
+        question.upper(),
+    ]
+    return rng.choice(variants)
+
+
+class FakeLLM(CustomLLM):
+    """Writes the SQL of the known questions and answers with the SQL result."""
+
+    sql_latency: float = 0.0
+    answer_latency: float = 0.0
+    sql_calls: int = 0
+    lock: Any = None
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(context_window=30000, num_output=256)
+
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        if "SQL Response:" in prompt:
+            time.sleep(self.answer_latency)
+            context = prompt.split("SQL Response:")[-1].split("Response:")[0]
+            return CompletionResponse(text=f"Answer: {context.strip()}")
+
+        with self.lock:
+            self.sql_calls += 1
+        time.sleep(self.sql_latency)
+        question = prompt.split("Question:")[-1].split("\n")[0]
+        sql = SQL_BY_QUESTION.get(normalize_question(question), "SELECT 1")
+        return CompletionResponse(text=f"{sql}\nSQLResult:")
+
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        text = self.complete(prompt).text
+        tokens = text.split(" ")
+        for i, token in enumerate(tokens):
+            delta = token if i == 0 else f" {token}"
+            yield CompletionResponse(text=" ".join(tokens[: i + 1]), delta=delta)
+
+
+class BenchmarkPipeline(Pipeline):
+    def __init__(self, llm: FakeLLM, db_url: str, table: str):
+        super().__init__()
+        self.llm = llm
+        self.valves.DB_URL = db_url
+        self.valves.DB_TABLE = table
+
+    def init_llm(self):
+        return self.llm
+
+
+class PreviousPipeline(BenchmarkPipeline):
+    """The pipeline's previous `pipe`, kept for comparison."""
+
+    def init_db_connection(self):
+        from sqlalchemy import create_engine
+
+        self.engine = create_engine(self.valves.DB_URL)
+        return self.engine
+
+    def pipe(self, user_message, model_id, messages, body):
+        sql_database = SQLDatabase(self.engine, include_tables=[self.valves.DB_TABLE])
+        # Built and thrown away, as the previous pipe built the client it used
+        Ollama(
+            model=self.valves.TEXT_TO_SQL_MODEL,
+            base_url=self.valves.OLLAMA_HOST,
+            request_timeout=180.0,
+            context_window=30000,
+        )
+        text_to_sql_template = PromptTemplate(TEXT_TO_SQL_PROMPT)
+        query_engine = NLSQLTableQueryEngine(
+            sql_database=sql_database,
+            tables=[self.valves.DB_TABLE],
+            llm=self.init_llm(),
+            embed_model="local",
+            text_to_sql_prompt=text_to_sql_template,
+            streaming=True,
+        )
+        response = query_engine.query(user_message)
+        return response.response_gen
+
+
+def create_database(path: str, rows: int):
+    rng = random.Random(0)
+    connection = sqlite3.connect(path)
+    connection.execute(
+        "CREATE TABLE orders (id INTEGER PRIMARY KEY, customer TEXT, "
+        "region TEXT, amount REAL, created TEXT)"
+    )
+    connection.executemany(
+        "INSERT INTO orders VALUES (?, ?, ?, ?, ?)",
+        [
+            (
+                n,
+                f"customer {rng.randrange(50)}",
+                rng.choice(["north", "south", "east", "west"]),
+                round(rng.uniform(5, 500), 2),
+                f"2024-{rng.randrange(1, 13):02d}-{rng.randrange(1, 29):02d}",
+            )
+            for n in range(rows)
+        ],
+    )
+    connection.commit()
+    connection.close()
+
+
+def run(name: str, pipeline: Pipeline, llm: FakeLLM, args) -> dict:
+    asyncio.run(pipeline.on_startup())
+    reflections = 0
+
+    def count_reflection(conn, cursor, statement, *_):
+        nonlocal reflections
+        if statement.lstrip().upper().startswith("PRAGMA"):
+            reflections += 1
+
+    event.listen(pipeline.engine, "before_cursor_execute", count_reflection)
+
+    rng = random.Random(1)
+    questions = [
+        ask_variant(rng, rng.choice(list(QUESTIONS))) for _ in range(args.requests)
+    ]
+    latencies = []
+    answers = {}
+
+    def request(question: str):
+        started_at = time.perf_counter()
+        answer = "".join(pipeline.pipe(question, "text-to-sql", [], {}))
+        latencies.append((time.perf_counter() - started_at) * 1000)
+        answers.setdefault(normalize_question(question), set()).add(answer)
+
+    started_at = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as executor:
+        list(executor.map(request, questions))
+    duration = time.perf_counter() - started_at
+    asyncio.run(pipeline.on_shutdown())
+
+    return {
+        "name": name,
+        "requests": len(questions),
+        "duration_s": round(duration, 2),
+        "mean_ms": round(sum(latencies) / len(latencies), 1),
+        "sql_llm_calls": llm.sql_calls,
+        "reflection_queries": reflections,
+        "answers": {question: sorted(a) for question, a in answers.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--sql-ms", type=float, default=300.0)
+    parser.add_argument("--answer-ms", type=float, default=100.0)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    db_url = f"sqlite:///{os.path.join(work_dir, 'orders.db')}"
+    create_database(os.path.join(work_dir, "orders.db"), args.rows)
+
+    def new_llm() -> FakeLLM:
+        return FakeLLM(
+            sql_latency=args.sql_ms / 1000,
+            answer_latency=args.answer_ms / 1000,
+            lock=threading.Lock(),
+        )
+
+    try:
+        # Silence the pipeline's logging
+        with contextlib.redirect_stdout(io.StringIO()):
+            llm = new_llm()
+            before = run("before", PreviousPipeline(llm, db_url, "orders"), llm, args)
+            llm = new_llm()
+            after = run("after", BenchmarkPipeline(llm, db_url, "orders"), llm, args)
+    finally:
+        shutil.rmtree(work_dir)
+
+    results = [before, after]
+    for result in results:
+        print(
+            f"{result['name']:<7} requests={result['requests']} "
+            f"duration={result['duration_s']}s mean={result['mean_ms']}ms "
+            f"sql_llm_calls={result['sql_llm_calls']} "
+            f"reflection_queries={result['reflection_queries']}"
+        )
+
+    for question, answers in after["answers"].items():
+        if len(answers) != 1 or answers != before["answers"][question]:
+            raise AssertionError(f"Different answers to {question!r}: {answers}")
+        if "Error" in answers[0]:
+            raise AssertionError(f"Failed query for {question!r}: {answers[0]}")
+    print("same answers")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Benchmark of the prompt token estimation used by `token_quota_filter_pipeline`.
+
+Simulates conversations where every turn resends the whole history, as chat
+clients do, and compares tokenizing every message on every turn with the
+cached `TokenEstimator`, which only tokenizes messages it has not seen.
+
+Requires tiktoken. With `--offline`, a byte-level encoding built locally
+with the cl100k pattern replaces the downloaded vocabulary: token counts
+differ from the real encoding but the regex split and BPE work per token
+are comparable.
+
+Usage:
+    python -m benchmarks.tokenizer --turns 200 --words 300 --conversations 5
+"""
+
+import argparse
+import json
+import random
+import time
+
+from utils.pipelines.tokens import (
+    TOKENS_PER_MESSAGE,
+    TOKENS_PER_REPLY,
+    TokenEstimator,
+    get_message_text,
+)
+
+
+WORDS = (
+    "the model returns a streamed response with tokens usage latency budget "
+    "quota request user assistant system message history context window "
+    "pipeline filter valve inlet outlet estimate cache benchmark python"
+).split()
+
+
+def conversation(rng, turns, words):
+    messages = [{"role": "system", "content": "You are a helpful assistant."}]
+    for turn in range(turns):
+        role = "user" if turn % 2 == 0 else "assistant"
+        content = " ".join(rng.choice(WORDS) for _ in range(words))
+        messages.append({"role": role, "content": f"{turn}: {content}"})
+    return messages
+
+
+# Pre-tokenization pattern of the cl100k_base encoding
+CL100K_PATTERN = (
+    r"""'(?i:[sdmt]|ll|ve|re)|[^\r\n\p{L}\p{N}]?+\p{L}++|\p{N}{1,3}+|"""
+    r""" ?[^\s\p{L}\p{N}]++[\r\n]*+|\s++$|\s*[\r\n]|\s+(?!\S)|\s"""
+)
+
+
+def offline_encoding():
+    import tiktoken
+
+    return tiktoken.Encoding(
+        name="cl100k_base_bytes",
+        pat_str=CL100K_PATTERN,
+        mergeable_ranks={bytes([i]): i for i in range(256)},
+        special_tokens={},
+    )
+
+
+def uncached_count(estimator, messages):
+    return TOKENS_PER_REPLY + sum(
+        TOKENS_PER_MESSAGE + estimator.tokenize_count(get_message_text(message))
+        for message in messages
+    )
+
+
+def run(name, count, histories):
+    latencies = []
+    total_tokens = 0
+    for messages in histories:
+        # Turn n sends the first n messages
+        for n in range(2, len(messages) + 1, 2):
+            started_at = time.perf_counter()
+            total_tokens += count(messages[:n])
+            latencies.append((time.perf_counter() - started_at) * 1000)
+
+    return {
+        "name": name,
+        "requests": len(latencies),
+        "total_ms": round(sum(latencies), 2),
+        "mean_ms": round(sum(latencies) / len(latencies), 4),
+        "last_turn_ms": round(latencies[-1], 4),
+        "estimated_tokens": total_tokens,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--words", type=int, default=300, help="Words per message")
+    parser.add_argument("--conversations", type=int, default=5)
+    parser.add_argument("--encoding", default="cl100k_base")
+    parser.add_argument(
+        "--offline", action="store_true", help="Use a locally built byte-level encoding"
+    )
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    histories = [
+        conversation(rng, args.turns, args.words) for _ in range(args.conversations)
+    ]
+
+    estimator = TokenEstimator(args.encoding)
+    if args.offline:
+        estimator.encoding = offline_encoding()
+    if estimator.encoding is None:
+        parser.error("tiktoken and its encoding are required, see --offline")
+    backend = estimator.encoding.name
+    results = [
+        run("uncached", lambda messages: uncached_count(estimator, messages), histories),
+        run("cached", estimator.count_messages, histories),
+    ]
+
+    for result in results:
+        print(
+            f"{result['name']:<9} requests={result['requests']:<6} "
+            f"total={result['total_ms']}ms mean={result['mean_ms']}ms "
+            f"last_turn={result['last_turn_ms']}ms tokens={result['estimated_tokens']}"
+        )
+    print(
+        f"backend={backend} cache hits={estimator.hits} misses={estimator.misses} "
+        f"speedup={results[0]['total_ms'] / max(results[1]['total_ms'], 1e-9):.1f}x"
+    )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"backend": backend, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
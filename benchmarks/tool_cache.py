@@ -0,0 +1,142 @@
+"""
+Benchmark of `cached_tool` results in `function_calling_blueprint`.
+
+`--users` users each make `--turns` weather tool calls for cities drawn from
+a small, skewed set, `--concurrency` turns at a time, through the
+blueprint's `call_functions`. The weather tool stands in for an external API
+taking `--api-ms` per call. It compares the tool without and with
+`@cached_tool`, and reports wall time, API calls and the cache's per-tool
+hit ratio.
+
+Usage:
+    python -m benchmarks.tool_cache --users 50 --turns 10 --api-ms 200
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from blueprints.function_calling_blueprint import (  # noqa: E402
+    Pipeline as FunctionCallingBlueprint,
+)
+from utils.pipelines.tools import cached_tool  # noqa: E402
+
+CITIES = ["Paris", "London", "Berlin", "Madrid", "Rome", "Oslo", "Lisbon", "Prague"]
+
+
+class WeatherAPI:
+    def __init__(self, latency_ms: float):
+        self.latency = latency_ms / 1000
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def get(self, location: str, unit: str) -> str:
+        with self.lock:
+            self.calls += 1
+        time.sleep(self.latency)
+        return f"{location}: Sunny, 21°{unit[0].upper()}"
+
+
+def build_tools_class(api: WeatherAPI, cached: bool) -> type:
+    def get_current_weather(self, location: str, unit: str = "metric") -> str:
+        """
+        Get the current weather for a location.
+
+        :param location: The location to get the weather for.
+        :param unit: The unit to get the weather in.
+        """
+        return api.get(location, unit)
+
+    if cached:
+        get_current_weather = cached_tool(ttl=600)(get_current_weather)
+
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+
+    return type(
+        "Tools",
+        (),
+        {"__init__": __init__, "get_current_weather": get_current_weather},
+    )
+
+
+class BenchmarkPipeline(FunctionCallingBlueprint):
+    def __init__(self, tools_class: type):
+        super().__init__()
+        self.tools = tools_class(self)
+
+
+async def run(name: str, cached: bool, args) -> dict:
+    api = WeatherAPI(args.api_ms)
+    pipeline = BenchmarkPipeline(build_tools_class(api, cached))
+    rng = random.Random(0)
+    turns = [
+        rng.choices(CITIES, weights=[2**-i for i in range(len(CITIES))])[0]
+        for _ in range(args.users * args.turns)
+    ]
+    pending = iter(turns)
+
+    async def worker():
+        for city in pending:
+            messages = [{"role": "user", "content": f"Weather in {city}?"}]
+            messages = await pipeline.call_functions(
+                [{"name": "get_current_weather", "parameters": {"location": city}}],
+                messages,
+            )
+            if f"{city}: Sunny" not in messages[0]["content"]:
+                raise AssertionError(f"Missing weather for {city}")
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    duration = time.perf_counter() - started_at
+    await pipeline.on_shutdown()
+
+    return {
+        "name": name,
+        "turns": len(turns),
+        "duration_s": round(duration, 2),
+        "api_calls": api.calls,
+        "cache": pipeline.tool_cache.stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--api-ms", type=float, default=200.0)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    # Silence the blueprint's logging
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = [
+            asyncio.run(run("before", False, args)),
+            asyncio.run(run("after", True, args)),
+        ]
+
+    for result in results:
+        print(
+            f"{result['name']:<7} turns={result['turns']} "
+            f"duration={result['duration_s']}s api_calls={result['api_calls']} "
+            f"cache={result['cache'] or '-'}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Benchmark of the `function_calling_blueprint` inlet with `--tools` tools.
+
+Builds a tools class whose methods take a mix of parameter types (str, int,
+Optional, Literal, List, Dict and nested pydantic models) and runs the
+blueprint's `inlet` `--requests` times, with the task model call replaced
+by a stub that records the prompt. It compares two approaches:
+
+- before: the tool specs are reflected and dumped into the prompt on every
+  inlet, as the blueprint did (the compiler's cache is cleared before each
+  call);
+- after: the blueprint's `ToolSpecCompiler`, which builds the specs and the
+  prompt once per tools class.
+
+It checks that both produce the same prompt.
+
+Usage:
+    python -m benchmarks.tool_specs --tools 30 --requests 2000
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from blueprints.function_calling_blueprint import (  # noqa: E402
+    Pipeline as FunctionCallingBlueprint,
+)
+
+TOOL_TEMPLATE = '''
+def tool_{n}(
+    self,
+    query: str,
+    limit: int = 10,
+    threshold: Optional[float] = None,
+    mode: Literal["fast", "accurate"] = "fast",
+    tags: List[str] = [],
+    weights: Dict[str, float] = {{}},
+    address: Optional[Address] = None,
+) -> str:
+    """
+    Tool number {n}, which looks up records matching a query
+    and returns a summary of them.
+
+    :param query: The text to look for.
+    :param limit: The maximum number of records.
+    :param threshold: The minimum score of a record.
+    :param mode: Whether to favour speed or accuracy.
+    :param tags: Tags the records must have.
+    :param weights: Weight of each field in the score.
+    :param address: Only return records near this address.
+    :return: A summary of the matching records.
+    """
+    return f"{{query}}: {n}"
+'''
+
+
+def build_tools_class(count: int) -> type:
+    from typing import Dict, List, Literal, Optional
+    from pydantic import BaseModel, Field
+
+    class Address(BaseModel):
+        street: str = Field(description="Street and number")
+        city: str
+        country: Optional[str] = None
+
+    namespace = {
+        "Address": Address,
+        "Dict": Dict,
+        "List": List,
+        "Literal": Literal,
+        "Optional": Optional,
+    }
+    methods = {}
+    for n in range(count):
+        exec(TOOL_TEMPLATE.format(n=n), namespace, methods)
+
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+
+    return type("Tools", (), {"__init__": __init__, **methods})
+
+
+class BenchmarkPipeline(FunctionCallingBlueprint):
+    def __init__(self, tools_class: type):
+        super().__init__()
+        self.valves.TOOL_CALLING = "prompt"
+        self.tools = tools_class(self)
+        self.prompts = []
+
+    async def run_completion(self, system_prompt: str, content: str) -> dict:
+        # Stands in for the task model, which picks no tool
+        self.prompts.append(system_prompt)
+        return {}
+
+
+def body(n: int) -> dict:
+    return {
+        "model": "llama3",
+        "messages": [
+            {"role": "user", "content": "Hello"},
+            {"role": "assistant", "content": "Hi, how can I help?"},
+            {"role": "user", "content": f"Look up record {n}"},
+        ],
+    }
+
+
+def run(name: str, pipeline: BenchmarkPipeline, requests: int, cached: bool) -> dict:
+    latencies = []
+    for n in range(requests):
+        if not cached:
+            pipeline.tool_specs.clear()
+        started_at = time.perf_counter()
+        asyncio.run(pipeline.inlet(body(n), {"id": "bench-user"}))
+        latencies.append((time.perf_counter() - started_at) * 1000)
+
+    return {
+        "name": name,
+        "requests": requests,
+        "mean_ms": round(sum(latencies) / len(latencies), 3),
+        "prompt_chars": len(pipeline.prompts[-1]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--tools", type=int, default=30)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    tools_class = build_tools_class(args.tools)
+    before_pipeline = BenchmarkPipeline(tools_class)
+    after_pipeline = BenchmarkPipeline(tools_class)
+
+    # Silence the blueprint's request logging
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = [
+            run("before", before_pipeline, args.requests, cached=False),
+            run("after", after_pipeline, args.requests, cached=True),
+        ]
+
+    for result in results:
+        print(
+            f"{result['name']:<7} mean={result['mean_ms']}ms "
+            f"prompt_chars={result['prompt_chars']}"
+        )
+    same = set(before_pipeline.prompts) == set(after_pipeline.prompts)
+    print(
+        f"same prompts: {same}, "
+        f"speedup: {results[0]['mean_ms'] / results[1]['mean_ms']:.1f}x"
+    )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""
+Test and benchmark of `libretranslate_filter_pipeline` against the local
+LibreTranslate stand-in (`benchmarks.fake_libretranslate`).
+
+Sends `--requests` outlet calls, `--concurrency` at a time, whose assistant
+messages mix unique paragraphs with boilerplate ones repeated across
+answers. It compares two approaches:
+
+- before: one blocking `requests.post` per message on the event loop, as
+  the filter did;
+- after: the filter's `TranslationService`, with a pooled async client,
+  a cache and batched `q` values.
+
+It checks that every paragraph of every message was translated, and
+reports wall time, backend requests and cache hits.
+
+Usage:
+    python -m benchmarks.translation --requests 200 --concurrency 32
+"""
+
+import argparse
+import asyncio
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+import requests
+from aiohttp import web
+
+from benchmarks.fake_libretranslate import FakeLibreTranslate, fake_translate
+from benchmarks.run import free_port
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PIPELINE_PATH = os.path.join(
+    ROOT_DIR, "examples", "filters", "libretranslate_filter_pipeline.py"
+)
+
+BOILERPLATE = [
+    "I hope this helps!",
+    "Let me know if you have any other questions.",
+    "Here is a summary of the main points:",
+]
+
+
+def load_pipeline(url: str):
+    sys.path.insert(0, ROOT_DIR)
+    spec = importlib.util.spec_from_file_location(
+        "libretranslate_filter_pipeline", PIPELINE_PATH
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    pipeline = module.Pipeline()
+    pipeline.valves.libretranslate_url = url
+    pipeline.translator = pipeline.create_translator()
+    return pipeline
+
+
+def assistant_message(rng: random.Random, n: int) -> str:
+    paragraphs = [rng.choice(BOILERPLATE[2:])]
+    paragraphs += [f"Answer {n}, point {i}: details about the topic." for i in range(3)]
+    paragraphs.append(rng.choice(BOILERPLATE[:2]))
+    return "\n\n".join(paragraphs)
+
+
+def outlet_body(text: str) -> dict:
+    return {
+        "model": "llama3",
+        "messages": [
+            {"role": "user", "content": "Tell me about the topic"},
+            {"role": "assistant", "content": text},
+        ],
+    }
+
+
+def blocking_translate(url: str, text: str, source: str, target: str) -> str:
+    r = requests.post(
+        f"{url}/translate", json={"q": text, "source": source, "target": target}
+    )
+    r.raise_for_status()
+    return r.json()["translatedText"]
+
+
+async def run(translate, texts, concurrency):
+    pending = iter(texts)
+    outputs = {}
+
+    async def worker():
+        for text in pending:
+            outputs[text] = await translate(text)
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return outputs, time.perf_counter() - started_at
+
+
+def start_server(server: FakeLibreTranslate) -> str:
+    """Serves the stand-in from its own thread, as the "before" path blocks
+    the benchmark's event loop."""
+    port = free_port()
+    loop = asyncio.new_event_loop()
+    started = threading.Event()
+
+    async def serve():
+        runner = web.AppRunner(server.create_app())
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", port).start()
+        started.set()
+
+    def run_loop():
+        loop.run_until_complete(serve())
+        loop.run_forever()
+
+    threading.Thread(target=run_loop, daemon=True).start()
+    started.wait()
+    return f"http://127.0.0.1:{port}"
+
+
+async def benchmark(args):
+    server = FakeLibreTranslate(args.latency_ms, args.per_text_ms)
+    url = start_server(server)
+
+    rng = random.Random(0)
+    texts = [assistant_message(rng, n) for n in range(args.requests)]
+    results = []
+
+    async def before(text):
+        return blocking_translate(url, text, "en", "es")
+
+    _, duration = await run(before, texts, args.concurrency)
+    results.append(
+        {
+            "name": "before",
+            "duration_s": round(duration, 2),
+            "backend_requests": server.requests,
+            "backend_texts": server.texts,
+        }
+    )
+
+    server.requests = server.texts = 0
+    pipeline = load_pipeline(url)
+
+    async def after(text):
+        body = await pipeline.outlet(outlet_body(text))
+        return body["messages"][-1]["content"]
+
+    # Silence the filter's message logging
+    with contextlib.redirect_stdout(io.StringIO()):
+        outputs, duration = await run(after, texts, args.concurrency)
+    results.append(
+        {
+            "name": "after",
+            "duration_s": round(duration, 2),
+            "backend_requests": server.requests,
+            "backend_texts": server.texts,
+            "cache": pipeline.translator.stats(),
+        }
+    )
+
+    expected = {
+        text: "\n\n".join(fake_translate(p, "es") for p in text.split("\n\n"))
+        for text in texts
+    }
+    correct = all(outputs[text] == expected[text] for text in texts)
+
+    await pipeline.on_shutdown()
+    return results, correct
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--per-text-ms", type=float, default=1.0)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    results, correct = asyncio.run(benchmark(args))
+    for result in results:
+        print(
+            f"{result['name']:<7} duration={result['duration_s']}s "
+            f"backend_requests={result['backend_requests']} "
+            f"backend_texts={result['backend_texts']} "
+            f"cache={result.get('cache', '-')}"
+        )
+    print("translations ok" if correct else "translations FAILED")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    sys.exit(0 if correct else 1)
+
+
+if __name__ == "__main__":
+    main()
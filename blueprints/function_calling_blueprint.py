@@ -1,15 +1,21 @@
-from typing import List, Optional
+from typing import List, Literal, Optional
 from pydantic import BaseModel
 from schemas import OpenAIChatMessage
+from concurrent.futures import ThreadPoolExecutor
 import os
-import requests
+import aiohttp
+import asyncio
+import functools
+import inspect
 import json
+import re
+import time
 
 from utils.pipelines.main import (
     get_last_user_message,
     add_or_update_system_message,
-    get_tools_specs,
 )
+from utils.pipelines.tools import ToolResultCache, ToolRouter, ToolSpecCompiler
 
 # System prompt for function calling
 DEFAULT_SYSTEM_PROMPT = (
@@ -18,10 +24,22 @@ DEFAULT_SYSTEM_PROMPT = (
 If a function tool doesn't match the query, return an empty string. Else, pick a
 function tool, fill in the parameters from the function tool's schema, and
 return it in the format {{ "name": \"functionName\", "parameters": {{ "key":
-"value" }} }}. Only pick a function if the user asks.  Only return the object. Do not return any other text."
+"value" }} }}. If several function tools are needed, return a JSON list of such objects. Only pick a function if the user asks.  Only return the object. Do not return any other text."
 """
         )
 
+# System prompt for provider-native tool calls, where the tools are sent as `tools`
+# Error messages of servers that do not accept `tools`, e.g. "x does not
+# support tools", "tool_choice requires --enable-auto-tool-choice"
+TOOLS_UNSUPPORTED = re.compile(
+    r"(\btools?\b|tool_choice|function.?call).*"
+    r"(support|enable|require|unrecognized|unknown|not allowed|not permitted|extra)"
+    r"|(support|unrecognized|unknown|extra).*(\btools?\b|tool_choice|function.?call)",
+    re.IGNORECASE | re.DOTALL,
+)
+
+NATIVE_SYSTEM_PROMPT = """Call the tools that are needed to answer the query, if any, calling several at once when they are independent. Only call a tool if the user asks. If no tool matches the query, do not call any."""
+
 class Pipeline:
     class Valves(BaseModel):
         # List target pipeline ids (models) that this filter will be connected to.
@@ -39,6 +57,24 @@ class Pipeline:
         TASK_MODEL: str
         TEMPLATE: str
 
+        # "native" sends the tools to the task model as OpenAI `tools` and reads
+        # its `tool_calls`; "prompt" describes them in the system prompt and
+        # parses JSON; "auto" tries native and falls back to prompt if rejected
+        TOOL_CALLING: Literal["auto", "native", "prompt"] = "auto"
+
+        # Tools run concurrently; sync tools run in a pool of TOOL_WORKERS
+        # threads. A tool that takes longer than TOOL_TIMEOUT seconds is skipped
+        TOOL_TIMEOUT: float = 10.0
+        TOOL_WORKERS: int = 8
+
+        # Skip the task model for messages that share no keyword with any tool
+        # (from their names and docstrings) and match none of their
+        # @tool_patterns. If the pipeline sets an intent_classifier, it gets a
+        # say at PRE_ROUTER_THRESHOLD before a message is skipped. Off by
+        # default: the rules miss tool requests phrased without those words
+        PRE_ROUTER: bool = False
+        PRE_ROUTER_THRESHOLD: float = 0.5
+
     def __init__(self, prompt: str | None = None) -> None:
         # Pipeline filters are only compatible with Open WebUI
         # You can think of filter pipeline as a middleware that can be used to edit the form data before it is sent to the OpenAI API.
@@ -52,6 +88,15 @@ class Pipeline:
         self.name = "Function Calling Blueprint"
         self.prompt = prompt or DEFAULT_SYSTEM_PROMPT
         self.tools: object = None
+        self.tool_specs = ToolSpecCompiler()
+        self.tool_cache = ToolResultCache()
+        self.tool_router: Optional[ToolRouter] = None
+        # Optional local classifier, message -> probability that a tool is needed
+        self.intent_classifier = None
+        self.tool_executor: Optional[ThreadPoolExecutor] = None
+        self.session: Optional[aiohttp.ClientSession] = None
+        # Set to False once the task model rejected native tool calls
+        self.native_tool_calls: Optional[bool] = None
 
         # Initialize valves
         self.valves = self.Valves(
@@ -83,7 +128,52 @@ And answer according to the language of the user's question.""",
     async def on_shutdown(self):
         # This function is called when the server is stopped.
         print(f"on_shutdown:{__name__}")
-        pass
+        if self.tool_cache.stores:
+            print(f"Tool cache: {self.tool_cache.stats()}")
+        if self.tool_router is not None:
+            print(f"Tool router: {self.tool_router.stats()}")
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+        if self.tool_executor is not None:
+            self.tool_executor.shutdown(wait=False)
+            self.tool_executor = None
+
+    async def on_valves_updated(self):
+        # This function is called when the valves are updated.
+        self.tool_specs.clear()
+        # Tool results can depend on valves, e.g. API keys or URLs
+        self.tool_cache.clear()
+        self.tool_router = None
+        self.native_tool_calls = None
+        if self.tool_executor is not None:
+            self.tool_executor.shutdown(wait=False)
+            self.tool_executor = None
+
+    def get_session(self) -> aiohttp.ClientSession:
+        # Created lazily, as the session is bound to the running event loop
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=60)
+            )
+        return self.session
+
+    def get_tool_router(self) -> ToolRouter:
+        if self.tool_router is None:
+            self.tool_router = ToolRouter(
+                self.tools,
+                self.tool_specs.compile(self.tools),
+                classifier=self.intent_classifier,
+                threshold=self.valves.PRE_ROUTER_THRESHOLD,
+            )
+        return self.tool_router
+
+    def get_tool_executor(self) -> ThreadPoolExecutor:
+        if self.tool_executor is None:
+            self.tool_executor = ThreadPoolExecutor(
+                max_workers=self.valves.TOOL_WORKERS, thread_name_prefix="tools"
+            )
+        return self.tool_executor
 
     async def inlet(self, body: dict, user: Optional[dict] = None) -> dict:
         # If title generation is requested, skip the function calling filter
@@ -96,10 +186,6 @@ And answer according to the language of the user's question.""",
         # Get the last user message
         user_message = get_last_user_message(body["messages"])
 
-        # Get the tools specs
-        tools_specs = get_tools_specs(self.tools)
-
-        prompt = self.prompt.format(json.dumps(tools_specs, indent=2))
         content = "History:\n" + "\n".join(
                                 [
                                     f"{message['role']}: {message['content']}"
@@ -107,24 +193,60 @@ And answer according to the language of the user's question.""",
                                 ]
                             ) + f"Query: {user_message}"
 
-        result = self.run_completion(prompt, content)
-        messages = self.call_function(result, body["messages"])
+        # Skip the task model when no tool could apply to the recent user messages
+        if self.valves.PRE_ROUTER:
+            recent = [
+                str(message["content"])
+                for message in body["messages"][::-1][:4]
+                if message["role"] == "user"
+            ]
+            if not self.get_tool_router().plausible("\n".join(recent)):
+                print("No tool plausible, skipping the task model")
+                return body
+
+        started_at = time.perf_counter()
+        tool_calls = await self.get_tool_calls(content)
+        if self.tool_router is not None:
+            self.tool_router.record_task_model_call(time.perf_counter() - started_at)
+        messages = await self.call_functions(tool_calls, body["messages"])
 
         return {**body, "messages": messages}
 
-    # Call the function
-    def call_function(self, result, messages: list[dict]) -> list[dict]:
-        if "name" not in result:
+    async def get_tool_calls(self, content: str) -> List[dict]:
+        """Asks the task model which tools to call, as [{"name", "parameters"}]."""
+        mode = self.valves.TOOL_CALLING
+        if mode == "native" or (mode == "auto" and self.native_tool_calls is not False):
+            tool_calls = await self.run_native_completion(content)
+            if tool_calls is not None:
+                self.native_tool_calls = True
+                return tool_calls
+            if mode == "auto" and self.native_tool_calls is None:
+                print("Native tool calls not supported, falling back to the prompt")
+                self.native_tool_calls = False
+            else:
+                return []
+
+        # Get the prompt with the tools specs, built once per tools class
+        prompt = self.tool_specs.render(self.tools, self.prompt)
+        result = await self.run_completion(prompt, content)
+        return parse_tool_calls(result)
+
+    # Call the functions
+    async def call_functions(
+        self, tool_calls: List[dict], messages: list[dict]
+    ) -> list[dict]:
+        if not tool_calls:
             return messages
 
-        function = getattr(self.tools, result["name"])
-        function_result = None
-        try:
-            function_result = function(**result["parameters"])
-        except Exception as e:
-            print(e)
+        results = await asyncio.gather(
+            *(
+                self.call_function(tool_call["name"], tool_call["parameters"])
+                for tool_call in tool_calls
+            )
+        )
+        function_result = "\n".join(result for result in results if result)
 
-        # Add the function result to the system prompt
+        # Add the function results to the system prompt
         if function_result:
             system_prompt = self.valves.TEMPLATE.replace(
                 "{{CONTEXT}}", function_result
@@ -139,14 +261,114 @@ And answer according to the language of the user's question.""",
 
         return messages
 
-    def run_completion(self, system_prompt: str, content: str) -> dict:
-        r = None
+    async def call_function(self, name: str, parameters: dict) -> Optional[str]:
+        function = getattr(self.tools, name, None)
+        if name.startswith("_") or not callable(function):
+            print(f"Unknown tool: {name}")
+            return None
+
+        # Tools marked with @cached_tool are served from the result cache
+        cache_config = getattr(function, "__tool_cache__", None)
+        if cache_config is not None:
+            return await self.tool_cache.call(
+                name,
+                parameters,
+                cache_config,
+                lambda: self.run_tool(name, function, parameters),
+            )
+        return await self.run_tool(name, function, parameters)
+
+    async def run_tool(self, name: str, function, parameters: dict) -> Optional[str]:
+        try:
+            if inspect.iscoroutinefunction(function):
+                result = function(**parameters)
+            else:
+                result = asyncio.get_running_loop().run_in_executor(
+                    self.get_tool_executor(), functools.partial(function, **parameters)
+                )
+            function_result = await asyncio.wait_for(result, self.valves.TOOL_TIMEOUT)
+        except asyncio.TimeoutError:
+            # A sync tool keeps its thread until it returns
+            print(f"Tool {name} timed out after {self.valves.TOOL_TIMEOUT}s")
+            return None
+        except Exception as e:
+            print(e)
+            return None
+
+        if function_result is None or isinstance(function_result, str):
+            return function_result
+        return json.dumps(function_result)
+
+    async def post_completion(self, payload: dict) -> dict:
+        async with self.get_session().post(
+            f"{self.valves.OPENAI_API_BASE_URL}/chat/completions",
+            json={"model": self.valves.TASK_MODEL, **payload},
+            headers={
+                "Authorization": f"Bearer {self.valves.OPENAI_API_KEY}",
+                "Content-Type": "application/json",
+            },
+        ) as r:
+            if r.status >= 400:
+                # The body, e.g. why the server rejected the request, is kept
+                # in the exception's message
+                text = await r.text()
+                print(f"Error: {r.status} {text}")
+                raise aiohttp.ClientResponseError(
+                    r.request_info,
+                    r.history,
+                    status=r.status,
+                    message=text,
+                    headers=r.headers,
+                )
+            return await r.json()
+
+    async def run_native_completion(self, content: str) -> Optional[List[dict]]:
+        """
+        Returns the tool calls of the task model, or None if it rejected
+        `tools` as unsupported. Other errors only fail this request.
+        """
+        try:
+            response = await self.post_completion(
+                {
+                    "messages": [
+                        {"role": "system", "content": NATIVE_SYSTEM_PROMPT},
+                        {"role": "user", "content": content},
+                    ],
+                    "tools": self.tool_specs.openai_tools(self.tools),
+                    "tool_choice": "auto",
+                }
+            )
+        except aiohttp.ClientResponseError as e:
+            if 400 <= e.status < 500 and TOOLS_UNSUPPORTED.search(e.message or ""):
+                return None
+            print(f"Error: {e}")
+            return []
+        except Exception as e:
+            print(f"Error: {e}")
+            return []
+
+        tool_calls = []
+        message = response["choices"][0]["message"]
+        for tool_call in message.get("tool_calls") or []:
+            try:
+                tool_calls.append(
+                    {
+                        "name": tool_call["function"]["name"],
+                        "parameters": json.loads(
+                            tool_call["function"].get("arguments") or "{}"
+                        ),
+                    }
+                )
+            except (KeyError, ValueError) as e:
+                print(f"Invalid tool call {tool_call}: {e}")
+        print(tool_calls)
+        return tool_calls
+
+    async def run_completion(self, system_prompt: str, content: str) -> dict:
         try:
             # Call the OpenAI API to get the function response
-            r = requests.post(
-                url=f"{self.valves.OPENAI_API_BASE_URL}/chat/completions",
-                json={
-                    "model": self.valves.TASK_MODEL,
+            response = await self.post_completion(
+                {
                     "messages": [
                         {
                             "role": "system",
@@ -159,16 +381,8 @@ And answer according to the language of the user's question.""",
                     ],
                     # TODO: dynamically add response_format?
                     # "response_format": {"type": "json_object"},
-                },
-                headers={
-                    "Authorization": f"Bearer {self.valves.OPENAI_API_KEY}",
-                    "Content-Type": "application/json",
-                },
-                stream=False,
+                }
             )
-            r.raise_for_status()
-
-            response = r.json()
             content = response["choices"][0]["message"]["content"]
 
             # Parse the function response
@@ -180,10 +394,17 @@ And answer according to the language of the user's question.""",
         except Exception as e:
             print(f"Error: {e}")
 
-            if r:
-                try:
-                    print(r.json())
-                except:
-                    pass
-
         return {}
+
+
+def parse_tool_calls(result) -> List[dict]:
+    """Normalizes the JSON returned in prompt mode: one call object or a list."""
+    if isinstance(result, dict):
+        result = result.get("tool_calls", [result])
+    if not isinstance(result, list):
+        return []
+    return [
+        {"name": call["name"], "parameters": call.get("parameters") or {}}
+        for call in result
+        if isinstance(call, dict) and isinstance(call.get("name"), str)
+    ]
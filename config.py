@@ -22,3 +22,20 @@ LOG_LEVELS = {
 
 API_KEY = os.getenv("PIPELINES_API_KEY", "0p3n-w3bu!")
 PIPELINES_DIR = os.getenv("PIPELINES_DIR", "./pipelines")
+
+# Optional capture of sampled request bodies to a JSONL file (disabled when empty)
+REQUEST_CAPTURE_PATH = os.getenv("REQUEST_CAPTURE_PATH", "")
+REQUEST_CAPTURE_SAMPLE_RATE = float(os.getenv("REQUEST_CAPTURE_SAMPLE_RATE", "1.0"))
+REQUEST_CAPTURE_REDACT_MESSAGES = (
+    os.getenv("REQUEST_CAPTURE_REDACT_MESSAGES", "false").lower() == "true"
+)
+
+# Number of uvicorn workers; pipeline changes are broadcast between them when > 1
+PIPELINES_WORKERS = int(os.getenv("PIPELINES_WORKERS", "1"))
+PIPELINES_SYNC_INTERVAL = float(os.getenv("PIPELINES_SYNC_INTERVAL", "1.0"))
+
+# Shared state store for pipelines: memory, sqlite:///path or redis://host:port/db
+PIPELINES_STATE_STORE = os.getenv("PIPELINES_STATE_STORE", "memory")
+
+# JSON file describing backend pools; when set, start.sh runs the router (router.py)
+PIPELINES_ROUTER_CONFIG = os.getenv("PIPELINES_ROUTER_CONFIG", "")
@@ -9,10 +9,14 @@ requirements: ddtrace
 environment_variables: DD_LLMOBS_AGENTLESS_ENABLED, DD_LLMOBS_ENABLED, DD_LLMOBS_APP_NAME, DD_API_KEY, DD_SITE 
 """
 
+from collections import OrderedDict
 from typing import List, Optional
 import os
+import time
 
+from utils.pipelines.export import ExportQueue
 from utils.pipelines.main import get_last_user_message, get_last_assistant_message
+from utils.pipelines.sessions import SessionStore
 from pydantic import BaseModel
 from ddtrace.llmobs import LLMObs
 
@@ -34,6 +38,11 @@ class Pipeline:
         dd_site: str
         ml_app: str
 
+        # Spans whose outlet never came are finished after this many seconds
+        span_timeout: int = 600
+        # Chats with open spans kept in memory; the least recently used are finished
+        max_open_chats: int = 10000
+
     def __init__(self):
         # Pipeline filters are only compatible with Open WebUI
         # You can think of filter pipeline as a middleware that can be used to edit the form data before it is sent to the OpenAI API.
@@ -58,26 +67,35 @@ class Pipeline:
 
         # DataDog LLMOBS docs: https://docs.datadoghq.com/tracing/llm_observability/sdk/
         self.LLMObs = LLMObs()
-        self.llm_span = None
-        self.chat_generations = {}
-        pass
+        # chat_id -> {message_id: open span}, oldest first. Only accessed
+        # from the event loop, so inlet and outlet need no locking.
+        self.spans = SessionStore(
+            self.valves.max_open_chats,
+            self.valves.span_timeout,
+            on_evict=self.evict_spans,
+        )
+
+        # Spans are finished and flushed in batches on a background thread
+        self.export_queue = ExportQueue(flush=self.LLMObs.flush, name="datadog")
 
     async def on_startup(self):
         # This function is called when the server is started.
         print(f"on_startup:{__name__}")
+        # Valves may have been loaded from valves.json after __init__
+        self.spans.configure(self.valves.max_open_chats, self.valves.span_timeout)
         self.set_dd()
-        pass
+        self.export_queue.start()
 
     async def on_shutdown(self):
         # This function is called when the server is stopped.
         print(f"on_shutdown:{__name__}")
+        self.export_queue.stop()
         self.LLMObs.flush()
-        pass
 
     async def on_valves_updated(self):
         # This function is called when the valves are updated.
+        self.spans.configure(self.valves.max_open_chats, self.valves.span_timeout)
         self.set_dd()
-        pass
 
     def set_dd(self):
         self.LLMObs.enable(
@@ -88,34 +106,88 @@ class Pipeline:
             integrations_enabled=True,
         )
 
+    def evict_spans(self, chat_id: str, chat_spans: OrderedDict, reason: str):
+        # Finish the spans of requests whose outlet never came, so they don't leak
+        finished_at = time.time()
+        for span in chat_spans.values():
+            self.export_queue.submit(
+                self.finish_span, span, None, finished_at, {"evicted": reason}
+            )
+
     async def inlet(self, body: dict, user: Optional[dict] = None) -> dict:
         print(f"inlet:{__name__}")
 
-        self.llm_span = self.LLMObs.llm(
+        metadata = body.get("metadata", {})
+        chat_id = body.get("chat_id") or metadata.get("chat_id")
+        message_id = metadata.get("message_id")
+        # Finishes the spans of chats idle for span_timeout, which would
+        # otherwise only be swept when another chat is added
+        self.spans.expire()
+
+        llm_span = self.LLMObs.llm(
             model_name=body["model"],
             name=f"filter:{__name__}",
             model_provider="open-webui",
-            session_id=body["chat_id"],
+            session_id=chat_id,
             ml_app=self.valves.ml_app
         )
 
         self.LLMObs.annotate(
-            span = self.llm_span,
+            span = llm_span,
             input_data = get_last_user_message(body["messages"]),
         )
 
+        chat_spans = self.spans.get(chat_id)
+        if chat_spans is None:
+            chat_spans = OrderedDict()
+            self.spans[chat_id] = chat_spans
+        previous_span = chat_spans.pop(message_id, None)
+        if previous_span is not None:
+            # The same message was sent again before its outlet
+            self.evict_spans(chat_id, {message_id: previous_span}, "replaced")
+        chat_spans[message_id] = llm_span
+
         return body
 
 
     async def outlet(self, body: dict, user: Optional[dict] = None) -> dict:
         print(f"outlet:{__name__}")
 
-        self.LLMObs.annotate(
-            span = self.llm_span,
-            output_data = get_last_assistant_message(body["messages"]),
+        chat_id = body.get("chat_id")
+        self.spans.expire()
+        chat_spans = self.spans.get(chat_id)
+        if not chat_spans:
+            print(f"No open span for chat_id: {chat_id}")
+            return body
+
+        # Outlet bodies carry the message id as `id`; without a match, the
+        # oldest open span of the chat is the one being answered
+        llm_span = chat_spans.pop(body.get("id"), None)
+        if llm_span is None:
+            _, llm_span = chat_spans.popitem(last=False)
+        if not chat_spans:
+            self.spans.pop(chat_id)
+
+        self.export_queue.submit(
+            self.finish_span,
+            llm_span,
+            get_last_assistant_message(body["messages"]),
+            time.time(),
         )
 
-        self.llm_span.finish()
-        self.LLMObs.flush()
-
         return body
+
+    def finish_span(
+        self,
+        span,
+        output_data: Optional[str],
+        finished_at: float,
+        tags: Optional[dict] = None,
+    ):
+        self.LLMObs.annotate(
+            span = span,
+            output_data = output_data,
+            tags = tags,
+        )
+
+        span.finish(finish_time=finished_at)
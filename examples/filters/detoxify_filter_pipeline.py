@@ -12,6 +12,7 @@ from typing import List, Optional
 from schemas import OpenAIChatMessage
 from pydantic import BaseModel
 from detoxify import Detoxify
+from utils.pipelines.batching import MicroBatcher
 import os
 
 
@@ -27,6 +28,11 @@ class Pipeline:
         # The lower the number, the higher the priority.
         priority: int = 0
 
+        # Concurrent messages are scored together in batches of up to this size
+        max_batch_size: int = 32
+        # How long the first message of a batch waits for others to join it
+        max_batch_wait_ms: float = 2.0
+
     def __init__(self):
         # Pipeline filters are only compatible with Open WebUI
         # You can think of filter pipeline as a middleware that can be used to edit the form data before it is sent to the OpenAI API.
@@ -47,6 +53,7 @@ class Pipeline:
         )
 
         self.model = None
+        self.batcher = None
 
         pass
 
@@ -55,17 +62,41 @@ class Pipeline:
         print(f"on_startup:{__name__}")
 
         self.model = Detoxify("original")
+        self.batcher = self.create_batcher()
         pass
 
     async def on_shutdown(self):
         # This function is called when the server is stopped.
         print(f"on_shutdown:{__name__}")
+        if self.batcher:
+            await self.batcher.close()
         pass
 
     async def on_valves_updated(self):
         # This function is called when the valves are updated.
+        # New requests go to the new batcher while the old one answers its own
+        batcher = self.batcher
+        self.batcher = self.create_batcher()
+        if batcher:
+            await batcher.close(drain=True)
         pass
 
+    def create_batcher(self) -> MicroBatcher:
+        return MicroBatcher(
+            self.predict,
+            max_batch_size=self.valves.max_batch_size,
+            max_wait_ms=self.valves.max_batch_wait_ms,
+            name="detoxify",
+        )
+
+    def predict(self, messages: List[str]) -> List[dict]:
+        # Detoxify scores a list of texts at once, returning a list per label
+        scores = self.model.predict(messages)
+        return [
+            {label: values[i] for label, values in scores.items()}
+            for i in range(len(messages))
+        ]
+
     async def inlet(self, body: dict, user: Optional[dict] = None) -> dict:
         # This filter is applied to the form data before it is sent to the OpenAI API.
         print(f"inlet:{__name__}")
@@ -74,7 +105,7 @@ class Pipeline:
         user_message = body["messages"][-1]["content"]
 
         # Filter out toxic messages
-        toxicity = self.model.predict(user_message)
+        toxicity = await self.batcher.submit(user_message)
         print(toxicity)
 
         if toxicity["toxicity"] > 0.5:
@@ -5,6 +5,7 @@ from datetime import datetime
 
 
 from blueprints.function_calling_blueprint import Pipeline as FunctionCallingBlueprint
+from utils.pipelines.tools import cached_tool, tool_patterns
 
 
 class Pipeline(FunctionCallingBlueprint):
@@ -30,6 +31,8 @@ class Pipeline(FunctionCallingBlueprint):
             current_time = now.strftime("%H:%M:%S")
             return f"Current Time = {current_time}"
 
+        # The weather changes slowly, serve repeated lookups for 10 minutes
+        @cached_tool(ttl=600)
         def get_current_weather(
             self,
             location: str,
@@ -66,6 +69,8 @@ class Pipeline(FunctionCallingBlueprint):
 
                 return f"{location}: {weather_description.capitalize()}, {temperature}°{unit.capitalize()[0]}"
 
+        # Arithmetic, which the docstring words do not describe
+        @tool_patterns(r"\d\s*[-+*/^%]\s*\d")
         def calculator(self, equation: str) -> str:
             """
             Calculate the result of an equation.
@@ -14,6 +14,7 @@ import pytz
 from difflib import get_close_matches
 
 from blueprints.function_calling_blueprint import Pipeline as FunctionCallingBlueprint
+from utils.pipelines.tools import cached_tool
 
 class Pipeline(FunctionCallingBlueprint):
     class Valves(FunctionCallingBlueprint.Valves):
@@ -34,6 +35,8 @@ class Pipeline(FunctionCallingBlueprint):
             current_time = now_est.strftime("%I:%M %p")  # %I for 12-hour clock, %M for minutes, %p for am/pm
             return f"ONLY RESPOND 'Current time is {current_time}'"
 
+        # The list of lights rarely changes
+        @cached_tool(ttl=300)
         def get_all_lights(self) -> Dict[str, Any]:
             """
             Lists my lights.
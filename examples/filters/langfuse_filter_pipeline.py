@@ -13,7 +13,10 @@ import os
 import uuid
 import json
 
+from utils.pipelines.export import ExportQueue
 from utils.pipelines.main import get_last_assistant_message
+from utils.pipelines.sessions import SessionStore
+from utils.pipelines.state import get_state_store
 from pydantic import BaseModel
 from langfuse import Langfuse
 from langfuse.api.resources.commons.errors.unauthorized_error import UnauthorizedError
@@ -38,6 +41,10 @@ class Pipeline:
         insert_tags: bool = True
         # New valve that controls whether to use model name instead of model ID for generation
         use_model_name_instead_of_id_for_generation: bool = False
+        # Chats whose trace is kept in memory; the least recently used are dropped
+        max_sessions: int = 10000
+        # Seconds after which an inactive chat's trace is dropped
+        session_ttl: int = 3600
         debug: bool = False
 
     def __init__(self):
@@ -56,14 +63,22 @@ class Pipeline:
         )
 
         self.langfuse = None
-        self.chat_traces = {}
+        self.chat_traces = SessionStore(self.valves.max_sessions, self.valves.session_ttl)
+        # Trace id of each chat, shared with the other workers through
+        # PIPELINES_STATE_STORE, so an outlet handled by another worker
+        # than its inlet adds to the same trace
+        self.trace_ids = get_state_store()
         self.suppressed_logs = set()
-        # Dictionary to store model names for each chat
-        self.model_names = {}
+        # Store of model names for each chat
+        self.model_names = SessionStore(self.valves.max_sessions, self.valves.session_ttl)
 
         # Only these tasks will be treated as LLM "generations":
         self.GENERATION_TASKS = {"llm_response"}
 
+        # Traces are only accessed from the export thread; the Langfuse client
+        # batches the events it sends on its own
+        self.export_queue = ExportQueue(name="langfuse")
+
     def log(self, message: str, suppress_repeats: bool = False):
         if self.valves.debug:
             if suppress_repeats:
@@ -75,16 +90,29 @@ class Pipeline:
     async def on_startup(self):
         self.log(f"on_startup triggered for {__name__}")
         self.set_langfuse()
+        self.export_queue.start()
+        # Valves may have been loaded from valves.json after __init__
+        self.configure_sessions()
 
     async def on_shutdown(self):
         self.log(f"on_shutdown triggered for {__name__}")
+        self.export_queue.stop()
+        self.log(f"Trace sessions: {self.chat_traces.stats()}")
+        self.log(f"Export queue: {self.export_queue.stats()}")
         if self.langfuse:
             self.langfuse.flush()
 
     async def on_valves_updated(self):
         self.log("Valves updated, resetting Langfuse client.")
+        self.configure_sessions()
         self.set_langfuse()
 
+    def configure_sessions(self):
+        self.export_queue.submit(
+            self.chat_traces.configure, self.valves.max_sessions, self.valves.session_ttl
+        )
+        self.model_names.configure(self.valves.max_sessions, self.valves.session_ttl)
+
     def set_langfuse(self):
         try:
             self.langfuse = Langfuse(
@@ -104,6 +132,17 @@ class Pipeline:
                 f"Langfuse error: {e} Please re-enter your Langfuse credentials in the pipeline settings."
             )
 
+    def get_trace(self, chat_id: str):
+        """The trace of a chat, from this worker or by the id another one stored."""
+        trace = self.chat_traces.get(chat_id)
+        if trace is None:
+            trace_id = self.trace_ids.get(f"langfuse:trace:{chat_id}")
+            if trace_id is not None:
+                # Only references the existing trace, fields left unset are kept
+                trace = self.langfuse.trace(id=trace_id)
+                self.chat_traces[chat_id] = trace
+        return trace
+
     def _build_tags(self, task_name: str) -> list:
         """
         Builds a list of tags based on valve settings, ensuring we always add
@@ -118,12 +157,20 @@ class Pipeline:
                 tags_list.append(task_name)
         return tags_list
 
-    async def inlet(self, body: dict, user: Optional[dict] = None) -> dict:
-        if self.valves.debug:
-            print(f"[DEBUG] Received request: {json.dumps(body, indent=2)}")
+    def snapshot(self, body: dict) -> dict:
+        """Copy of the parts of the body that later filters may modify in place."""
+        return {
+            **body,
+            "messages": list(body.get("messages", [])),
+            "metadata": dict(body.get("metadata", {})),
+        }
 
-        self.log(f"Inlet function called with body: {body} and user: {user}")
+    def get_model_info(self, chat_id: str, model_id: Optional[str]) -> tuple:
+        model_id = self.model_names.get(chat_id, {}).get("id", model_id)
+        model_name = self.model_names.get(chat_id, {}).get("name", "unknown")
+        return model_id, model_name
 
+    async def inlet(self, body: dict, user: Optional[dict] = None) -> dict:
         metadata = body.get("metadata", {})
         chat_id = metadata.get("chat_id", str(uuid.uuid4()))
 
@@ -156,17 +203,56 @@ class Pipeline:
             self.log(error_message)
             raise ValueError(error_message)
 
-        user_email = user.get("email") if user else None
         # Defaulting to 'user_response' if no task is provided
         task_name = metadata.get("task", "user_response")
+        model_id, model_name = self.get_model_info(chat_id, body["model"])
+
+        # Update metadata with type
+        metadata["type"] = task_name
+        metadata["interface"] = "open-webui"
+        if task_name in self.GENERATION_TASKS:
+            # Add both values to metadata regardless of valve setting
+            metadata["model_id"] = model_id
+            metadata["model_name"] = model_name
+
+        # Traces are built and sent on the export thread
+        self.export_queue.submit(
+            self.export_inlet,
+            self.snapshot(body),
+            user,
+            chat_id,
+            task_name,
+            model_id,
+            model_name,
+        )
+        return body
+
+    def export_inlet(
+        self,
+        body: dict,
+        user: Optional[dict],
+        chat_id: str,
+        task_name: str,
+        model_id: Optional[str],
+        model_name: str,
+    ):
+        if self.valves.debug:
+            print(f"[DEBUG] Received request: {json.dumps(body, indent=2)}")
+
+        self.log(f"Inlet function called with body: {body} and user: {user}")
+
+        metadata = body["metadata"]
+        user_email = user.get("email") if user else None
 
         # Build tags
         tags_list = self._build_tags(task_name)
 
-        if chat_id not in self.chat_traces:
+        trace = self.get_trace(chat_id)
+        if trace is None:
             self.log(f"Creating new trace for chat_id: {chat_id}")
 
             trace_payload = {
+                "id": str(uuid.uuid4()),
                 "name": f"chat:{chat_id}",
                 "input": body,
                 "user_id": user_email,
@@ -182,29 +268,21 @@ class Pipeline:
 
             trace = self.langfuse.trace(**trace_payload)
             self.chat_traces[chat_id] = trace
+            self.trace_ids.set(
+                f"langfuse:trace:{chat_id}",
+                trace_payload["id"],
+                ttl=self.valves.session_ttl,
+            )
         else:
-            trace = self.chat_traces[chat_id]
             self.log(f"Reusing existing trace for chat_id: {chat_id}")
             if tags_list:
                 trace.update(tags=tags_list)
 
-        # Update metadata with type
-        metadata["type"] = task_name
-        metadata["interface"] = "open-webui"
-
         # If it's a task that is considered an LLM generation
         if task_name in self.GENERATION_TASKS:
-            # Determine which model value to use based on the use_model_name valve
-            model_id = self.model_names.get(chat_id, {}).get("id", body["model"])
-            model_name = self.model_names.get(chat_id, {}).get("name", "unknown")
-            
             # Pick primary model identifier based on valve setting
             model_value = model_name if self.valves.use_model_name_instead_of_id_for_generation else model_id
-            
-            # Add both values to metadata regardless of valve setting
-            metadata["model_id"] = model_id
-            metadata["model_name"] = model_name
-            
+
             generation_payload = {
                 "name": f"{task_name}:{str(uuid.uuid4())}",
                 "model": model_value,
@@ -233,11 +311,7 @@ class Pipeline:
 
             trace.event(**event_payload)
 
-        return body
-
     async def outlet(self, body: dict, user: Optional[dict] = None) -> dict:
-        self.log(f"Outlet function called with body: {body}")
-
         chat_id = body.get("chat_id")
 
         # Handle temporary chats
@@ -248,16 +322,50 @@ class Pipeline:
         metadata = body.get("metadata", {})
         # Defaulting to 'llm_response' if no task is provided
         task_name = metadata.get("task", "llm_response")
+        model_id, model_name = self.get_model_info(chat_id, body.get("model"))
+
+        metadata["type"] = task_name
+        metadata["interface"] = "open-webui"
+        if task_name in self.GENERATION_TASKS:
+            # Add both values to metadata regardless of valve setting
+            metadata["model_id"] = model_id
+            metadata["model_name"] = model_name
+
+        self.export_queue.submit(
+            self.export_outlet,
+            self.snapshot(body),
+            user,
+            chat_id,
+            task_name,
+            model_id,
+            model_name,
+        )
+        return body
+
+    def export_outlet(
+        self,
+        body: dict,
+        user: Optional[dict],
+        chat_id: str,
+        task_name: str,
+        model_id: Optional[str],
+        model_name: str,
+    ):
+        self.log(f"Outlet function called with body: {body}")
+
+        metadata = body["metadata"]
 
         # Build tags
         tags_list = self._build_tags(task_name)
 
-        if chat_id not in self.chat_traces:
+        trace = self.get_trace(chat_id)
+        if trace is None:
             self.log(f"[WARNING] No matching trace found for chat_id: {chat_id}, attempting to re-register.")
             # Re-run inlet to register if somehow missing
-            return await self.inlet(body, user)
-
-        trace = self.chat_traces[chat_id]
+            metadata["chat_id"] = chat_id
+            return self.export_inlet(
+                body, user, chat_id, "user_response", model_id, model_name
+            )
 
         assistant_message = get_last_assistant_message(body["messages"])
         assistant_message_obj = get_last_assistant_message_obj(body["messages"])
@@ -279,21 +387,10 @@ class Pipeline:
         # Update the trace output with the last assistant message
         trace.update(output=assistant_message)
 
-        metadata["type"] = task_name
-        metadata["interface"] = "open-webui"
-
         if task_name in self.GENERATION_TASKS:
-            # Determine which model value to use based on the use_model_name valve
-            model_id = self.model_names.get(chat_id, {}).get("id", body.get("model"))
-            model_name = self.model_names.get(chat_id, {}).get("name", "unknown")
-            
             # Pick primary model identifier based on valve setting
             model_value = model_name if self.valves.use_model_name_instead_of_id_for_generation else model_id
-            
-            # Add both values to metadata regardless of valve setting
-            metadata["model_id"] = model_id
-            metadata["model_name"] = model_name
-            
+
             # If it's an LLM generation
             generation_payload = {
                 "name": f"{task_name}:{str(uuid.uuid4())}",
@@ -329,5 +426,3 @@ class Pipeline:
 
             trace.event(**event_payload)
             self.log(f"Event logged for chat_id: {chat_id}")
-
-        return body
@@ -1,10 +1,10 @@
 from typing import List, Optional
 from schemas import OpenAIChatMessage
 from pydantic import BaseModel
-import requests
 import os
 
 from utils.pipelines.main import get_last_user_message, get_last_assistant_message
+from utils.pipelines.translation import LibreTranslateBackend, TranslationService
 
 
 class Pipeline:
@@ -33,6 +33,9 @@ class Pipeline:
         source_assistant: Optional[str] = "en"
         target_assistant: Optional[str] = "es"
 
+        # Number of translations remembered, so repeated texts are not sent again
+        cache_size: int = 10000
+
     def __init__(self):
         # Pipeline filters are only compatible with Open WebUI
         # You can think of filter pipeline as a middleware that can be used to edit the form data before it is sent to the OpenAI API.
@@ -55,37 +58,35 @@ class Pipeline:
             }
         )
 
-        pass
+        # Created in on_startup, once the valves are loaded from valves.json
+        self.translator: Optional[TranslationService] = None
 
     async def on_startup(self):
         # This function is called when the server is started.
         print(f"on_startup:{__name__}")
-        pass
+        self.translator = self.create_translator()
 
     async def on_shutdown(self):
         # This function is called when the server is stopped.
         print(f"on_shutdown:{__name__}")
-        pass
+        if self.translator is not None:
+            await self.translator.close()
 
     async def on_valves_updated(self):
         # This function is called when the valves are updated.
-        pass
-
-    def translate(self, text: str, source: str, target: str) -> str:
-        payload = {
-            "q": text,
-            "source": source,
-            "target": target,
-        }
+        if self.translator is not None:
+            await self.translator.close()
+        self.translator = self.create_translator()
+
+    def create_translator(self) -> TranslationService:
+        return TranslationService(
+            LibreTranslateBackend(self.valves.libretranslate_url),
+            cache_size=self.valves.cache_size,
+        )
 
+    async def translate(self, text: str, source: str, target: str) -> str:
         try:
-            r = requests.post(
-                f"{self.valves.libretranslate_url}/translate", json=payload
-            )
-            r.raise_for_status()
-
-            data = r.json()
-            return data["translatedText"]
+            return await self.translator.translate_text(text, source, target)
         except Exception as e:
             print(f"Error translating text: {e}")
             return text
@@ -99,7 +100,7 @@ class Pipeline:
         print(f"User message: {user_message}")
 
         # Translate user message
-        translated_user_message = self.translate(
+        translated_user_message = await self.translate(
             user_message,
             self.valves.source_user,
             self.valves.target_user,
@@ -124,7 +125,7 @@ class Pipeline:
         print(f"Assistant message: {assistant_message}")
 
         # Translate assistant message
-        translated_assistant_message = self.translate(
+        translated_assistant_message = await self.translate(
             assistant_message,
             self.valves.source_assistant,
             self.valves.target_assistant,
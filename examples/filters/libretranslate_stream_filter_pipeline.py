@@ -0,0 +1,179 @@
+"""
+title: LibreTranslate Stream Filter Pipeline
+author: open-webui
+date: 2026-10-19
+version: 1.0
+license: MIT
+description: A filter pipeline that translates the user message on inlet and the assistant message sentence by sentence while it streams.
+"""
+
+from typing import List, Optional
+from pydantic import BaseModel
+import os
+
+from utils.pipelines.main import get_last_user_message
+from utils.pipelines.sessions import SessionStore
+from utils.pipelines.translation import (
+    LibreTranslateBackend,
+    StreamTranslation,
+    TranslationService,
+)
+
+
+class Pipeline:
+
+    class Valves(BaseModel):
+        # List target pipeline ids (models) that this filter will be connected to.
+        # If you want to connect this filter to all pipelines, you can set pipelines to ["*"]
+        # e.g. ["llama3:latest", "gpt-3.5-turbo"]
+        pipelines: List[str] = []
+
+        # Assign a priority level to the filter pipeline.
+        # The priority level determines the order in which the filter pipelines are executed.
+        # The lower the number, the higher the priority.
+        priority: int = 0
+
+        # Valves
+        libretranslate_url: str
+
+        # Source and target languages
+        # User message will be translated from source_user to target_user
+        source_user: Optional[str] = "auto"
+        target_user: Optional[str] = "en"
+
+        # Assistant languages
+        # Assistant message will be translated from source_assistant to target_assistant
+        source_assistant: Optional[str] = "en"
+        target_assistant: Optional[str] = "es"
+
+        # Number of translations remembered, so repeated texts are not sent again
+        cache_size: int = 10000
+
+        # Streams in progress are dropped once there are more than max_streams
+        # of them, or after stream_timeout seconds without a chunk
+        max_streams: int = 1000
+        stream_timeout: int = 600
+
+    def __init__(self):
+        # Pipeline filters are only compatible with Open WebUI
+        # You can think of filter pipeline as a middleware that can be used to edit the form data before it is sent to the OpenAI API.
+        self.type = "filter"
+
+        # Optionally, you can set the id and name of the pipeline.
+        # Best practice is to not specify the id so that it can be automatically inferred from the filename, so that users can install multiple versions of the same pipeline.
+        # The identifier must be unique across all pipelines.
+        # The identifier must be an alphanumeric string that can include underscores or hyphens. It cannot contain spaces, special characters, slashes, or backslashes.
+        # self.id = "libretranslate_stream_filter_pipeline"
+        self.name = "LibreTranslate Stream Filter"
+
+        # Initialize
+        self.valves = self.Valves(
+            **{
+                "pipelines": ["*"],  # Connect to all pipelines
+                "libretranslate_url": os.getenv(
+                    "LIBRETRANSLATE_API_BASE_URL", "http://localhost:5000"
+                ),
+            }
+        )
+
+        # Created in on_startup, once the valves are loaded from valves.json
+        self.translator: Optional[TranslationService] = None
+        # completion id -> StreamTranslation
+        self.streams = SessionStore(
+            max_size=self.valves.max_streams,
+            ttl=self.valves.stream_timeout,
+            on_evict=self.evict_stream,
+        )
+
+    async def on_startup(self):
+        # This function is called when the server is started.
+        print(f"on_startup:{__name__}")
+        self.streams.configure(self.valves.max_streams, self.valves.stream_timeout)
+        self.translator = self.create_translator()
+
+    async def on_shutdown(self):
+        # This function is called when the server is stopped.
+        print(f"on_shutdown:{__name__}")
+        for translation in self.streams.values():
+            translation.cancel()
+        self.streams.clear()
+        if self.translator is not None:
+            await self.translator.close()
+
+    async def on_valves_updated(self):
+        # This function is called when the valves are updated.
+        self.streams.configure(self.valves.max_streams, self.valves.stream_timeout)
+        if self.translator is not None:
+            await self.translator.close()
+        self.translator = self.create_translator()
+
+    def create_translator(self) -> TranslationService:
+        return TranslationService(
+            LibreTranslateBackend(self.valves.libretranslate_url),
+            cache_size=self.valves.cache_size,
+        )
+
+    def evict_stream(
+        self, completion_id: str, translation: StreamTranslation, reason: str
+    ):
+        # The client went away before the stream finished
+        translation.cancel()
+
+    async def inlet(self, body: dict, user: Optional[dict] = None) -> dict:
+        print(f"inlet:{__name__}")
+
+        messages = body["messages"]
+        user_message = get_last_user_message(messages)
+
+        try:
+            translated_user_message = await self.translator.translate_text(
+                user_message,
+                self.valves.source_user,
+                self.valves.target_user,
+            )
+        except Exception as e:
+            print(f"Error translating text: {e}")
+            translated_user_message = user_message
+
+        for message in reversed(messages):
+            if message["role"] == "user":
+                message["content"] = translated_user_message
+                break
+
+        body = {**body, "messages": messages}
+        return body
+
+    async def stream(self, event: dict, body: dict) -> dict:
+        # Called by the server for each chunk of a streamed completion. The
+        # assistant message is translated as it streams, so there is no
+        # outlet; non-streamed completions are left untranslated. The server
+        # sends a last chunk with a finish_reason at [DONE] if the upstream
+        # did not, so the buffered text is always flushed.
+        choices = event.get("choices") or []
+        if not choices:
+            return event
+
+        completion_id = event.get("id")
+        translation = self.streams.get(completion_id)
+        if translation is None:
+            translation = StreamTranslation(
+                self.translator,
+                self.valves.source_assistant,
+                self.valves.target_assistant,
+            )
+            self.streams[completion_id] = translation
+
+        choice = choices[0]
+        delta = choice.get("delta") or {}
+        if delta.get("content"):
+            translation.feed(delta["content"])
+
+        if choice.get("finish_reason") is not None:
+            self.streams.pop(completion_id)
+            content = await translation.finish()
+        else:
+            content = translation.ready()
+
+        if content or "content" in delta:
+            choice["delta"] = {**delta, "content": content}
+        return event
@@ -1,10 +1,10 @@
 from typing import List, Optional
 from schemas import OpenAIChatMessage
 from pydantic import BaseModel
-import requests
 import os
 
 from utils.pipelines.main import get_last_user_message, get_last_assistant_message
+from utils.pipelines.translation import OpenAITranslateBackend, TranslationService
 
 
 class Pipeline:
@@ -33,6 +33,9 @@ class Pipeline:
         source_assistant: Optional[str] = "en"
         target_assistant: Optional[str] = "es"
 
+        # Number of translations remembered, so repeated texts are not sent again
+        cache_size: int = 10000
+
     def __init__(self):
         # Pipeline filters are only compatible with Open WebUI
         # You can think of filter pipeline as a middleware that can be used to edit the form data before it is sent to the OpenAI API.
@@ -55,51 +58,42 @@ class Pipeline:
             }
         )
 
-        pass
+        # Created in on_startup, once the valves are loaded from valves.json
+        self.translator: Optional[TranslationService] = None
 
     async def on_startup(self):
         # This function is called when the server is started.
         print(f"on_startup:{__name__}")
-        pass
+        self.translator = self.create_translator()
 
     async def on_shutdown(self):
         # This function is called when the server is stopped.
         print(f"on_shutdown:{__name__}")
-        pass
+        if self.translator is not None:
+            await self.translator.close()
 
     async def on_valves_updated(self):
         # This function is called when the valves are updated.
-        pass
-
-    def translate(self, text: str, source: str, target: str) -> str:
-        headers = {}
-        headers["Authorization"] = f"Bearer {self.valves.OPENAI_API_KEY}"
-        headers["Content-Type"] = "application/json"
-
-        payload = {
-            "messages": [
-                {
-                    "role": "system",
-                    "content": f"Translate the following text to {target}. Provide only the translated text and nothing else.",
-                },
-                {"role": "user", "content": text},
-            ],
-            "model": self.valves.TASK_MODEL,
-        }
-        print(payload)
+        if self.translator is not None:
+            await self.translator.close()
+        self.translator = self.create_translator()
+
+    def create_translator(self) -> TranslationService:
+        return TranslationService(
+            OpenAITranslateBackend(
+                self.valves.OPENAI_API_BASE_URL,
+                self.valves.OPENAI_API_KEY,
+                self.valves.TASK_MODEL,
+            ),
+            cache_size=self.valves.cache_size,
+        )
 
+    async def translate(self, text: str, source: str, target: str) -> str:
+        if not text or not text.strip():
+            return text
         try:
-            r = requests.post(
-                url=f"{self.valves.OPENAI_API_BASE_URL}/chat/completions",
-                json=payload,
-                headers=headers,
-                stream=False,
-            )
-
-            r.raise_for_status()
-            response = r.json()
-            print(response)
-            return response["choices"][0]["message"]["content"]
+            # The whole message in one completion, so the model sees its context
+            return await self.translator.translate(text, source, target)
         except Exception as e:
             return f"Error: {e}"
 
@@ -112,7 +106,7 @@ class Pipeline:
         print(f"User message: {user_message}")
 
         # Translate user message
-        translated_user_message = self.translate(
+        translated_user_message = await self.translate(
             user_message,
             self.valves.source_user,
             self.valves.target_user,
@@ -140,7 +134,7 @@ class Pipeline:
         print(f"Assistant message: {assistant_message}")
 
         # Translate assistant message
-        translated_assistant_message = self.translate(
+        translated_assistant_message = await self.translate(
             assistant_message,
             self.valves.source_assistant,
             self.valves.target_assistant,
@@ -8,11 +8,16 @@ description: A filter that processes user messages and stores them as long term
 requirements: pydantic, ollama, mem0ai
 """
 
-from typing import List, Optional
+from typing import Dict, List, Optional
 from pydantic import BaseModel
 import json
 from mem0 import Memory
+import asyncio
 import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.pipelines.export import ExportQueue
+from utils.pipelines.sessions import SessionStore
 
 class Pipeline:
     class Valves(BaseModel):
@@ -21,6 +26,20 @@ class Pipeline:
 
         store_cycles: int = 5 # Number of messages from the user before the data is processed and added to the memory
         mem_zero_user: str = "user" # Memories belongs to this user, only used by mem0 for internal organization of memories
+        per_user_memories: bool = False # Store and search memories under each Open WebUI user id instead of mem_zero_user
+
+        # Memory writes run on a background worker. Writes for a user that are
+        # still waiting are merged into one; past max_pending_users, new
+        # writes are dropped
+        max_pending_users: int = 1000
+        max_buffered_users: int = 10000 # Users whose unstored messages are kept
+
+        # Memory search is skipped for a turn when it takes longer than
+        # search_timeout seconds; results are cached for search_cache_ttl seconds
+        search_timeout: float = 1.0
+        search_workers: int = 4
+        search_cache_size: int = 10000
+        search_cache_ttl: int = 300
 
         # Default values for the mem0 vector store
         vector_store_qdrant_name: str = "memories"
@@ -41,8 +60,6 @@ class Pipeline:
     def __init__(self):
         self.type = "filter"
         self.name = "Memory Filter"
-        self.user_messages = []
-        self.thread = None
         self.valves = self.Valves(
             **{
                 "pipelines": ["*"],  # Connect to all pipelines
@@ -50,18 +67,116 @@ class Pipeline:
         )
         self.m = self.init_mem_zero()
 
+        # Open WebUI user id -> messages not yet stored
+        self.user_messages = SessionStore(
+            max_size=self.valves.max_buffered_users, ttl=None
+        )
+
+        # mem0 user id -> texts waiting to be stored; the worker holds at most
+        # one task per waiting user, so the queue never drops a write
+        self.pending_writes: Dict[str, List[str]] = {}
+        self.pending_lock = threading.Lock()
+        self.dropped_writes = 0
+        self.write_queue = ExportQueue(
+            max_size=self.valves.max_pending_users, batch_size=1, name="mem0"
+        )
+
+        # (mem0 user id, query) -> (memory version, memories)
+        self.search_cache = SessionStore(
+            max_size=self.valves.search_cache_size, ttl=self.valves.search_cache_ttl
+        )
+        # Bumped when memories are stored for a user, invalidating its cache
+        self.memory_versions: Dict[str, int] = {}
+        self.search_executor = ThreadPoolExecutor(
+            max_workers=self.valves.search_workers, thread_name_prefix="mem0-search"
+        )
+        self.search_timeouts = 0
+
     async def on_startup(self):
         print(f"on_startup:{__name__}")
-        pass
+        self.write_queue.start()
 
     async def on_shutdown(self):
         print(f"on_shutdown:{__name__}")
-        pass
+        # Stores the pending writes before exiting
+        self.write_queue.stop()
+        self.search_executor.shutdown(wait=False)
+
+    async def on_valves_updated(self):
+        self.user_messages.configure(self.valves.max_buffered_users, None)
+        self.search_cache.configure(
+            self.valves.search_cache_size, self.valves.search_cache_ttl
+        )
+
+    def get_memory_user(self, user: Optional[dict]) -> str:
+        if self.valves.per_user_memories and user and user.get("id"):
+            return user["id"]
+        return self.valves.mem_zero_user
+
+    def queue_write(self, memory_user: str, text: str) -> bool:
+        with self.pending_lock:
+            texts = self.pending_writes.get(memory_user)
+            if texts is not None:
+                # A write for this user is still waiting, send both at once
+                texts.append(text)
+                return True
+            if len(self.pending_writes) >= self.valves.max_pending_users:
+                self.dropped_writes += 1
+                return False
+            self.pending_writes[memory_user] = [text]
+
+        self.write_queue.start()
+        self.write_queue.submit(self.store_memories, memory_user)
+        return True
+
+    def store_memories(self, memory_user: str):
+        # Runs on the write queue's thread
+        with self.pending_lock:
+            texts = self.pending_writes.pop(memory_user, [])
+        if not texts:
+            return
+
+        message_text = " ".join(texts)
+        print("Text to be processed in to a memory:")
+        print(message_text)
+
+        self.m.add(data=message_text, user_id=memory_user)
+        self.memory_versions[memory_user] = self.memory_versions.get(memory_user, 0) + 1
+
+    def cache_search(self, key: tuple, version: int, future: asyncio.Future):
+        if not future.cancelled() and future.exception() is None:
+            self.search_cache[key] = (version, future.result())
+
+    async def search_memories(self, query: str, memory_user: str):
+        key = (memory_user, query)
+        version = self.memory_versions.get(memory_user, 0)
+
+        cached = self.search_cache.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        future = asyncio.wrap_future(
+            self.search_executor.submit(self.m.search, query, user_id=memory_user)
+        )
+        # A search that misses the budget still fills the cache for next time
+        future.add_done_callback(lambda f: self.cache_search(key, version, f))
+        try:
+            return await asyncio.wait_for(
+                asyncio.shield(future), self.valves.search_timeout
+            )
+        except asyncio.TimeoutError:
+            self.search_timeouts += 1
+            print("Memory search timed out, continuing without memory")
+            return None
+        except Exception as e:
+            print(f"Memory search failed: {e}")
+            return None
 
     async def inlet(self, body: dict, user: Optional[dict] = None) -> dict:
         print(f"pipe:{__name__}")
 
-        user = self.valves.mem_zero_user
+        memory_user = self.get_memory_user(user)
+        buffer_user = (user or {}).get("id") or memory_user
         store_cycles = self.valves.store_cycles
 
         if isinstance(body, str):
@@ -70,27 +185,18 @@ class Pipeline:
         all_messages = body["messages"]
         last_message = all_messages[-1]["content"]
 
-        self.user_messages.append(last_message)
-
-        if len(self.user_messages) == store_cycles:
-
-            message_text = ""
-            for message in self.user_messages:
-                message_text += message + " "
-
-            if self.thread and self.thread.is_alive():
-                print("Waiting for previous memory to be done")
-                self.thread.join()
-
-            self.thread = threading.Thread(target=self.m.add, kwargs={"data":message_text,"user_id":user})
+        user_messages = self.user_messages.setdefault(buffer_user, [])
+        user_messages.append(last_message)
 
-            print("Text to be processed in to a memory:")
-            print(message_text)
+        if len(user_messages) >= store_cycles:
+            self.queue_write(memory_user, " ".join(user_messages))
+            self.user_messages.pop(buffer_user)
 
-            self.thread.start()
-            self.user_messages.clear()
+        memories = await self.search_memories(last_message, memory_user)
 
-        memories = self.m.search(last_message, user_id=user)
+        # Newer mem0 versions wrap the results
+        if isinstance(memories, dict):
+            memories = memories.get("results")
 
         if(memories):
             fetched_memory = memories[0]["memory"]
@@ -137,4 +243,4 @@ class Pipeline:
             },
         }
 
-        return Memory.from_config(config)
\ No newline at end of file
+        return Memory.from_config(config)
@@ -15,6 +15,7 @@ import json
 
 from pydantic import BaseModel
 from opik import Opik
+from utils.pipelines.sessions import SessionStore
 
 
 def get_last_assistant_message_obj(messages: List[dict]) -> dict:
@@ -32,6 +33,10 @@ class Pipeline:
         workspace: str
         project_name: str
         host: str
+        # Chats whose open trace is kept in memory; the least recently used are dropped
+        max_sessions: int = 10000
+        # Seconds after which an open trace whose outlet never came is dropped
+        session_ttl: int = 3600
         debug: bool = False
 
     def __init__(self):
@@ -53,8 +58,14 @@ class Pipeline:
 
         self.opik = None
         # Keep track of the trace and the last-created span for each chat_id
-        self.chat_traces = {}
-        self.chat_spans = {}
+        # Traces and spans dropped before their outlet are ended, so Opik does
+        # not keep them open
+        self.chat_traces = SessionStore(
+            self.valves.max_sessions, self.valves.session_ttl, on_evict=self.end_evicted
+        )
+        self.chat_spans = SessionStore(
+            self.valves.max_sessions, self.valves.session_ttl, on_evict=self.end_evicted
+        )
 
         self.suppressed_logs = set()
 
@@ -69,19 +80,32 @@ class Pipeline:
 
     async def on_startup(self):
         self.log(f"on_startup triggered for {__name__}")
+        # Valves may have been loaded from valves.json after __init__
+        self.configure_sessions()
         self.set_opik()
 
     async def on_shutdown(self):
         self.log(f"on_shutdown triggered for {__name__}")
+        self.log(f"Trace sessions: {self.chat_traces.stats()}")
         if self.opik:
             self.opik.end()
 
     async def on_valves_updated(self):
         self.log("Valves updated, resetting Opik client.")
+        self.configure_sessions()
         if self.opik:
             self.opik.end()
         self.set_opik()
 
+    def configure_sessions(self):
+        self.chat_traces.configure(self.valves.max_sessions, self.valves.session_ttl)
+        self.chat_spans.configure(self.valves.max_sessions, self.valves.session_ttl)
+
+    def end_evicted(self, chat_id: str, trace_or_span, reason: str):
+        """Ends a trace or span dropped from its store before the chat's outlet."""
+        self.log(f"Ending {type(trace_or_span).__name__} of chat_id {chat_id} ({reason})")
+        trace_or_span.end(metadata={"evicted": reason})
+
     def set_opik(self):
         try:
             self.opik = Opik(
@@ -8,11 +8,13 @@ description: A pipeline for redacting personally identifiable information (PII)
 requirements: presidio-analyzer, presidio-anonymizer
 """
 
+import hashlib
 import os
+from collections import OrderedDict
 from typing import List, Optional
 from pydantic import BaseModel
 from schemas import OpenAIChatMessage
-from presidio_analyzer import AnalyzerEngine
+from presidio_analyzer import AnalyzerEngine, BatchAnalyzerEngine
 from presidio_anonymizer import AnonymizerEngine
 from presidio_anonymizer.entities import OperatorConfig
 
@@ -27,6 +29,8 @@ class Pipeline:
             "DATE_TIME", "NRP", "MEDICAL_LICENSE", "URL"
         ]
         language: str = "en"
+        # Redacted messages remembered, so history resent on every turn is not re-analyzed
+        cache_size: int = 10000
 
     def __init__(self):
         self.type = "filter"
@@ -42,7 +46,10 @@ class Pipeline:
         )
 
         self.analyzer = AnalyzerEngine()
+        self.batch_analyzer = BatchAnalyzerEngine(analyzer_engine=self.analyzer)
         self.anonymizer = AnonymizerEngine()
+        # sha256 of a message -> its redacted text, least recently used first
+        self.cache = OrderedDict()
 
     async def on_startup(self):
         print(f"on_startup:{__name__}")
@@ -50,13 +57,11 @@ class Pipeline:
     async def on_shutdown(self):
         print(f"on_shutdown:{__name__}")
 
-    def redact_pii(self, text: str) -> str:
-        results = self.analyzer.analyze(
-            text=text,
-            language=self.valves.language,
-            entities=self.valves.entities_to_redact
-        )
+    async def on_valves_updated(self):
+        # Cached redactions depend on the entities and language
+        self.cache.clear()
 
+    def anonymize(self, text: str, results) -> str:
         anonymized_text = self.anonymizer.anonymize(
             text=text,
             analyzer_results=results,
@@ -67,15 +72,73 @@ class Pipeline:
 
         return anonymized_text.text
 
+    def redact_pii(self, text: str) -> str:
+        results = self.analyzer.analyze(
+            text=text,
+            language=self.valves.language,
+            entities=self.valves.entities_to_redact
+        )
+        return self.anonymize(text, results)
+
+    def redact_many(self, texts: List[str]) -> List[str]:
+        """Redacts several texts with a single batched analyzer pass."""
+        results = self.batch_analyzer.analyze_iterator(
+            texts,
+            language=self.valves.language,
+            entities=self.valves.entities_to_redact,
+        )
+        return [self.anonymize(text, result) for text, result in zip(texts, results)]
+
+    def cache_put(self, key: bytes, redacted: str):
+        self.cache[key] = redacted
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.valves.cache_size:
+            self.cache.popitem(last=False)
+
+    def redact_messages(self, texts: List[str]) -> List[str]:
+        """Redacts texts, analyzing only the ones not seen before."""
+        keys = [hashlib.sha256(text.encode("utf-8")).digest() for text in texts]
+
+        redacted = {}
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                redacted[key] = self.cache[key]
+            else:
+                missing[key] = text
+
+        if missing:
+            for key, text in zip(missing, self.redact_many(list(missing.values()))):
+                redacted[key] = text
+                self.cache_put(key, text)
+                # Redacted text may come back as history; it needs no second pass
+                self.cache_put(hashlib.sha256(text.encode("utf-8")).digest(), text)
+
+        return [redacted[key] for key in keys]
+
     async def inlet(self, body: dict, user: Optional[dict] = None) -> dict:
         print(f"pipe:{__name__}")
         print(body)
         print(user)
 
         if user is None or user.get("role") != "admin" or self.valves.enabled_for_admins:
-            messages = body.get("messages", [])
-            for message in messages:
-                if message.get("role") == "user":
-                    message["content"] = self.redact_pii(message["content"])
+            # (dict, key) of every user text: string contents and text parts
+            targets = []
+            for message in body.get("messages", []):
+                if message.get("role") != "user":
+                    continue
+                if isinstance(message.get("content"), list):
+                    targets += [
+                        (item, "text")
+                        for item in message["content"]
+                        if item.get("type") == "text"
+                    ]
+                else:
+                    targets.append((message, "content"))
+
+            redacted = self.redact_messages([target[key] for target, key in targets])
+            for (target, key), text in zip(targets, redacted):
+                target[key] = text
 
         return body
@@ -1,8 +1,20 @@
 import os
+import asyncio
 from typing import List, Optional
 from pydantic import BaseModel
 from schemas import OpenAIChatMessage
-import time
+from utils.pipelines.ratelimit import (
+    RateLimitBackend,
+    RedisRateLimiter,
+    SlidingWindowRateLimiter,
+    StateStoreRateLimiter,
+)
+from utils.pipelines.state import (
+    MemoryStateStore,
+    RedisStateStore,
+    create_state_store,
+    get_state_store,
+)
 
 
 class Pipeline:
@@ -22,6 +34,13 @@ class Pipeline:
         sliding_window_limit: Optional[int] = None
         sliding_window_minutes: Optional[int] = None
 
+        # Backend for the request counters: a redis:// url to share them across
+        # workers and replicas, or sqlite:/// across the workers of a host.
+        # Empty to use PIPELINES_STATE_STORE (by default, this process only).
+        backend_url: str = ""
+        # Requests allowed locally before syncing with a shared backend
+        batch_size: int = 1
+
     def __init__(self):
         # Pipeline filters are only compatible with Open WebUI
         # You can think of filter pipeline as a middleware that can be used to edit the form data before it is sent to the OpenAI API.
@@ -50,68 +69,96 @@ class Pipeline:
                 "sliding_window_minutes": int(
                     os.getenv("RATE_LIMIT_SLIDING_WINDOW_MINUTES", 15)
                 ),
+                "backend_url": os.getenv("RATE_LIMIT_BACKEND_URL", ""),
+                "batch_size": int(os.getenv("RATE_LIMIT_BATCH_SIZE", 1)),
             }
         )
 
-        # Tracking data - user_id -> (timestamps of requests)
-        self.user_requests = {}
+        # Tracking data - user_id -> bucketed request counters per window
+        self.limiter = self.create_limiter()
+        self.limiter_config = self.get_limiter_config()
 
     async def on_startup(self):
         # This function is called when the server is started.
         print(f"on_startup:{__name__}")
-        pass
+        # Valves may have been loaded from valves.json after __init__
+        await self.update_limiter()
 
     async def on_shutdown(self):
         # This function is called when the server is stopped.
         print(f"on_shutdown:{__name__}")
-        pass
-
-    def prune_requests(self, user_id: str):
-        """Prune old requests that are outside of the sliding window period."""
-        now = time.time()
-        if user_id in self.user_requests:
-            self.user_requests[user_id] = [
-                req
-                for req in self.user_requests[user_id]
-                if (
-                    (self.valves.requests_per_minute is not None and now - req < 60)
-                    or (self.valves.requests_per_hour is not None and now - req < 3600)
-                    or (
-                        self.valves.sliding_window_limit is not None
-                        and now - req < self.valves.sliding_window_minutes * 60
-                    )
+        await self.flush_limiter()
+
+    async def on_valves_updated(self):
+        # This function is called when the valves are updated.
+        print(f"on_valves_updated:{__name__}")
+        await self.update_limiter()
+
+    async def update_limiter(self):
+        """Rebuild the limiter, and so reset the counters, only if its valves changed."""
+        config = self.get_limiter_config()
+        if config != self.limiter_config:
+            await self.flush_limiter()
+            self.limiter = self.create_limiter()
+            self.limiter_config = config
+
+    async def flush_limiter(self):
+        if self.limiter.blocking:
+            await asyncio.to_thread(self.limiter.flush)
+        else:
+            self.limiter.flush()
+
+    def get_limiter_config(self) -> tuple:
+        return (
+            tuple(self.get_windows()),
+            self.valves.backend_url,
+            self.valves.batch_size,
+        )
+
+    def get_windows(self) -> list:
+        """Return one (seconds, limit) sliding window per configured limit."""
+        windows = []
+        if self.valves.requests_per_minute is not None:
+            windows.append((60, self.valves.requests_per_minute))
+        if self.valves.requests_per_hour is not None:
+            windows.append((3600, self.valves.requests_per_hour))
+        if (
+            self.valves.sliding_window_limit is not None
+            and self.valves.sliding_window_minutes is not None
+        ):
+            windows.append(
+                (
+                    self.valves.sliding_window_minutes * 60,
+                    self.valves.sliding_window_limit,
                 )
-            ]
+            )
+        return windows
+
+    def create_limiter(self) -> RateLimitBackend:
+        """Create a rate limiter with one sliding window per configured limit."""
+        windows = self.get_windows()
+        if self.valves.backend_url:
+            store = create_state_store(self.valves.backend_url)
+        else:
+            store = get_state_store()
+
+        if isinstance(store, RedisStateStore):
+            return RedisRateLimiter(
+                store,
+                windows,
+                batch_size=self.valves.batch_size,
+            )
+        if isinstance(store, MemoryStateStore):
+            return SlidingWindowRateLimiter(windows)
+        return StateStoreRateLimiter(store, windows)
 
     def log_request(self, user_id: str):
         """Log a new request for a user."""
-        now = time.time()
-        if user_id not in self.user_requests:
-            self.user_requests[user_id] = []
-        self.user_requests[user_id].append(now)
+        self.limiter.record(user_id)
 
     def rate_limited(self, user_id: str) -> bool:
         """Check if a user is rate limited."""
-        self.prune_requests(user_id)
-
-        user_reqs = self.user_requests.get(user_id, [])
-
-        if self.valves.requests_per_minute is not None:
-            requests_last_minute = sum(1 for req in user_reqs if time.time() - req < 60)
-            if requests_last_minute >= self.valves.requests_per_minute:
-                return True
-
-        if self.valves.requests_per_hour is not None:
-            requests_last_hour = sum(1 for req in user_reqs if time.time() - req < 3600)
-            if requests_last_hour >= self.valves.requests_per_hour:
-                return True
-
-        if self.valves.sliding_window_limit is not None:
-            requests_in_window = len(user_reqs)
-            if requests_in_window >= self.valves.sliding_window_limit:
-                return True
-
-        return False
+        return self.limiter.limited(user_id)
 
     async def inlet(self, body: dict, user: Optional[dict] = None) -> dict:
         print(f"pipe:{__name__}")
@@ -120,8 +167,13 @@ class Pipeline:
 
         if user.get("role", "admin") == "user":
             user_id = user["id"] if user and "id" in user else "default_user"
-            if self.rate_limited(user_id):
+            # Checked and logged in one step, so concurrent requests
+            # cannot all take the last allowed request. Shared backends
+            # make round trips, which must not block the event loop.
+            if self.limiter.blocking:
+                allowed = await asyncio.to_thread(self.limiter.hit, user_id)
+            else:
+                allowed = self.limiter.hit(user_id)
+            if not allowed:
                 raise Exception("Rate limit exceeded. Please try again later.")
-
-            self.log_request(user_id)
         return body
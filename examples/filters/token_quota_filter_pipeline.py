@@ -0,0 +1,200 @@
+"""
+title: Token Quota Filter Pipeline
+author: open-webui
+date: 2026-10-19
+version: 1.0
+license: MIT
+description: A filter pipeline that enforces per-user and per-model token budgets, estimating prompts on inlet and reconciling actual usage on outlet.
+requirements: tiktoken
+"""
+
+import os
+import asyncio
+import time
+from collections import OrderedDict
+from typing import List, Optional
+from pydantic import BaseModel
+from utils.pipelines.main import get_last_assistant_message
+from utils.pipelines.ratelimit import SlidingWindowRateLimiter
+from utils.pipelines.tokens import TokenEstimator, get_usage_tokens
+
+
+# Reservations of requests whose outlet never arrived are charged after this
+RESERVATION_TTL = 600
+
+
+class Pipeline:
+    class Valves(BaseModel):
+        # List target pipeline ids (models) that this filter will be connected to.
+        # If you want to connect this filter to all pipelines, you can set pipelines to ["*"]
+        pipelines: List[str] = []
+
+        # Assign a priority level to the filter pipeline.
+        # The priority level determines the order in which the filter pipelines are executed.
+        # The lower the number, the higher the priority.
+        priority: int = 0
+
+        # Valves for token quotas
+        target_user_roles: List[str] = ["user"]
+        tokens_per_minute: Optional[int] = None
+        tokens_per_hour: Optional[int] = None
+        tokens_per_day: Optional[int] = None
+        # Whether budgets apply per user and model, or per user across models
+        per_model: bool = True
+        # tiktoken encoding used to estimate prompt tokens
+        encoding: str = "cl100k_base"
+
+    def __init__(self):
+        # Pipeline filters are only compatible with Open WebUI
+        # You can think of filter pipeline as a middleware that can be used to edit the form data before it is sent to the OpenAI API.
+        self.type = "filter"
+
+        # Optionally, you can set the id and name of the pipeline.
+        # Best practice is to not specify the id so that it can be automatically inferred from the filename, so that users can install multiple versions of the same pipeline.
+        # The identifier must be unique across all pipelines.
+        # The identifier must be an alphanumeric string that can include underscores or hyphens. It cannot contain spaces, special characters, slashes, or backslashes.
+        # self.id = "token_quota_filter_pipeline"
+        self.name = "Token Quota Filter"
+
+        self.valves = self.Valves(
+            **{
+                "pipelines": os.getenv("TOKEN_QUOTA_PIPELINES", "*").split(","),
+                "tokens_per_hour": int(os.getenv("TOKEN_QUOTA_TOKENS_PER_HOUR", 100000)),
+                "tokens_per_day": int(os.getenv("TOKEN_QUOTA_TOKENS_PER_DAY", 1000000)),
+                "encoding": os.getenv("TOKEN_QUOTA_ENCODING", "cl100k_base"),
+            }
+        )
+
+        self.estimator = None
+        self.limiter = self.create_limiter()
+        # chat_id -> (quota key, estimated tokens, reserved at), oldest first
+        self.reservations = OrderedDict()
+        # quota key -> tokens reserved by requests still in flight
+        self.reserved = {}
+
+    async def on_startup(self):
+        # This function is called when the server is started.
+        print(f"on_startup:{__name__}")
+        # Valves may have been loaded from valves.json after __init__
+        self.limiter = self.create_limiter()
+        await self.load_estimator()
+
+    async def on_shutdown(self):
+        # This function is called when the server is stopped.
+        print(f"on_shutdown:{__name__}")
+        pass
+
+    async def on_valves_updated(self):
+        # This function is called when the valves are updated.
+        print(f"on_valves_updated:{__name__}")
+        if self.estimator is None or self.estimator.encoding_name != self.valves.encoding:
+            await self.load_estimator()
+        # Keeps the tokens already used in windows whose duration is unchanged
+        self.limiter = self.limiter.migrated(self.get_windows())
+
+    async def load_estimator(self):
+        # tiktoken may download the encoding, which must not block the event loop
+        self.estimator = await asyncio.to_thread(TokenEstimator, self.valves.encoding)
+
+    def get_windows(self) -> list:
+        """Return one (seconds, tokens) sliding window per configured budget."""
+        windows = []
+        if self.valves.tokens_per_minute is not None:
+            windows.append((60, self.valves.tokens_per_minute))
+        if self.valves.tokens_per_hour is not None:
+            windows.append((3600, self.valves.tokens_per_hour))
+        if self.valves.tokens_per_day is not None:
+            windows.append((86400, self.valves.tokens_per_day))
+        return windows
+
+    def create_limiter(self) -> SlidingWindowRateLimiter:
+        """Create a limiter with one sliding window per configured budget."""
+        return SlidingWindowRateLimiter(self.get_windows())
+
+    def get_estimator(self) -> TokenEstimator:
+        # Loaded in on_startup; only created here if it did not run
+        if self.estimator is None:
+            self.estimator = TokenEstimator(self.valves.encoding)
+        return self.estimator
+
+    def get_key(self, user: dict, model: Optional[str]) -> str:
+        user_id = user["id"] if user and "id" in user else "default_user"
+        return f"{user_id}:{model}" if self.valves.per_model else user_id
+
+    def reserve(self, chat_id: str, key: str, tokens: int, now: float):
+        self.release(chat_id)
+        self.reservations[chat_id] = (key, tokens, now)
+        self.reserved[key] = self.reserved.get(key, 0) + tokens
+
+    def release(self, chat_id: str) -> Optional[tuple]:
+        reservation = self.reservations.pop(chat_id, None)
+        if reservation is not None:
+            key, tokens, _ = reservation
+            self.reserved[key] -= tokens
+            if self.reserved[key] <= 0:
+                del self.reserved[key]
+        return reservation
+
+    def expire_reservations(self, now: float):
+        while self.reservations:
+            chat_id, (_, _, reserved_at) = next(iter(self.reservations.items()))
+            if now - reserved_at < RESERVATION_TTL:
+                break
+            # Charge the estimated prompt, as the request most likely went through
+            key, tokens, _ = self.release(chat_id)
+            self.limiter.record(key, now, tokens)
+
+    async def inlet(self, body: dict, user: Optional[dict] = None) -> dict:
+        print(f"inlet:{__name__}")
+
+        if user.get("role", "admin") not in self.valves.target_user_roles:
+            return body
+
+        now = time.time()
+        self.expire_reservations(now)
+
+        key = self.get_key(user, body.get("model"))
+        estimate = self.get_estimator().count_messages(body.get("messages", []))
+        available = self.limiter.remaining(key, now) - self.reserved.get(key, 0)
+        if estimate > available:
+            raise Exception(
+                "Token quota exceeded. Please try again later or shorten the conversation."
+            )
+
+        chat_id = body.get("metadata", {}).get("chat_id")
+        if chat_id:
+            self.reserve(chat_id, key, estimate, now)
+        else:
+            # Without a chat id the outlet cannot be matched, so count the prompt now
+            self.limiter.record(key, now, estimate)
+        return body
+
+    async def outlet(self, body: dict, user: Optional[dict] = None) -> dict:
+        print(f"outlet:{__name__}")
+
+        if user.get("role", "admin") not in self.valves.target_user_roles:
+            return body
+
+        reservation = self.release(body.get("chat_id"))
+        messages = body.get("messages", [])
+        key = reservation[0] if reservation else self.get_key(user, body.get("model"))
+
+        input_tokens, output_tokens = None, None
+        for message in reversed(messages):
+            if message.get("role") == "assistant":
+                input_tokens, output_tokens = get_usage_tokens(message)
+                break
+
+        if reservation is None:
+            # The prompt was already charged on inlet or when the reservation expired
+            input_tokens = 0
+        elif input_tokens is None:
+            # Fall back to the estimate when the model did not report usage
+            input_tokens = reservation[1]
+        if output_tokens is None:
+            output_tokens = self.get_estimator().count(
+                get_last_assistant_message(messages) or ""
+            )
+
+        self.limiter.record(key, time.time(), input_tokens + output_tokens)
+        return body
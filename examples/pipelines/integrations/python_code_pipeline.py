@@ -1,9 +1,20 @@
 from typing import List, Union, Generator, Iterator
 from schemas import OpenAIChatMessage
-import subprocess
+from pydantic import BaseModel
+
+from utils.pipelines.sandbox import SandboxPool
 
 
 class Pipeline:
+    class Valves(BaseModel):
+        # Warm worker processes, each running one code at a time
+        SANDBOX_WORKERS: int = 4
+        # Runs after which a worker is replaced by a fresh one
+        SANDBOX_MAX_EXECUTIONS: int = 100
+        SANDBOX_TIMEOUT: float = 10.0
+        SANDBOX_CPU_SECONDS: float = 5.0
+        SANDBOX_MEMORY_MB: int = 512
+
     def __init__(self):
         # Optionally, you can set the id and name of the pipeline.
         # Best practice is to not specify the id so that it can be automatically inferred from the filename, so that users can install multiple versions of the same pipeline.
@@ -11,27 +22,50 @@ class Pipeline:
         # The identifier must be an alphanumeric string that can include underscores or hyphens. It cannot contain spaces, special characters, slashes, or backslashes.
         # self.id = "python_code_pipeline"
         self.name = "Python Code Pipeline"
-        pass
+        self.valves = self.Valves()
+        self.sandbox = None
 
     async def on_startup(self):
         # This function is called when the server is started.
         print(f"on_startup:{__name__}")
-        pass
+        self.start_sandbox()
 
     async def on_shutdown(self):
         # This function is called when the server is stopped.
         print(f"on_shutdown:{__name__}")
-        pass
+        if self.sandbox is not None:
+            print(f"Sandbox: {self.sandbox.stats()}")
+            self.sandbox.stop()
+            self.sandbox = None
+
+    async def on_valves_updated(self):
+        print(f"on_valves_updated:{__name__}")
+        if self.sandbox is not None:
+            self.sandbox.stop()
+        self.start_sandbox()
+
+    def start_sandbox(self):
+        self.sandbox = SandboxPool(
+            size=self.valves.SANDBOX_WORKERS,
+            max_executions=self.valves.SANDBOX_MAX_EXECUTIONS,
+            timeout=self.valves.SANDBOX_TIMEOUT,
+            cpu_seconds=self.valves.SANDBOX_CPU_SECONDS,
+            memory_mb=self.valves.SANDBOX_MEMORY_MB,
+        )
+        self.sandbox.start()
 
     def execute_python_code(self, code):
-        try:
-            result = subprocess.run(
-                ["python", "-c", code], capture_output=True, text=True, check=True
-            )
-            stdout = result.stdout.strip()
-            return stdout, result.returncode
-        except subprocess.CalledProcessError as e:
-            return e.output.strip(), e.returncode
+        execution = self.sandbox.run(code)
+        stdout = execution.output().strip()
+        return stdout, execution.returncode
+
+    def stream_python_code(self, code) -> Generator:
+        execution = self.sandbox.run(code)
+        yield from execution
+        if execution.timed_out:
+            yield f"\nTimed out after {self.valves.SANDBOX_TIMEOUT}s"
+        elif execution.crashed:
+            yield "\nThe code was stopped, e.g. for using too much CPU time"
 
     def pipe(
         self, user_message: str, model_id: str, messages: List[dict], body: dict
@@ -46,5 +80,5 @@ class Pipeline:
             print("Title Generation")
             return "Python Code Pipeline"
         else:
-            stdout, return_code = self.execute_python_code(user_message)
-            return stdout
+            # Streams the output as the code prints it
+            return self.stream_python_code(user_message)
@@ -16,15 +16,21 @@ import requests
 
 import os
 import asyncio
-import subprocess
 import yaml
 
+from utils.pipelines.sessions import SessionStore
+from utils.pipelines.supervisor import ProcessSupervisor, http_probe
+
 
 class Pipeline:
     class Valves(BaseModel):
         LITELLM_CONFIG_DIR: str = "./litellm/config.yaml"
         LITELLM_PROXY_PORT: int = 4001
         LITELLM_PROXY_HOST: str = "127.0.0.1"
+        # Seconds pipe waits for the proxy to be ready, e.g. while it starts
+        LITELLM_READY_TIMEOUT: float = 60.0
+        # Seconds the model list is reused for /models
+        LITELLM_MODELS_CACHE_TTL: float = 60.0
         litellm_config: dict = {}
 
     def __init__(self):
@@ -45,6 +51,8 @@ class Pipeline:
         # Initialize Valves
         self.valves = self.Valves(**{"LITELLM_CONFIG_DIR": f"./litellm/config.yaml"})
         self.background_process = None
+        # Keyed by the proxy's generation, so a restarted proxy is asked again
+        self.models_cache = SessionStore(max_size=1, ttl=60.0)
         pass
 
     async def on_startup(self):
@@ -73,7 +81,8 @@ class Pipeline:
 
         self.valves.litellm_config = litellm_config
 
-        asyncio.create_task(self.start_litellm_background())
+        # Returns once the proxy is started, pipe waits for it to be ready
+        await self.start_litellm_background()
         pass
 
     async def on_shutdown(self):
@@ -96,39 +105,6 @@ class Pipeline:
         await self.start_litellm_background()
         pass
 
-    async def run_background_process(self, command):
-        print("run_background_process")
-
-        try:
-            # Log the command to be executed
-            print(f"Executing command: {command}")
-
-            # Execute the command and create a subprocess
-            process = await asyncio.create_subprocess_exec(
-                *command,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-            )
-            self.background_process = process
-            print("Subprocess started successfully.")
-
-            # Capture STDERR for debugging purposes
-            stderr_output = await process.stderr.read()
-            stderr_text = stderr_output.decode().strip()
-            if stderr_text:
-                print(f"Subprocess STDERR: {stderr_text}")
-
-            # log.info output line by line
-            async for line in process.stdout:
-                print(line.decode().strip())
-
-            # Wait for the process to finish
-            returncode = await process.wait()
-            print(f"Subprocess exited with return code {returncode}")
-        except Exception as e:
-            print(f"Failed to start subprocess: {e}")
-            raise  # Optionally re-raise the exception if you want it to propagate
-
     async def start_litellm_background(self):
         print("start_litellm_background")
         # Command to run in the background
@@ -144,31 +120,53 @@ class Pipeline:
             self.valves.LITELLM_CONFIG_DIR,
         ]
 
-        await self.run_background_process(command)
+        # Restarts the proxy if it crashes, and logs its stdout and stderr
+        print(f"Executing command: {command}")
+        self.background_process = ProcessSupervisor(
+            command,
+            name="litellm",
+            probe=http_probe(f"{self.get_litellm_url()}/health/liveliness"),
+            ready_timeout=self.valves.LITELLM_READY_TIMEOUT,
+        )
+        self.models_cache.configure(1, self.valves.LITELLM_MODELS_CACHE_TTL)
+        self.models_cache.clear()
+        self.background_process.start()
 
     async def shutdown_litellm_background(self):
         print("shutdown_litellm_background")
 
         if self.background_process:
-            self.background_process.terminate()
-            await self.background_process.wait()  # Ensure the process has terminated
+            # Ensure the process has terminated
+            await asyncio.to_thread(self.background_process.stop)
             print("Subprocess terminated")
             self.background_process = None
 
+    def get_litellm_url(self) -> str:
+        return f"http://{self.valves.LITELLM_PROXY_HOST}:{self.valves.LITELLM_PROXY_PORT}"
+
     def get_litellm_models(self):
         if self.background_process:
+            if not self.background_process.ready.is_set():
+                # Still starting, or restarting after a crash
+                return []
+
+            generation = self.background_process.generation
+            models = self.models_cache.get(generation)
+            if models is not None:
+                return models
+
             try:
-                r = requests.get(
-                    f"http://{self.valves.LITELLM_PROXY_HOST}:{self.valves.LITELLM_PROXY_PORT}/v1/models"
-                )
+                r = requests.get(f"{self.get_litellm_url()}/v1/models", timeout=10)
                 models = r.json()
-                return [
+                models = [
                     {
                         "id": model["id"],
                         "name": model["name"] if "name" in model else model["id"],
                     }
                     for model in models["data"]
                 ]
+                self.models_cache.set(generation, models)
+                return models
             except Exception as e:
                 print(f"Error: {e}")
                 return [
@@ -194,9 +192,15 @@ class Pipeline:
             print(f"# Message: {user_message}")
             print("######################################")
 
+        if self.background_process and not self.background_process.wait_ready(
+            self.valves.LITELLM_READY_TIMEOUT
+        ):
+            logs = "\n".join(self.background_process.logs.tail(5))
+            return f"Error: LiteLLM is not ready\n{logs}"
+
         try:
             r = requests.post(
-                url=f"http://{self.valves.LITELLM_PROXY_HOST}:{self.valves.LITELLM_PROXY_PORT}/v1/chat/completions",
+                url=f"{self.get_litellm_url()}/v1/chat/completions",
                 json={**body, "model": model_id, "user": body["user"]["id"]},
                 stream=True,
             )
@@ -11,13 +11,16 @@ requirements: requests, mlx-lm, huggingface-hub, psutil
 from typing import List, Union, Generator, Iterator
 from schemas import OpenAIChatMessage
 from pydantic import BaseModel
+import asyncio
 import requests
 import subprocess
 import logging
 from huggingface_hub import login
-import time
+
 import psutil
 
+from utils.pipelines.residency import ModelResidency
+
 class Pipeline:
     class Valves(BaseModel):
         MLX_DEFAULT_MODEL: str = "mlx-community/Meta-Llama-3-8B-Instruct-8bit"
@@ -26,6 +29,12 @@ class Pipeline:
         MLX_CHAT_TEMPLATE: str | None = None
         MLX_USE_DEFAULT_CHAT_TEMPLATE: bool | None = False
         HUGGINGFACE_TOKEN: str | None = None
+        # Seconds to wait for a model server to load its model and be ready
+        MLX_READY_TIMEOUT: float = 300.0
+        # Servers kept loaded at once, least recently used ones are stopped
+        MLX_MAX_MODELS: int = 2
+        # Memory the servers may use together, 0 for 75% of system memory
+        MLX_MEMORY_BUDGET_MB: int = 0
 
     def __init__(self):
         # Pipeline identification
@@ -39,15 +48,13 @@ class Pipeline:
 
         # Server configuration
         self.host = "localhost"  # Always use localhost for security
-        self.port = None  # Port will be dynamically assigned
 
-        # Model management
+        # Model management, with a server per loaded model on its own port
         self.models = self.get_mlx_models()
-        self.current_model = None
-        self.server_process = None
-
-        # Start the MLX server with the default model
-        self.start_mlx_server(self.valves.MLX_DEFAULT_MODEL)
+        self.residency = ModelResidency(
+            self.get_server_command, host=self.host, name="mlx"
+        )
+        self.configure_residency()
 
     def update_valves(self):
         """Update pipeline configuration based on valve settings."""
@@ -96,21 +103,21 @@ class Pipeline:
         """Return the list of available models as pipelines."""
         return self.models
 
-    def start_mlx_server(self, model_name):
-        """Start the MLX server with the specified model."""
-        model_id = f"mlx.{model_name.split('/')[-1].lower()}"
-        if self.current_model == model_id and self.server_process and self.server_process.poll() is None:
-            logging.info(f"MLX server already running with model {model_name}")
-            return
-
-        self.stop_mlx_server()
-
-        self.port = self.find_free_port()
-
+    def configure_residency(self):
+        """Apply the valves limiting the loaded models."""
+        budget_mb = self.valves.MLX_MEMORY_BUDGET_MB
+        if not budget_mb:
+            budget_mb = psutil.virtual_memory().total * 0.75 / 2**20
+        self.residency.max_models = max(self.valves.MLX_MAX_MODELS, 1)
+        self.residency.memory_budget_mb = budget_mb
+        self.residency.ready_timeout = self.valves.MLX_READY_TIMEOUT
+
+    def get_server_command(self, model_name, port):
+        """Return the command starting an MLX server for a model on a port."""
         command = [
             "mlx_lm.server",
             "--model", model_name,
-            "--port", str(self.port),
+            "--port", str(port),
         ]
 
         # Add chat template options if specified
@@ -120,51 +127,46 @@ class Pipeline:
             command.append("--use-default-chat-template")
 
         logging.info(f"Starting MLX server with command: {' '.join(command)}")
-        self.server_process = subprocess.Popen(command)
-        self.current_model = model_id
-        logging.info(f"Started MLX server for model {model_name} on port {self.port}")
-        time.sleep(5)  # Give the server some time to start up
+        return command
+
+    def start_mlx_server(self, model_name):
+        """Start loading a model, without waiting for it to be ready."""
+        self.residency.preload(model_name)
 
     def stop_mlx_server(self):
-        """Stop the currently running MLX server."""
-        if self.server_process:
-            try:
-                process = psutil.Process(self.server_process.pid)
-                for proc in process.children(recursive=True):
-                    proc.terminate()
-                process.terminate()
-                process.wait(timeout=10)  # Wait for the process to terminate
-            except psutil.NoSuchProcess:
-                pass  # Process already terminated
-            except psutil.TimeoutExpired:
-                logging.warning("Timeout while terminating MLX server process")
-            finally:
-                self.server_process = None
-                self.current_model = None
-                self.port = None
-                logging.info("Stopped MLX server")
-
-    def find_free_port(self):
-        """Find and return a free port to use for the MLX server."""
-        import socket
-        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        s.bind(("", 0))
-        port = s.getsockname()[1]
-        s.close()
-        return port
+        """Stop all running MLX servers."""
+        self.residency.stop()
+        logging.info("Stopped MLX servers")
+
+    def stream_and_release(self, response, server):
+        """Yield the streamed response, keeping its server loaded until done."""
+        try:
+            yield from response.iter_lines()
+        finally:
+            self.residency.release(server)
 
     async def on_startup(self):
         """Perform any necessary startup operations."""
         logging.info(f"on_startup:{__name__}")
+        # Started here rather than in __init__, as the prefork launcher
+        # constructs pipelines in the master and server threads do not
+        # survive the fork; the valves are also loaded from valves.json by now
+        self.configure_residency()
+        self.start_mlx_server(self.valves.MLX_DEFAULT_MODEL)
 
     async def on_shutdown(self):
         """Perform cleanup operations on shutdown."""
-        self.stop_mlx_server()
+        await asyncio.to_thread(self.stop_mlx_server)
 
     async def on_valves_updated(self):
         """Handle updates to the pipeline configuration."""
-        self.update_valves()
-        self.models = self.get_mlx_models()
+        # Logging in, scanning models and stopping servers all block, so
+        # they run off the event loop
+        await asyncio.to_thread(self.update_valves)
+        self.models = await asyncio.to_thread(self.get_mlx_models)
+        # Servers are restarted, as the valves change their command
+        await asyncio.to_thread(self.stop_mlx_server)
+        self.configure_residency()
         self.start_mlx_server(self.valves.MLX_DEFAULT_MODEL)
 
     def pipe(
@@ -173,12 +175,14 @@ class Pipeline:
         """Process a request through the MLX pipeline."""
         logging.info(f"pipe:{__name__}")
 
-        # Switch model if necessary
-        if model_id != self.current_model:
-            model_name = next((model['name'] for model in self.models if model['id'] == model_id), self.valves.MLX_DEFAULT_MODEL)
-            self.start_mlx_server(model_name)
+        # Waits while the model loads, or for a loaded model to be free to stop
+        model_name = next((model['name'] for model in self.models if model['id'] == model_id), self.valves.MLX_DEFAULT_MODEL)
+        try:
+            server = self.residency.acquire(model_name)
+        except TimeoutError as e:
+            return f"Error: MLX server is not ready: {e}"
 
-        url = f"http://{self.host}:{self.port}/v1/chat/completions"
+        url = f"{self.residency.url(server)}/v1/chat/completions"
         headers = {"Content-Type": "application/json"}
 
         # Prepare the payload for the MLX server
@@ -204,8 +208,10 @@ class Pipeline:
 
             # Return streamed response or full JSON response
             if body.get("stream", False):
-                return r.iter_lines()
+                return self.stream_and_release(r, server)
             else:
-                return r.json()
+                response = r.json()
         except Exception as e:
-            return f"Error: {e}"
+            response = f"Error: {e}"
+        self.residency.release(server)
+        return response
@@ -13,16 +13,20 @@ from schemas import OpenAIChatMessage
 import os
 import asyncio
 
+from utils.pipelines.indexes import PersistedIndex
+
 
 class Pipeline:
     def __init__(self):
-        self.documents = None
-        self.index = None
+        # The index is embedded once, then only changed files are re-embedded
+        self.index = PersistedIndex(
+            os.getenv("LLAMAINDEX_GITHUB_PERSIST_DIR", "./storage/llamaindex_github")
+        )
 
     async def on_startup(self):
         from llama_index.embeddings.ollama import OllamaEmbedding
         from llama_index.llms.ollama import Ollama
-        from llama_index.core import VectorStoreIndex, Settings
+        from llama_index.core import Settings
         from llama_index.readers.github import GithubRepositoryReader, GithubClient
 
         Settings.embed_model = OllamaEmbedding(
@@ -31,8 +35,6 @@ class Pipeline:
         )
         Settings.llm = Ollama(model="llama3")
 
-        global index, documents
-
         github_token = os.environ.get("GITHUB_TOKEN")
         owner = "open-webui"
         repo = "plugin-server"
@@ -66,14 +68,21 @@ class Pipeline:
         reader._loop = loop
 
         try:
+            # The tree sha of the branch changes with any file, so the
+            # repository is only read when it has changed
+            branch_info = await github_client.get_branch(owner, repo, branch)
+            fingerprint = branch_info.commit.commit.tree.sha
+
             # Load data from the branch
-            self.documents = await asyncio.to_thread(reader.load_data, branch=branch)
-            self.index = VectorStoreIndex.from_documents(self.documents)
+            stats = await asyncio.to_thread(
+                self.index.refresh,
+                lambda: reader.load_data(branch=branch),
+                fingerprint,
+            )
         finally:
             loop.close()
 
-        print(self.documents)
-        print(self.index)
+        print(f"Index {self.index.persist_dir}: {stats}")
 
     async def on_shutdown(self):
         # This function is called when the server is stopped.
@@ -88,7 +97,7 @@ class Pipeline:
         print(messages)
         print(user_message)
 
-        query_engine = self.index.as_query_engine(streaming=True)
+        query_engine = self.index.get().as_query_engine(streaming=True)
         response = query_engine.query(user_message)
 
         return response.response_gen
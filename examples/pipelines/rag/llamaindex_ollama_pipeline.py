@@ -10,10 +10,13 @@ requirements: llama-index, llama-index-llms-ollama, llama-index-embeddings-ollam
 
 from typing import List, Union, Generator, Iterator
 from schemas import OpenAIChatMessage
+import asyncio
 import os
 
 from pydantic import BaseModel
 
+from utils.pipelines.indexes import PersistedIndex, fingerprint_directory
+
 
 class Pipeline:
 
@@ -21,9 +24,10 @@ class Pipeline:
         LLAMAINDEX_OLLAMA_BASE_URL: str
         LLAMAINDEX_MODEL_NAME: str
         LLAMAINDEX_EMBEDDING_MODEL_NAME: str
+        LLAMAINDEX_DATA_DIR: str
+        LLAMAINDEX_PERSIST_DIR: str
 
     def __init__(self):
-        self.documents = None
         self.index = None
 
         self.valves = self.Valves(
@@ -31,13 +35,15 @@ class Pipeline:
                 "LLAMAINDEX_OLLAMA_BASE_URL": os.getenv("LLAMAINDEX_OLLAMA_BASE_URL", "http://localhost:11434"),
                 "LLAMAINDEX_MODEL_NAME": os.getenv("LLAMAINDEX_MODEL_NAME", "llama3"),
                 "LLAMAINDEX_EMBEDDING_MODEL_NAME": os.getenv("LLAMAINDEX_EMBEDDING_MODEL_NAME", "nomic-embed-text"),
+                "LLAMAINDEX_DATA_DIR": os.getenv("LLAMAINDEX_DATA_DIR", "/app/backend/data"),
+                "LLAMAINDEX_PERSIST_DIR": os.getenv("LLAMAINDEX_OLLAMA_PERSIST_DIR", "./storage/llamaindex_ollama"),
             }
         )
 
     async def on_startup(self):
         from llama_index.embeddings.ollama import OllamaEmbedding
         from llama_index.llms.ollama import Ollama
-        from llama_index.core import Settings, VectorStoreIndex, SimpleDirectoryReader
+        from llama_index.core import Settings, SimpleDirectoryReader
 
         Settings.embed_model = OllamaEmbedding(
             model_name=self.valves.LLAMAINDEX_EMBEDDING_MODEL_NAME,
@@ -49,11 +55,21 @@ class Pipeline:
         )
 
         # This function is called when the server is started.
-        global documents, index
-
-        self.documents = SimpleDirectoryReader("/app/backend/data").load_data()
-        self.index = VectorStoreIndex.from_documents(self.documents)
-        pass
+        data_dir = self.valves.LLAMAINDEX_DATA_DIR
+
+        def load_documents():
+            return SimpleDirectoryReader(data_dir, filename_as_id=True).load_data()
+
+        # The index is embedded once, then only changed documents are
+        # re-embedded. Without changes to the data directory, this neither
+        # reads it nor loads the index, which pipe loads on first use
+        self.index = PersistedIndex(self.valves.LLAMAINDEX_PERSIST_DIR)
+        stats = await asyncio.to_thread(
+            self.index.refresh,
+            load_documents,
+            fingerprint_directory(data_dir, recursive=False),
+        )
+        print(f"Index {self.index.persist_dir}: {stats}")
 
     async def on_shutdown(self):
         # This function is called when the server is stopped.
@@ -68,7 +84,7 @@ class Pipeline:
         print(messages)
         print(user_message)
 
-        query_engine = self.index.as_query_engine(streaming=True)
+        query_engine = self.index.get().as_query_engine(streaming=True)
         response = query_engine.query(user_message)
 
         return response.response_gen
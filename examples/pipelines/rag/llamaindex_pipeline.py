@@ -10,25 +10,36 @@ requirements: llama-index
 
 from typing import List, Union, Generator, Iterator
 from schemas import OpenAIChatMessage
+import asyncio
+import os
+
+from utils.pipelines.indexes import PersistedIndex, fingerprint_directory
 
 
 class Pipeline:
     def __init__(self):
-        self.documents = None
-        self.index = None
+        self.data_dir = "./data"
+        # The index is embedded once, then only changed documents are re-embedded
+        self.index = PersistedIndex(
+            os.getenv("LLAMAINDEX_PERSIST_DIR", "./storage/llamaindex")
+        )
 
     async def on_startup(self):
-        import os
-
         # Set the OpenAI API key
         os.environ["OPENAI_API_KEY"] = "your-api-key-here"
 
-        from llama_index.core import VectorStoreIndex, SimpleDirectoryReader
+        from llama_index.core import SimpleDirectoryReader
 
-        self.documents = SimpleDirectoryReader("./data").load_data()
-        self.index = VectorStoreIndex.from_documents(self.documents)
-        # This function is called when the server is started.
-        pass
+        def load_documents():
+            return SimpleDirectoryReader(self.data_dir, filename_as_id=True).load_data()
+
+        # Without changes to ./data, this neither reads nor loads anything
+        stats = await asyncio.to_thread(
+            self.index.refresh,
+            load_documents,
+            fingerprint_directory(self.data_dir, recursive=False),
+        )
+        print(f"Index {self.index.persist_dir}: {stats}")
 
     async def on_shutdown(self):
         # This function is called when the server is stopped.
@@ -43,7 +54,7 @@ class Pipeline:
         print(messages)
         print(user_message)
 
-        query_engine = self.index.as_query_engine(streaming=True)
+        query_engine = self.index.get().as_query_engine(streaming=True)
         response = query_engine.query(user_message)
 
         return response.response_gen
@@ -10,11 +10,121 @@ requirements: llama_index, sqlalchemy, psycopg2-binary
 
 from typing import List, Union, Generator, Iterator
 import os 
+import asyncio
+import threading
 from pydantic import BaseModel
 from llama_index.llms.ollama import Ollama
-from llama_index.core.query_engine import NLSQLTableQueryEngine
-from llama_index.core import SQLDatabase, PromptTemplate
+from llama_index.core.indices.struct_store.sql_query import BaseSQLTableQueryEngine
+from llama_index.core.retrievers import NLSQLRetriever
+from llama_index.core import QueryBundle, SQLDatabase, PromptTemplate
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+
+from utils.pipelines.sessions import SessionStore
+
+# Set up the custom prompt used when generating SQL queries from text
+TEXT_TO_SQL_PROMPT = """
+        Given an input question, first create a syntactically correct {dialect} query to run, then look at the results of the query and return the answer. 
+        You can order the results by a relevant column to return the most interesting examples in the database.
+        Unless the user specifies in the question a specific number of examples to obtain, query for at most 5 results using the LIMIT clause as per Postgres. You can order the results to return the most informative data in the database.
+        Never query for all the columns from a specific table, only ask for a few relevant columns given the question.
+        You should use DISTINCT statements and avoid returning duplicates wherever possible.
+        Pay attention to use only the column names that you can see in the schema description. Be careful to not query for columns that do not exist. Pay attention to which column is in which table. Also, qualify column names with the table name when needed. You are required to use the following format, each taking one line:
+
+        Question: Question here
+        SQLQuery: SQL Query to run
+        SQLResult: Result of the SQLQuery
+        Answer: Final answer here
+
+        Only use tables listed below.
+        {schema}
+
+        Question: {query_str}
+        SQLQuery: 
+        """
+
+
+def get_thread_pool_size() -> int:
+    """The number of threads the server runs sync pipes in (anyio's default limiter)."""
+    import anyio.to_thread
+
+    try:
+        return int(anyio.to_thread.current_default_thread_limiter().total_tokens)
+    except RuntimeError:
+        # Outside of the event loop, assume anyio's default
+        return 40
+
+
+def normalize_question(question: str) -> str:
+    """Lowercases a question and drops extra whitespace and trailing punctuation."""
+    return " ".join(question.lower().split()).rstrip(" ?!.")
+
+
+class CachedSQLRetriever(NLSQLRetriever):
+    """
+    An NLSQLRetriever that reuses the SQL it generated for a question it has
+    already answered (by `normalize_question`), running it again without
+    asking the LLM. Only queries that ran without error are cached. The
+    table schema is also built once, since the tables are fixed. pipe runs
+    in several threads at once, so the cache is only used under
+    `sql_cache_lock`.
+    """
+
+    def __init__(
+        self,
+        sql_database: SQLDatabase,
+        sql_cache: SessionStore,
+        sql_cache_lock: threading.Lock,
+        **kwargs,
+    ):
+        super().__init__(sql_database, **kwargs)
+        self.sql_cache = sql_cache
+        self.sql_cache_lock = sql_cache_lock
+        self.table_context = None
+
+    def _get_table_context(self, query_bundle: QueryBundle) -> str:
+        if self.table_context is None:
+            self.table_context = super()._get_table_context(query_bundle)
+        return self.table_context
+
+    def retrieve_with_metadata(self, str_or_query_bundle):
+        if isinstance(str_or_query_bundle, str):
+            query_bundle = QueryBundle(str_or_query_bundle)
+        else:
+            query_bundle = str_or_query_bundle
+        key = normalize_question(query_bundle.query_str)
+
+        with self.sql_cache_lock:
+            sql_query = self.sql_cache.get(key)
+        if sql_query is not None:
+            try:
+                nodes, metadata = self._sql_retriever.retrieve_with_metadata(sql_query)
+                return nodes, {"sql_query": sql_query, **metadata}
+            except Exception as e:
+                # E.g. the schema changed, so ask the LLM again
+                print(f"Cached SQL failed, regenerating it: {e}")
+                with self.sql_cache_lock:
+                    self.sql_cache.pop(key)
+
+        nodes, metadata = super().retrieve_with_metadata(query_bundle)
+        # Without a result, the query failed and the nodes hold the error
+        if "result" in metadata:
+            with self.sql_cache_lock:
+                self.sql_cache.set(key, metadata["sql_query"])
+        return nodes, metadata
+
+
+class SQLTableQueryEngine(BaseSQLTableQueryEngine):
+    """NLSQLTableQueryEngine, with the SQL retriever passed in."""
+
+    def __init__(self, sql_retriever: NLSQLRetriever, **kwargs):
+        self._sql_retriever = sql_retriever
+        super().__init__(**kwargs)
+
+    @property
+    def sql_retriever(self) -> NLSQLRetriever:
+        return self._sql_retriever
 
 
 class Pipeline:
@@ -27,6 +137,10 @@ class Pipeline:
         DB_TABLE: str
         OLLAMA_HOST: str
         TEXT_TO_SQL_MODEL: str 
+        DB_URL: str
+        DB_POOL_SIZE: int
+        SQL_CACHE_SIZE: int
+        SQL_CACHE_TTL: int
 
 
     # Update valves/ environment variables based on your selected database 
@@ -34,77 +148,110 @@ class Pipeline:
         self.name = "Database RAG Pipeline"
         self.engine = None
         self.nlsql_response = ""
+        # Built on the first request, and again after valve updates
+        self.query_engine = None
+        self.lock = threading.Lock()
+        self.sql_cache = SessionStore(max_size=256, ttl=3600)
+        self.sql_cache_lock = threading.Lock()
 
         # Initialize
         self.valves = self.Valves(
             **{
                 "pipelines": ["*"],                                                           # Connect to all pipelines
                 "DB_HOST": os.getenv("DB_HOST", "http://localhost"),                     # Database hostname
-                "DB_PORT": os.getenv("DB_PORT", 5432),                                        # Database port 
+                "DB_PORT": os.getenv("DB_PORT", "5432"),                                      # Database port 
                 "DB_USER": os.getenv("DB_USER", "postgres"),                                  # User to connect to the database with
                 "DB_PASSWORD": os.getenv("DB_PASSWORD", "password"),                          # Password to connect to the database with
                 "DB_DATABASE": os.getenv("DB_DATABASE", "postgres"),                          # Database to select on the DB instance
                 "DB_TABLE": os.getenv("DB_TABLE", "table_name"),                            # Table(s) to run queries against 
                 "OLLAMA_HOST": os.getenv("OLLAMA_HOST", "http://host.docker.internal:11434"), # Make sure to update with the URL of your Ollama host, such as http://localhost:11434 or remote server address
-                "TEXT_TO_SQL_MODEL": os.getenv("TEXT_TO_SQL_MODEL", "llama3.1:latest")            # Model to use for text-to-SQL generation      
+                "TEXT_TO_SQL_MODEL": os.getenv("TEXT_TO_SQL_MODEL", "llama3.1:latest"),           # Model to use for text-to-SQL generation      
+                "DB_URL": os.getenv("DB_URL", ""),                                            # SQLAlchemy URL, e.g. sqlite:///data.db, used instead of the Postgres settings above
+                "DB_POOL_SIZE": os.getenv("DB_POOL_SIZE", 0),                                 # Pooled connections, 0 for one per server worker thread
+                "SQL_CACHE_SIZE": os.getenv("SQL_CACHE_SIZE", 256),                           # Questions whose generated SQL is reused
+                "SQL_CACHE_TTL": os.getenv("SQL_CACHE_TTL", 3600),                            # Seconds a generated SQL query is reused
             }
         )
 
     def init_db_connection(self):
         # Update your DB connection string based on selected DB engine - current connection string is for Postgres
-        self.engine = create_engine(f"postgresql+psycopg2://{self.valves.DB_USER}:{self.valves.DB_PASSWORD}@{self.valves.DB_HOST}:{self.valves.DB_PORT}/{self.valves.DB_DATABASE}")
+        url = self.valves.DB_URL or f"postgresql+psycopg2://{self.valves.DB_USER}:{self.valves.DB_PASSWORD}@{self.valves.DB_HOST}:{self.valves.DB_PORT}/{self.valves.DB_DATABASE}"
+
+        # Dialects without a connection pool (e.g. in-memory SQLite) reject pool arguments
+        parsed_url = make_url(url)
+        if not issubclass(parsed_url.get_dialect().get_pool_class(parsed_url), QueuePool):
+            self.engine = create_engine(url)
+            return self.engine
+
+        # pipe runs in the server's thread pool, so give each of its threads a connection
+        pool_size = self.valves.DB_POOL_SIZE
+        if pool_size <= 0:
+            pool_size = get_thread_pool_size()
+
+        self.engine = create_engine(url, pool_size=pool_size, max_overflow=0, pool_pre_ping=True)
         return self.engine
 
+    def init_llm(self):
+        # Set up LLM connection; uses phi3 model with 128k context limit since some queries have returned 20k+ tokens
+        return Ollama(model=self.valves.TEXT_TO_SQL_MODEL, base_url=self.valves.OLLAMA_HOST, request_timeout=180.0, context_window=30000)
+
+    def init_query_engine(self):
+        # Create database reader for Postgres, which reflects the table schema
+        sql_database = SQLDatabase(self.engine, include_tables=[self.valves.DB_TABLE])
+        llm = self.init_llm()
+
+        sql_retriever = CachedSQLRetriever(
+            sql_database,
+            sql_cache=self.sql_cache,
+            sql_cache_lock=self.sql_cache_lock,
+            tables=[self.valves.DB_TABLE],
+            llm=llm,
+            embed_model="local",
+            text_to_sql_prompt=PromptTemplate(TEXT_TO_SQL_PROMPT),
+        )
+        return SQLTableQueryEngine(sql_retriever, llm=llm, streaming=True)
+
+    def get_query_engine(self):
+        with self.lock:
+            if self.query_engine is None:
+                if self.engine is None:
+                    self.init_db_connection()
+                self.query_engine = self.init_query_engine()
+            return self.query_engine
+
     async def on_startup(self):
         # This function is called when the server is started.
+        self.sql_cache.configure(self.valves.SQL_CACHE_SIZE, self.valves.SQL_CACHE_TTL)
         self.init_db_connection()
 
     async def on_shutdown(self):
         # This function is called when the server is stopped.
-        pass
+        if self.engine is not None:
+            self.engine.dispose()
+
+    async def on_valves_updated(self):
+        # The database, table or model may have changed
+        print(f"on_valves_updated:{__name__}")
+        # The lock may be held by a request building the query engine, which
+        # reflects the schema, so it is not waited for on the event loop
+        await asyncio.to_thread(self.reset)
+
+    def reset(self):
+        with self.lock, self.sql_cache_lock:
+            self.query_engine = None
+            self.sql_cache.clear()
+            self.sql_cache.configure(self.valves.SQL_CACHE_SIZE, self.valves.SQL_CACHE_TTL)
+            if self.engine is not None:
+                self.engine.dispose()
+            self.init_db_connection()
 
     def pipe(
         self, user_message: str, model_id: str, messages: List[dict], body: dict
     ) -> Union[str, Generator, Iterator]:
         # Debug logging is required to see what SQL query is generated by the LlamaIndex library; enable on Pipelines server if needed
 
-        # Create database reader for Postgres
-        sql_database = SQLDatabase(self.engine, include_tables=[self.valves.DB_TABLE])
-
-        # Set up LLM connection; uses phi3 model with 128k context limit since some queries have returned 20k+ tokens
-        llm = Ollama(model=self.valves.TEXT_TO_SQL_MODEL, base_url=self.valves.OLLAMA_HOST, request_timeout=180.0, context_window=30000)
-
-        # Set up the custom prompt used when generating SQL queries from text
-        text_to_sql_prompt = """
-        Given an input question, first create a syntactically correct {dialect} query to run, then look at the results of the query and return the answer. 
-        You can order the results by a relevant column to return the most interesting examples in the database.
-        Unless the user specifies in the question a specific number of examples to obtain, query for at most 5 results using the LIMIT clause as per Postgres. You can order the results to return the most informative data in the database.
-        Never query for all the columns from a specific table, only ask for a few relevant columns given the question.
-        You should use DISTINCT statements and avoid returning duplicates wherever possible.
-        Pay attention to use only the column names that you can see in the schema description. Be careful to not query for columns that do not exist. Pay attention to which column is in which table. Also, qualify column names with the table name when needed. You are required to use the following format, each taking one line:
-
-        Question: Question here
-        SQLQuery: SQL Query to run
-        SQLResult: Result of the SQLQuery
-        Answer: Final answer here
-
-        Only use tables listed below.
-        {schema}
-
-        Question: {query_str}
-        SQLQuery: 
-        """
-
-        text_to_sql_template = PromptTemplate(text_to_sql_prompt)
-
-        query_engine = NLSQLTableQueryEngine(
-            sql_database=sql_database, 
-            tables=[self.valves.DB_TABLE],
-            llm=llm, 
-            embed_model="local", 
-            text_to_sql_prompt=text_to_sql_template, 
-            streaming=True
-        )
+        # The database reader, LLM client and query engine are reused across requests
+        query_engine = self.get_query_engine()
 
         response = query_engine.query(user_message)
 
@@ -1,16 +1,19 @@
 from fastapi import FastAPI, Request, Depends, status, HTTPException, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.concurrency import run_in_threadpool
+from starlette.concurrency import iterate_in_threadpool
 
 
 from starlette.responses import StreamingResponse, Response
 from pydantic import BaseModel, ConfigDict
-from typing import List, Union, Generator, Iterator
+from typing import AsyncIterator, List, Optional, Union, Generator, Iterator
 
 
 from utils.pipelines.auth import bearer_security, get_current_user
 from utils.pipelines.main import get_last_user_message, stream_message_template
 from utils.pipelines.misc import convert_to_raw_url
+from utils.pipelines.capture import RequestCapture
+from utils.pipelines.sync import PipelineSync
 
 from contextlib import asynccontextmanager
 from concurrent.futures import ThreadPoolExecutor
@@ -18,6 +21,7 @@ from schemas import FilterForm, OpenAIChatCompletionForm
 from urllib.parse import urlparse
 
 import shutil
+import asyncio
 import aiohttp
 import os
 import importlib.util
@@ -29,7 +33,16 @@ import sys
 import subprocess
 
 
-from config import API_KEY, PIPELINES_DIR, LOG_LEVELS
+from config import (
+    API_KEY,
+    PIPELINES_DIR,
+    LOG_LEVELS,
+    REQUEST_CAPTURE_PATH,
+    REQUEST_CAPTURE_SAMPLE_RATE,
+    REQUEST_CAPTURE_REDACT_MESSAGES,
+    PIPELINES_WORKERS,
+    PIPELINES_SYNC_INTERVAL,
+)
 
 if not os.path.exists(PIPELINES_DIR):
     os.makedirs(PIPELINES_DIR)
@@ -39,6 +52,20 @@ PIPELINES = {}
 PIPELINE_MODULES = {}
 PIPELINE_NAMES = {}
 
+REQUEST_CAPTURE = (
+    RequestCapture(
+        REQUEST_CAPTURE_PATH,
+        sample_rate=REQUEST_CAPTURE_SAMPLE_RATE,
+        redact_messages=REQUEST_CAPTURE_REDACT_MESSAGES,
+    )
+    if REQUEST_CAPTURE_PATH
+    else None
+)
+
+# Broadcasts pipeline and valve changes to the other workers
+PIPELINE_SYNC = PipelineSync(PIPELINES_DIR)
+SYNC_STATE = {"pipelines": 0, "valves": {}}
+
 # Add GLOBAL_LOG_LEVEL for Pipeplines
 log_level = os.getenv("GLOBAL_LOG_LEVEL", "INFO").upper()
 logging.basicConfig(level=LOG_LEVELS[log_level])
@@ -163,11 +190,14 @@ async def load_module_from_path(module_name, module_path):
 
         # Move the file to the error folder
         failed_pipelines_folder = os.path.join(PIPELINES_DIR, "failed")
-        if not os.path.exists(failed_pipelines_folder):
-            os.makedirs(failed_pipelines_folder)
+        os.makedirs(failed_pipelines_folder, exist_ok=True)
 
         failed_file_path = os.path.join(failed_pipelines_folder, f"{module_name}.py")
-        os.rename(module_path, failed_file_path)
+        try:
+            os.rename(module_path, failed_file_path)
+        except FileNotFoundError:
+            # Another worker already moved it
+            pass
         print(e)
     return None
 
@@ -184,7 +214,7 @@ async def load_modules_from_directory(directory):
             # Create subfolder matching the filename without the .py extension
             subfolder_path = os.path.join(directory, module_name)
             if not os.path.exists(subfolder_path):
-                os.makedirs(subfolder_path)
+                os.makedirs(subfolder_path, exist_ok=True)
                 logging.info(f"Created subfolder: {subfolder_path}")
 
             # Create a valves.json file if it doesn't exist
@@ -223,9 +253,25 @@ async def load_modules_from_directory(directory):
     PIPELINES = get_all_pipelines()
 
 
-async def on_startup():
+async def on_prefork():
+    """
+    Loads the pipelines in the master process before the workers are forked
+    (see prefork.py), so read-only state built here is shared copy-on-write.
+    """
+    # The generations loaded here, which workers forked later compare with
+    SYNC_STATE.update(PIPELINE_SYNC.read())
     await load_modules_from_directory(PIPELINES_DIR)
 
+    for module in PIPELINE_MODULES.values():
+        if hasattr(module, "on_prefork"):
+            await module.on_prefork()
+
+
+async def on_startup():
+    # Pipelines are already loaded when the worker was forked from a master
+    if not PIPELINE_MODULES:
+        await load_modules_from_directory(PIPELINES_DIR)
+
     for module in PIPELINE_MODULES.values():
         if hasattr(module, "on_startup"):
             await module.on_startup()
@@ -237,7 +283,7 @@ async def on_shutdown():
             await module.on_shutdown()
 
 
-async def reload():
+async def reload(broadcast: bool = True):
     await on_shutdown()
     # Clear existing pipelines
     PIPELINES.clear()
@@ -246,12 +292,93 @@ async def reload():
     # Load pipelines afresh
     await on_startup()
 
+    if broadcast and PIPELINES_WORKERS > 1:
+        SYNC_STATE["pipelines"] = PIPELINE_SYNC.bump_pipelines()["pipelines"]
+
+
+async def reload_valves(pipeline_id: str):
+    pipeline = PIPELINE_MODULES.get(pipeline_id)
+    if pipeline is None or not hasattr(pipeline, "valves"):
+        return
+
+    valves_json_path = os.path.join(
+        PIPELINES_DIR, PIPELINE_NAMES[pipeline_id], "valves.json"
+    )
+    with open(valves_json_path, "r") as f:
+        valves_json = json.load(f)
+
+    ValvesModel = pipeline.valves.__class__
+    pipeline.valves = ValvesModel(**{**pipeline.valves.model_dump(), **valves_json})
+    logging.info(f"Reloaded valves for pipeline: {pipeline_id}")
+
+    if hasattr(pipeline, "on_valves_updated"):
+        await pipeline.on_valves_updated()
+
+
+async def apply_pipeline_changes():
+    """Applies pipeline and valve changes made by other workers."""
+    if not PIPELINE_SYNC.changed():
+        return
+
+    state = PIPELINE_SYNC.read()
+    if state["pipelines"] != SYNC_STATE["pipelines"]:
+        SYNC_STATE.update(state)
+        logging.info("Pipelines changed in another worker, reloading")
+        await reload(broadcast=False)
+        return
+
+    for pipeline_id, generation in state["valves"].items():
+        if SYNC_STATE["valves"].get(pipeline_id) != generation:
+            SYNC_STATE["valves"][pipeline_id] = generation
+            await reload_valves(pipeline_id)
+
+
+async def watch_pipeline_changes():
+    while True:
+        await asyncio.sleep(PIPELINES_SYNC_INTERVAL)
+        try:
+            await apply_pipeline_changes()
+        except Exception as e:
+            logging.error(f"Failed to apply pipeline changes: {e}")
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    if REQUEST_CAPTURE:
+        REQUEST_CAPTURE.start()
+
+    watcher = None
+    stale_valves = []
+    if PIPELINES_WORKERS > 1:
+        PIPELINE_SYNC.changed()
+        state = PIPELINE_SYNC.read()
+        if PIPELINE_MODULES:
+            # Forked from the master with what it loaded at boot; a worker
+            # replacing a crashed one must apply the changes made since
+            if state["pipelines"] != SYNC_STATE["pipelines"]:
+                logging.info("Pipelines changed since the master loaded them, reloading")
+                PIPELINES.clear()
+                PIPELINE_MODULES.clear()
+                PIPELINE_NAMES.clear()
+            else:
+                stale_valves = [
+                    pipeline_id
+                    for pipeline_id, generation in state["valves"].items()
+                    if SYNC_STATE["valves"].get(pipeline_id) != generation
+                ]
+        SYNC_STATE.update(state)
+        watcher = asyncio.create_task(watch_pipeline_changes())
+
     await on_startup()
+    for pipeline_id in stale_valves:
+        await reload_valves(pipeline_id)
     yield
+
+    if watcher:
+        watcher.cancel()
     await on_shutdown()
+    if REQUEST_CAPTURE:
+        REQUEST_CAPTURE.stop()
 
 
 app = FastAPI(docs_url="/docs", redoc_url=None, lifespan=lifespan)
@@ -275,10 +402,29 @@ app.add_middleware(
 async def check_url(request: Request, call_next):
     start_time = int(time.time())
     app.state.PIPELINES = get_all_pipelines()
+
+    capture_body = None
+    if REQUEST_CAPTURE and REQUEST_CAPTURE.should_capture(
+        request.method, request.url.path
+    ):
+        capture_body = await request.body()
+        capture_started_at = time.time()
+        capture_start = time.perf_counter()
+
     response = await call_next(request)
     process_time = int(time.time()) - start_time
     response.headers["X-Process-Time"] = str(process_time)
 
+    if capture_body is not None:
+        # For streaming responses this is the time until the headers are sent.
+        REQUEST_CAPTURE.record(
+            request.url.path,
+            capture_body,
+            response.status_code,
+            capture_started_at,
+            (time.perf_counter() - capture_start) * 1000,
+        )
+
     return response
 
 
@@ -582,6 +728,10 @@ async def update_valves(pipeline_id: str, form_data: dict):
 
         if hasattr(pipeline, "on_valves_updated"):
             await pipeline.on_valves_updated()
+
+        if PIPELINES_WORKERS > 1:
+            state = PIPELINE_SYNC.bump_valves(pipeline_id)
+            SYNC_STATE["valves"][pipeline_id] = state["valves"][pipeline_id]
     except Exception as e:
         print(e)
         raise HTTPException(
@@ -656,6 +806,111 @@ async def filter_outlet(pipeline_id: str, form_data: FilterForm):
         )
 
 
+def get_stream_filters(model_id: str) -> list:
+    """Returns the filters with a `stream` hook connected to a model, by priority."""
+    filters = []
+    for pipeline_id, pipeline in PIPELINE_MODULES.items():
+        if getattr(pipeline, "type", None) != "filter" or not hasattr(
+            pipeline, "stream"
+        ):
+            continue
+
+        valves = getattr(pipeline, "valves", None)
+        targets = getattr(valves, "pipelines", [])
+        if "*" in targets or model_id in targets:
+            filters.append((getattr(valves, "priority", 0), pipeline_id, pipeline))
+
+    return [pipeline for _, _, pipeline in sorted(filters, key=lambda f: f[:2])]
+
+
+async def apply_stream_filters(event: dict, filters: list, body: dict) -> Optional[dict]:
+    for pipeline in filters:
+        try:
+            event = await pipeline.stream(event, body)
+        except Exception as e:
+            logging.error(f"stream filter {pipeline.__module__} failed: {e}")
+        if event is None:
+            break
+    return event
+
+
+async def filter_stream(
+    lines: Iterator[str], filters: list, body: dict
+) -> AsyncIterator[str]:
+    """
+    Passes each chunk of a streamed completion through the filters' `stream`
+    hooks, in order, on the event loop.
+
+    A hook receives the parsed chunk and the request body and returns the
+    chunk to send, or None to drop it. All chunks of a completion share the
+    same id, and the last one has a `finish_reason`, so hooks that buffer
+    text can key their state by id and flush it on that chunk. Upstreams
+    that end a completion without one (at `[DONE]` or the end of the
+    stream) get a final chunk with `finish_reason: "stop"` added.
+    """
+    # (id, model) of the completion streaming without its last chunk yet
+    unfinished = None
+
+    async def finish():
+        completion_id, model = unfinished
+        event = await apply_stream_filters(
+            {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "delta": {},
+                        "logprobs": None,
+                        "finish_reason": "stop",
+                    }
+                ],
+            },
+            filters,
+            body,
+        )
+        return f"data: {json.dumps(event)}\n\n" if event is not None else None
+
+    async for line in iterate_in_threadpool(lines):
+        data = line.strip()
+        if data == "data: [DONE]":
+            if unfinished is not None:
+                chunk = await finish()
+                unfinished = None
+                if chunk is not None:
+                    yield chunk
+            yield line
+            continue
+
+        if not data.startswith("data:"):
+            yield line
+            continue
+
+        try:
+            event = json.loads(data[len("data:") :])
+        except ValueError:
+            yield line
+            continue
+
+        choices = event.get("choices") or []
+        if choices:
+            if choices[0].get("finish_reason") is None:
+                unfinished = (event.get("id"), event.get("model"))
+            else:
+                unfinished = None
+
+        event = await apply_stream_filters(event, filters, body)
+        if event is not None:
+            yield f"data: {json.dumps(event)}\n\n"
+
+    if unfinished is not None:
+        chunk = await finish()
+        if chunk is not None:
+            yield chunk
+
+
 @app.post("/v1/chat/completions")
 @app.post("/chat/completions")
 async def generate_openai_chat_completion(form_data: OpenAIChatCompletionForm):
@@ -686,6 +941,7 @@ async def generate_openai_chat_completion(form_data: OpenAIChatCompletionForm):
             pipe = PIPELINE_MODULES[pipeline_id].pipe
 
         if form_data.stream:
+            completion_id = f"{form_data.model}-{str(uuid.uuid4())}"
 
             def stream_content():
                 res = pipe(
@@ -697,7 +953,9 @@ async def generate_openai_chat_completion(form_data: OpenAIChatCompletionForm):
                 logging.info(f"stream:true:{res}")
 
                 if isinstance(res, str):
-                    message = stream_message_template(form_data.model, res)
+                    message = stream_message_template(
+                        form_data.model, res, completion_id
+                    )
                     logging.info(f"stream_content:str:{message}")
                     yield f"data: {json.dumps(message)}\n\n"
 
@@ -720,12 +978,14 @@ async def generate_openai_chat_completion(form_data: OpenAIChatCompletionForm):
                         if isinstance(line, str) and line.startswith("data:"):
                             yield f"{line}\n\n"
                         else:
-                            line = stream_message_template(form_data.model, line)
+                            line = stream_message_template(
+                                form_data.model, line, completion_id
+                            )
                             yield f"data: {json.dumps(line)}\n\n"
 
                 if isinstance(res, str) or isinstance(res, Generator):
                     finish_message = {
-                        "id": f"{form_data.model}-{str(uuid.uuid4())}",
+                        "id": completion_id,
                         "object": "chat.completion.chunk",
                         "created": int(time.time()),
                         "model": form_data.model,
@@ -742,7 +1002,13 @@ async def generate_openai_chat_completion(form_data: OpenAIChatCompletionForm):
                     yield f"data: {json.dumps(finish_message)}\n\n"
                     yield f"data: [DONE]"
 
-            return StreamingResponse(stream_content(), media_type="text/event-stream")
+            content = stream_content()
+
+            filters = get_stream_filters(form_data.model)
+            if filters:
+                content = filter_stream(content, filters, form_data.model_dump())
+
+            return StreamingResponse(content, media_type="text/event-stream")
         else:
             res = pipe(
                 user_message=user_message,
@@ -0,0 +1,121 @@
+"""
+Pre-fork launcher: loads all pipelines once in a master process, then forks
+the uvicorn workers.
+
+Pipelines are imported and their optional `on_prefork` hook is run before
+forking, so heavy read-only state built there (tokenizers, embedding
+matrices, indexes) is shared copy-on-write between the workers instead of
+being rebuilt by each of them. The garbage collector is frozen after
+loading so collections in the workers do not touch, and therefore copy, the
+pages holding that state. `on_startup` still runs in every worker and is the
+place for threads, sockets and clients, which do not survive a fork.
+Crashed workers are replaced by new forks of the master; these reload the
+pipelines, or the valves, changed since the master loaded them.
+
+Run with:
+    PIPELINES_WORKERS=4 python prefork.py
+"""
+
+import asyncio
+import gc
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+
+import uvicorn
+
+import main
+from config import PIPELINES_WORKERS
+
+
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "9099"))
+UVICORN_LOOP = os.getenv("UVICORN_LOOP", "auto")
+
+
+def bind_socket() -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in HOST else socket.AF_INET)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((HOST, PORT))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(sock: socket.socket):
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+    config = uvicorn.Config(
+        main.app,
+        loop=UVICORN_LOOP,
+        forwarded_allow_ips="*",
+        proxy_headers=True,
+    )
+    server = uvicorn.Server(config)
+    server.run(sockets=[sock])
+
+
+def spawn_worker(sock: socket.socket) -> int:
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            run_worker(sock)
+        except Exception as e:
+            logging.exception(f"Worker crashed: {e}")
+            code = 1
+        finally:
+            os._exit(code)
+    return pid
+
+
+def main_process():
+    sock = bind_socket()
+
+    asyncio.run(main.on_prefork())
+    logging.info(f"Pre-loaded {len(main.PIPELINE_MODULES)} pipelines")
+
+    # Move everything allocated so far to the permanent generation, so the
+    # workers' collections never write to the shared pages.
+    gc.collect()
+    gc.freeze()
+
+    workers = {spawn_worker(sock) for _ in range(max(1, PIPELINES_WORKERS))}
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+
+        workers.discard(pid)
+        if not stopping:
+            logging.warning(f"Worker {pid} exited with status {status}, restarting")
+            time.sleep(1)
+            workers.add(spawn_worker(sock))
+
+    sock.close()
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main_process()
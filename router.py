@@ -0,0 +1,579 @@
+"""
+Router mode: a thin front process that owns the HTTP API and forwards each
+request to a pool of backend Pipelines processes.
+
+Pools are declared in the JSON file referenced by `PIPELINES_ROUTER_CONFIG`:
+
+    {
+        "pools": {
+            "rag": {"pipelines": ["llamaindex_pipeline"], "replicas": 2},
+            "moderation": {"pipelines": ["detoxify_filter_pipeline"]}
+        },
+        "default_replicas": 1
+    }
+
+Pipelines are referenced by file name (without `.py`). Every pipeline that is
+not assigned to a pool is loaded by the `default` pool. Each backend is a
+regular `uvicorn main:app` process whose `PIPELINES_DIR` only links the
+pipelines of its pool, so heavy pipelines are only loaded where they are
+needed and can be scaled independently.
+
+Run with:
+    PIPELINES_ROUTER_CONFIG=router.json uvicorn router:app --port 9099
+"""
+
+from fastapi import FastAPI, Request, Depends, status, HTTPException, UploadFile, File
+from fastapi.middleware.cors import CORSMiddleware
+
+from starlette.responses import StreamingResponse, Response
+from pydantic import BaseModel
+from typing import Dict, List, Optional
+
+from utils.pipelines.auth import get_current_user
+from utils.pipelines.misc import convert_to_raw_url
+
+from contextlib import asynccontextmanager
+from urllib.parse import urlparse
+
+import shutil
+import asyncio
+import aiohttp
+import os
+import logging
+import json
+import socket
+import subprocess
+import sys
+import time
+
+
+from config import API_KEY, PIPELINES_DIR, LOG_LEVELS, PIPELINES_ROUTER_CONFIG
+
+if not os.path.exists(PIPELINES_DIR):
+    os.makedirs(PIPELINES_DIR)
+
+POOLS_DIR = os.path.join(PIPELINES_DIR, ".pools")
+DEFAULT_POOL = "default"
+
+log_level = os.getenv("GLOBAL_LOG_LEVEL", "INFO").upper()
+logging.basicConfig(level=LOG_LEVELS[log_level])
+
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class Backend:
+    """A single `uvicorn main:app` process serving one pool."""
+
+    def __init__(self, pool: "Pool", index: int):
+        self.pool = pool
+        self.index = index
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.process: Optional[subprocess.Popen] = None
+        self.inflight = 0
+
+    def start(self):
+        env = {
+            **os.environ,
+            "PIPELINES_DIR": self.pool.directory,
+            # Replicas of a pool share valves through the worker sync
+            "PIPELINES_WORKERS": str(self.pool.replicas),
+        }
+        env.pop("PIPELINES_ROUTER_CONFIG", None)
+        self.process = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "uvicorn",
+                "main:app",
+                "--host",
+                "127.0.0.1",
+                "--port",
+                str(self.port),
+                "--forwarded-allow-ips",
+                "*",
+            ],
+            env=env,
+        )
+        logging.info(
+            f"Started backend {self.pool.name}[{self.index}] on port {self.port}"
+        )
+
+    def alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def stop(self):
+        if self.alive():
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+
+class Pool:
+    def __init__(self, name: str, pipelines: List[str], replicas: int):
+        self.name = name
+        self.pipelines = pipelines
+        self.replicas = max(1, replicas)
+        self.directory = os.path.join(POOLS_DIR, name)
+        self.backends = [Backend(self, i) for i in range(self.replicas)]
+
+    def sync_directory(self, module_names: List[str]):
+        """
+        Links the pool's pipeline files and their valves folders from
+        PIPELINES_DIR into the pool directory.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+
+        for filename in os.listdir(self.directory):
+            path = os.path.join(self.directory, filename)
+            if os.path.islink(path) and (
+                os.path.splitext(filename)[0] not in module_names
+                or not os.path.exists(path)
+            ):
+                os.remove(path)
+
+        for module_name in module_names:
+            source = os.path.abspath(os.path.join(PIPELINES_DIR, f"{module_name}.py"))
+            folder = os.path.abspath(os.path.join(PIPELINES_DIR, module_name))
+            os.makedirs(folder, exist_ok=True)
+
+            for src, dest in (
+                (source, os.path.join(self.directory, f"{module_name}.py")),
+                (folder, os.path.join(self.directory, module_name)),
+            ):
+                if not os.path.lexists(dest):
+                    os.symlink(src, dest)
+
+    def pick(self) -> Backend:
+        """Returns the live replica with the fewest in-flight requests."""
+        backends = [b for b in self.backends if b.alive()] or self.backends
+        return min(backends, key=lambda b: b.inflight)
+
+
+class Router:
+    def __init__(self, config: dict):
+        self.config = config
+        self.pools: Dict[str, Pool] = {}
+        self.routes: Dict[str, Pool] = {}
+        self.routes_refreshed_at = 0.0
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.monitor: Optional[asyncio.Task] = None
+
+        assigned = set()
+        for name, pool_config in config.get("pools", {}).items():
+            pipelines = pool_config.get("pipelines", [])
+            assigned.update(pipelines)
+            self.pools[name] = Pool(name, pipelines, pool_config.get("replicas", 1))
+
+        if DEFAULT_POOL not in self.pools:
+            self.pools[DEFAULT_POOL] = Pool(
+                DEFAULT_POOL, [], config.get("default_replicas", 1)
+            )
+        self.assigned = assigned
+
+    def module_names(self) -> List[str]:
+        return [
+            filename[:-3]
+            for filename in os.listdir(PIPELINES_DIR)
+            if filename.endswith(".py")
+        ]
+
+    def sync_directories(self):
+        modules = self.module_names()
+        for pool in self.pools.values():
+            if pool.name == DEFAULT_POOL:
+                pool_modules = [m for m in modules if m not in self.assigned]
+            else:
+                pool_modules = [m for m in modules if m in pool.pipelines]
+            pool.sync_directory(pool_modules)
+
+    def backends(self) -> List[Backend]:
+        return [b for pool in self.pools.values() for b in pool.backends]
+
+    async def wait_ready(self, backend: Backend, timeout: float = 600):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline and backend.alive():
+            try:
+                async with self.session.get(f"{backend.url}/") as r:
+                    if r.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.2)
+        logging.error(f"Backend {backend.pool.name}[{backend.index}] is not ready")
+
+    async def start(self):
+        self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=None))
+        self.sync_directories()
+        for backend in self.backends():
+            backend.start()
+        await asyncio.gather(*(self.wait_ready(b) for b in self.backends()))
+        await self.refresh_routes()
+        self.monitor = asyncio.create_task(self.monitor_backends())
+
+    async def stop(self):
+        if self.monitor:
+            self.monitor.cancel()
+        for backend in self.backends():
+            backend.stop()
+        if self.session:
+            await self.session.close()
+
+    async def monitor_backends(self):
+        while True:
+            await asyncio.sleep(1)
+            exited = [
+                backend
+                for backend in self.backends()
+                if backend.process is not None and not backend.alive()
+            ]
+            for backend in exited:
+                logging.warning(
+                    f"Backend {backend.pool.name}[{backend.index}] exited, restarting"
+                )
+                backend.start()
+            # Restarted together, so one slow backend does not delay the others
+            await asyncio.gather(*(self.wait_ready(b) for b in exited))
+
+    async def fetch_json(self, backend: Backend, path: str) -> dict:
+        async with self.session.get(
+            f"{backend.url}{path}", headers={"Authorization": f"Bearer {API_KEY}"}
+        ) as r:
+            r.raise_for_status()
+            return await r.json()
+
+    async def post(self, backend: Backend, path: str):
+        async with self.session.post(
+            f"{backend.url}{path}", headers={"Authorization": f"Bearer {API_KEY}"}
+        ) as r:
+            if r.status != 200:
+                logging.error(
+                    f"POST {path} on {backend.pool.name}[{backend.index}] failed: {r.status}"
+                )
+
+    async def refresh_routes(self):
+        routes = {}
+        for pool in self.pools.values():
+            try:
+                pipelines = await self.fetch_json(pool.pick(), "/pipelines")
+            except Exception as e:
+                logging.error(f"Failed to list pipelines of pool {pool.name}: {e}")
+                continue
+            for pipeline in pipelines["data"]:
+                routes[pipeline["id"]] = pool
+        self.routes = routes
+        self.routes_refreshed_at = time.monotonic()
+
+    async def resolve(self, pipeline_id: str) -> Pool:
+        pool = self.routes.get(pipeline_id) or self.routes.get(
+            pipeline_id.split(".")[0]
+        )
+        if pool is None and time.monotonic() - self.routes_refreshed_at > 1:
+            await self.refresh_routes()
+            pool = self.routes.get(pipeline_id) or self.routes.get(
+                pipeline_id.split(".")[0]
+            )
+        if pool is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Pipeline {pipeline_id} not found",
+            )
+        return pool
+
+    async def reload(self):
+        self.sync_directories()
+        await asyncio.gather(
+            *(self.post(pool.pick(), "/pipelines/reload") for pool in self.pools.values())
+        )
+        await self.refresh_routes()
+
+    async def forward(self, pool: Pool, request: Request, body: bytes) -> Response:
+        backend = pool.pick()
+        backend.inflight += 1
+        headers = {
+            key: value
+            for key, value in request.headers.items()
+            if key.lower() not in ("host", "content-length")
+        }
+        try:
+            r = await self.session.request(
+                request.method,
+                f"{backend.url}{request.url.path}",
+                params=request.query_params,
+                data=body,
+                headers=headers,
+            )
+        except Exception:
+            backend.inflight -= 1
+            raise
+
+        response_headers = {
+            key: value
+            for key, value in r.headers.items()
+            if key.lower()
+            not in ("content-length", "transfer-encoding", "connection", "content-encoding")
+        }
+
+        if r.headers.get("content-type", "").startswith("text/event-stream"):
+
+            async def stream():
+                try:
+                    async for chunk in r.content.iter_any():
+                        yield chunk
+                finally:
+                    r.release()
+                    backend.inflight -= 1
+
+            return StreamingResponse(
+                stream(), status_code=r.status, headers=response_headers
+            )
+
+        try:
+            content = await r.read()
+        finally:
+            r.release()
+            backend.inflight -= 1
+        return Response(content=content, status_code=r.status, headers=response_headers)
+
+
+def load_router_config() -> dict:
+    with open(PIPELINES_ROUTER_CONFIG, "r") as f:
+        return json.load(f)
+
+
+ROUTER = Router(load_router_config() if PIPELINES_ROUTER_CONFIG else {})
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await ROUTER.start()
+    yield
+    await ROUTER.stop()
+
+
+app = FastAPI(docs_url="/docs", redoc_url=None, lifespan=lifespan)
+
+
+origins = ["*"]
+
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=origins,
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+
+def require_api_key(user: str):
+    if user != API_KEY:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid API key",
+        )
+
+
+@app.get("/v1")
+@app.get("/")
+async def get_status():
+    return {"status": True}
+
+
+@app.get("/v1/models")
+@app.get("/models")
+async def get_models(user: str = Depends(get_current_user)):
+    """
+    Returns the available pipelines of all pools
+    """
+    responses = await asyncio.gather(
+        *(ROUTER.fetch_json(pool.pick(), "/models") for pool in ROUTER.pools.values()),
+        return_exceptions=True,
+    )
+    data = []
+    for response in responses:
+        if isinstance(response, Exception):
+            logging.error(f"Failed to fetch models: {response}")
+            continue
+        data.extend(response["data"])
+    return {"data": data, "object": "list", "pipelines": True}
+
+
+@app.get("/v1/pipelines")
+@app.get("/pipelines")
+async def list_pipelines(user: str = Depends(get_current_user)):
+    require_api_key(user)
+    responses = await asyncio.gather(
+        *(
+            ROUTER.fetch_json(pool.pick(), "/pipelines")
+            for pool in ROUTER.pools.values()
+        ),
+        return_exceptions=True,
+    )
+    data = []
+    for response in responses:
+        if not isinstance(response, Exception):
+            data.extend(response["data"])
+    return {"data": data}
+
+
+class AddPipelineForm(BaseModel):
+    url: str
+
+
+async def download_file(url: str, dest_folder: str):
+    filename = os.path.basename(urlparse(url).path)
+    if not filename.endswith(".py"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="URL must point to a Python file",
+        )
+
+    file_path = os.path.join(dest_folder, filename)
+
+    async with ROUTER.session.get(url) as response:
+        if response.status != 200:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Failed to download file",
+            )
+        with open(file_path, "wb") as f:
+            f.write(await response.read())
+
+    return file_path
+
+
+@app.post("/v1/pipelines/add")
+@app.post("/pipelines/add")
+async def add_pipeline(
+    form_data: AddPipelineForm, user: str = Depends(get_current_user)
+):
+    require_api_key(user)
+
+    try:
+        url = convert_to_raw_url(form_data.url)
+        file_path = await download_file(url, dest_folder=PIPELINES_DIR)
+        await ROUTER.reload()
+        return {
+            "status": True,
+            "detail": f"Pipeline added successfully from {file_path}",
+        }
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e),
+        )
+
+
+@app.post("/v1/pipelines/upload")
+@app.post("/pipelines/upload")
+async def upload_pipeline(
+    file: UploadFile = File(...), user: str = Depends(get_current_user)
+):
+    require_api_key(user)
+
+    if os.path.splitext(file.filename)[1] != ".py":
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Only Python files are allowed.",
+        )
+
+    try:
+        file_path = os.path.join(PIPELINES_DIR, file.filename)
+        with open(file_path, "wb") as buffer:
+            shutil.copyfileobj(file.file, buffer)
+
+        await ROUTER.reload()
+        return {
+            "status": True,
+            "detail": f"Pipeline uploaded successfully to {file_path}",
+        }
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e),
+        )
+
+
+class DeletePipelineForm(BaseModel):
+    id: str
+
+
+@app.delete("/v1/pipelines/delete")
+@app.delete("/pipelines/delete")
+async def delete_pipeline(
+    form_data: DeletePipelineForm, user: str = Depends(get_current_user)
+):
+    require_api_key(user)
+
+    pool = await ROUTER.resolve(form_data.id)
+    pipelines = await ROUTER.fetch_json(pool.pick(), "/pipelines")
+    pipeline_name = next(
+        (
+            p["name"]
+            for p in pipelines["data"]
+            if p["id"] == form_data.id.split(".")[0]
+        ),
+        None,
+    )
+
+    pipeline_path = os.path.join(PIPELINES_DIR, f"{pipeline_name}.py")
+    if pipeline_name and os.path.exists(pipeline_path):
+        os.remove(pipeline_path)
+        await ROUTER.reload()
+        return {
+            "status": True,
+            "detail": f"Pipeline {form_data.id} deleted successfully",
+        }
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Pipeline {form_data.id} not found",
+        )
+
+
+@app.post("/v1/pipelines/reload")
+@app.post("/pipelines/reload")
+async def reload_pipelines(user: str = Depends(get_current_user)):
+    require_api_key(user)
+    await ROUTER.reload()
+    return {"message": "Pipelines reloaded successfully."}
+
+
+@app.post("/v1/chat/completions")
+@app.post("/chat/completions")
+async def generate_openai_chat_completion(request: Request):
+    body = await request.body()
+    try:
+        model = json.loads(body)["model"]
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Request body must include a model",
+        )
+
+    pool = await ROUTER.resolve(model)
+    return await ROUTER.forward(pool, request, body)
+
+
+@app.api_route("/{path:path}", methods=["GET", "POST"])
+async def forward_pipeline_request(path: str, request: Request):
+    """
+    Forwards valves and filter requests to the pool serving the pipeline.
+    """
+    segments = path.split("/")
+    if segments[0] == "v1":
+        segments = segments[1:]
+    if len(segments) < 2:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+
+    pool = await ROUTER.resolve(segments[0])
+    return await ROUTER.forward(pool, request, await request.body())
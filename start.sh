@@ -5,6 +5,8 @@ HOST="${HOST:-0.0.0.0}"
 PIPELINES_DIR=${PIPELINES_DIR:-./pipelines}
 
 UVICORN_LOOP="${UVICORN_LOOP:-auto}"
+# Number of worker processes; pipeline and valve changes are broadcast between them
+export PIPELINES_WORKERS="${PIPELINES_WORKERS:-1}"
 
 # Function to reset pipelines
 reset_pipelines_dir() {
@@ -152,6 +154,14 @@ fi
 
 if [[ "$MODE" == "run" || "$MODE" == "full" ]]; then
   echo "Running via Mode: $MODE"
-  uvicorn main:app --host "$HOST" --port "$PORT" --forwarded-allow-ips '*' --loop "$UVICORN_LOOP"
+  if [[ -n "$PIPELINES_ROUTER_CONFIG" ]]; then
+    # Router mode: a front process forwarding to per-pool backend processes
+    uvicorn router:app --host "$HOST" --port "$PORT" --forwarded-allow-ips '*' --loop "$UVICORN_LOOP"
+  elif [ "$PIPELINES_PREFORK" = true ]; then
+    # Load pipelines once and fork the workers so heavy state is shared
+    HOST="$HOST" PORT="$PORT" UVICORN_LOOP="$UVICORN_LOOP" python prefork.py
+  else
+    uvicorn main:app --host "$HOST" --port "$PORT" --forwarded-allow-ips '*' --loop "$UVICORN_LOOP" --workers "$PIPELINES_WORKERS"
+  fi
 fi
 
@@ -0,0 +1,144 @@
+import asyncio
+
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any, Callable, List, Optional
+
+
+class MicroBatcher:
+    """
+    Groups concurrent requests to a model into batched predictions.
+
+    `submit(item)` queues an item and waits for its result. A worker task
+    takes the queued items once `max_batch_size` of them are waiting or the
+    first one has waited `max_wait_ms`, and runs `predict(items)`, which must
+    return one result per item, in `executor` (a single thread by default, so
+    the event loop keeps serving requests during inference). Items that
+    arrive while a batch runs form the next batch. The wait is skipped while
+    traffic is sequential (the previous batch had a single item), so a lone
+    request is not delayed. If `predict` raises, every caller of that batch
+    gets the exception. `close` fails the queued and running requests with
+    a RuntimeError, unless it is asked to drain them.
+    """
+
+    def __init__(
+        self,
+        predict: Callable[[List[Any]], List[Any]],
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5.0,
+        executor: Optional[Executor] = None,
+        name: str = "batcher",
+    ):
+        self.predict = predict
+        self.name = name
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.executor = executor or ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix=name
+        )
+        self.queue: Optional[asyncio.Queue] = None
+        self.task: Optional[asyncio.Task] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        # (item, future) pairs taken from the queue and not answered yet
+        self.batch: list = []
+
+        self.batches = 0
+        self.items = 0
+        self.last_batch_size = 0
+
+    @property
+    def mean_batch_size(self) -> float:
+        return self.items / self.batches if self.batches else 0.0
+
+    def _ensure_worker(self):
+        loop = asyncio.get_running_loop()
+        if self.task is None or self.task.done() or self.loop is not loop:
+            self.loop = loop
+            self.queue = asyncio.Queue()
+            self.task = loop.create_task(self._run())
+
+    async def submit(self, item: Any) -> Any:
+        self._ensure_worker()
+        future = self.loop.create_future()
+        self.queue.put_nowait((item, future))
+        return await future
+
+    async def _collect(self) -> list:
+        # Collected into self.batch, so `close` can fail them while waiting
+        self.batch = batch = [await self.queue.get()]
+        wait = self.max_wait if self.last_batch_size > 1 else 0
+        deadline = self.loop.time() + wait
+        while len(batch) < self.max_batch_size:
+            if not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+                continue
+            timeout = deadline - self.loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            collected = await self._collect()
+            await self._answer(collected)
+            self.batch = []
+            for _ in collected:
+                self.queue.task_done()
+
+    async def _answer(self, batch: list):
+        # Callers that gave up (e.g. disconnected) are not predicted
+        self.batch = batch = [
+            (item, future) for item, future in batch if not future.done()
+        ]
+        if not batch:
+            return
+
+        items = [item for item, _ in batch]
+        try:
+            results = await self.loop.run_in_executor(
+                self.executor, self.predict, items
+            )
+            if len(results) != len(items):
+                raise ValueError(
+                    f"predict returned {len(results)} results for {len(items)} items"
+                )
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.items += len(items)
+        self.last_batch_size = len(items)
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    async def close(self, drain: bool = False):
+        """
+        Stops the worker. With `drain`, the queued and running requests are
+        answered first, e.g. when replacing the batcher; otherwise they fail.
+        """
+        if drain and self.task is not None and not self.task.done():
+            await self.queue.join()
+
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+        pending = self.batch
+        self.batch = []
+        while self.queue is not None and not self.queue.empty():
+            pending.append(self.queue.get_nowait())
+        for _, future in pending:
+            if not future.done():
+                future.set_exception(RuntimeError(f"{self.name} is closed"))
+        self.executor.shutdown(wait=False)
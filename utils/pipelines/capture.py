@@ -0,0 +1,161 @@
+import hashlib
+import json
+import logging
+import os
+import queue
+import random
+import threading
+
+from typing import Optional
+
+
+CAPTURE_PATHS = ("/chat/completions", "/filter/inlet", "/filter/outlet")
+SENSITIVE_KEYS = {"email", "api_key", "apikey", "authorization", "token", "password"}
+
+
+def hash_value(value) -> str:
+    return hashlib.sha256(str(value).encode("utf-8")).hexdigest()[:16]
+
+
+def redact_content(content):
+    if isinstance(content, str):
+        # Keep the length so replayed requests cost roughly the same.
+        return "x" * len(content)
+    if isinstance(content, list):
+        return [
+            (
+                {**item, "text": redact_content(item.get("text", ""))}
+                if isinstance(item, dict) and item.get("type") == "text"
+                else item
+            )
+            for item in content
+        ]
+    return content
+
+
+def sanitize(value, redact_messages: bool = False):
+    """
+    Returns a copy of a request body that is safe to write to disk.
+
+    User identifiers are replaced by stable hashes, well known secret fields
+    are removed and, optionally, message contents are replaced by placeholders
+    of the same length.
+    """
+    if isinstance(value, dict):
+        sanitized = {}
+        for key, item in value.items():
+            if key.lower() in SENSITIVE_KEYS:
+                continue
+            if key == "user" and isinstance(item, dict):
+                sanitized[key] = {
+                    "id": hash_value(item.get("id")),
+                    "role": item.get("role"),
+                }
+            elif key == "messages" and redact_messages and isinstance(item, list):
+                sanitized[key] = [
+                    (
+                        {**m, "content": redact_content(m.get("content"))}
+                        if isinstance(m, dict)
+                        else m
+                    )
+                    for m in item
+                ]
+            else:
+                sanitized[key] = sanitize(item, redact_messages)
+        return sanitized
+    if isinstance(value, list):
+        return [sanitize(item, redact_messages) for item in value]
+    return value
+
+
+class RequestCapture:
+    """
+    Appends sampled request bodies and timing metadata to a JSONL file.
+
+    Records are handed to a background thread through a bounded queue, so the
+    request path never waits on disk I/O. When the queue is full the record is
+    dropped and counted in `dropped`.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        sample_rate: float = 1.0,
+        redact_messages: bool = False,
+        max_queue_size: int = 10000,
+    ):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.redact_messages = redact_messages
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.dropped = 0
+        self.written = 0
+        self._thread: Optional[threading.Thread] = None
+
+    def should_capture(self, method: str, path: str) -> bool:
+        if method != "POST" or not path.endswith(CAPTURE_PATHS):
+            return False
+        return self.sample_rate >= 1.0 or random.random() < self.sample_rate
+
+    def record(
+        self,
+        path: str,
+        body: bytes,
+        status_code: int,
+        started_at: float,
+        duration_ms: float,
+    ):
+        try:
+            self.queue.put_nowait((path, body, status_code, started_at, duration_ms))
+        except queue.Full:
+            self.dropped += 1
+
+    def start(self):
+        if self._thread is not None:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._thread = threading.Thread(
+            target=self._run, name="request-capture", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        if self._thread is None:
+            return
+        self.queue.put(None)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _serialize(self, path, body, status_code, started_at, duration_ms) -> str:
+        try:
+            payload = sanitize(json.loads(body), self.redact_messages)
+        except Exception:
+            payload = None
+        return json.dumps(
+            {
+                "timestamp": started_at,
+                "path": path,
+                "status_code": status_code,
+                "duration_ms": round(duration_ms, 3),
+                "body": payload,
+            }
+        )
+
+    def _run(self):
+        with open(self.path, "a") as f:
+            while True:
+                item = self.queue.get()
+                if item is None:
+                    break
+                try:
+                    f.write(self._serialize(*item) + "\n")
+                    self.written += 1
+                except Exception as e:
+                    logging.warning(f"Failed to capture request: {e}")
+
+                # Batch writes: only flush once the queue has been drained.
+                if self.queue.empty():
+                    f.flush()
+
@@ -0,0 +1,149 @@
+import logging
+import threading
+import time
+
+from collections import deque
+from typing import Callable, Optional
+
+
+class ExportQueue:
+    """
+    Runs observability exports (SDK calls, payload building, flushes) on a
+    background thread, so filters only pay for an append on the request path.
+
+    Tasks are run in submission order. The queue holds at most `max_size`
+    tasks; when it is full the oldest task is dropped and counted in
+    `dropped`, so a slow or unreachable backend never grows memory or blocks
+    requests. Tasks are taken in batches of up to `batch_size`, and
+    `flush` (e.g. the SDK's own flush) is called after `batch_size` tasks
+    or `flush_interval` seconds, rather than once per request. Pending tasks
+    are run and flushed on `stop`.
+    """
+
+    def __init__(
+        self,
+        flush: Optional[Callable[[], None]] = None,
+        max_size: int = 10000,
+        batch_size: int = 100,
+        flush_interval: float = 1.0,
+        name: str = "export",
+    ):
+        self.flush = flush
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.name = name
+
+        self.tasks = deque(maxlen=max_size)
+        self.condition = threading.Condition()
+        self.running = False
+        self.idle = True
+        self._thread: Optional[threading.Thread] = None
+
+        self.submitted = 0
+        self.exported = 0
+        self.dropped = 0
+        self.failed = 0
+        self.flushes = 0
+
+    def submit(self, fn: Callable, *args, **kwargs):
+        """Queues `fn(*args, **kwargs)` to run on the export thread."""
+        with self.condition:
+            if len(self.tasks) == self.tasks.maxlen:
+                self.dropped += 1
+            self.tasks.append((fn, args, kwargs))
+            self.submitted += 1
+            if len(self.tasks) == 1:
+                self.condition.notify()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self.running = True
+        self._thread = threading.Thread(
+            target=self._run, name=f"{self.name}-queue", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        """Runs the pending tasks, flushes and stops the export thread."""
+        if self._thread is None:
+            return
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def join(self, timeout: float = 10.0) -> bool:
+        """Waits until every submitted task has run. Returns False on timeout."""
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while self.tasks or not self.idle:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.condition.wait(min(remaining, 0.05))
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self.tasks),
+            "submitted": self.submitted,
+            "exported": self.exported,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "flushes": self.flushes,
+        }
+
+    def _flush(self):
+        if self.flush is None:
+            return
+        try:
+            self.flush()
+            self.flushes += 1
+        except Exception as e:
+            logging.warning(f"{self.name} flush failed: {e}")
+
+    def _run(self):
+        unflushed = 0
+        flushed_at = time.monotonic()
+
+        while True:
+            with self.condition:
+                self.idle = True
+                self.condition.notify_all()
+                if not self.tasks and self.running:
+                    timeout = None
+                    if unflushed:
+                        timeout = max(0, flushed_at + self.flush_interval - time.monotonic())
+                    self.condition.wait(timeout)
+                batch = [
+                    self.tasks.popleft()
+                    for _ in range(min(self.batch_size, len(self.tasks)))
+                ]
+                self.idle = not batch
+                if not batch and not self.running:
+                    break
+
+            for fn, args, kwargs in batch:
+                try:
+                    fn(*args, **kwargs)
+                    self.exported += 1
+                except Exception as e:
+                    self.failed += 1
+                    logging.warning(f"{self.name} export failed: {e}")
+            unflushed += len(batch)
+
+            now = time.monotonic()
+            if unflushed and (
+                unflushed >= self.batch_size or now - flushed_at >= self.flush_interval
+            ):
+                self._flush()
+                unflushed = 0
+                flushed_at = now
+
+        if unflushed:
+            self._flush()
+        with self.condition:
+            self.idle = True
+            self.condition.notify_all()
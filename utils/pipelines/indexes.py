@@ -0,0 +1,304 @@
+import hashlib
+import json
+import os
+import threading
+
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from llama_index.core import (
+    Settings,
+    StorageContext,
+    VectorStoreIndex,
+    load_index_from_storage,
+)
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    VectorStoreQuery,
+    VectorStoreQueryMode,
+    VectorStoreQueryResult,
+)
+
+MANIFEST_FILE = "manifest.json"
+VECTOR_STORE_NAME = "default__vector_store"
+
+
+def replace_file(path: str, write: Callable[[Any], None], mode: str = "w"):
+    """Writes a file through a temporary one, so readers never see it half written."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, mode) as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+
+class MmapVectorStore(BasePydanticVectorStore):
+    """
+    A vector store keeping embeddings in a float32 `.npy` file, which is
+    memory-mapped when loaded: loading it reads none of them, and queries
+    page them in on demand. Node and document ids are kept in a JSON file
+    next to it.
+
+    Queries are exact cosine similarity searches in numpy. Adding or
+    deleting nodes copies the embeddings into memory until the next
+    `persist`. Metadata filters and non-default query modes are not
+    supported; node text lives in the docstore, as with `SimpleVectorStore`.
+    """
+
+    stores_text: bool = False
+
+    _embeddings: np.ndarray = PrivateAttr()
+    _node_ids: List[str] = PrivateAttr()
+    _ref_doc_ids: List[str] = PrivateAttr()
+
+    def __init__(
+        self,
+        embeddings: Optional[np.ndarray] = None,
+        node_ids: Optional[List[str]] = None,
+        ref_doc_ids: Optional[List[str]] = None,
+    ):
+        super().__init__()
+        self._embeddings = (
+            embeddings if embeddings is not None else np.zeros((0, 0), np.float32)
+        )
+        self._node_ids = node_ids or []
+        self._ref_doc_ids = ref_doc_ids or []
+
+    @classmethod
+    def from_persist_dir(cls, persist_dir: str) -> "MmapVectorStore":
+        base = os.path.join(persist_dir, VECTOR_STORE_NAME)
+        with open(f"{base}.ids.json") as f:
+            ids = json.load(f)
+        embeddings = np.load(f"{base}.npy", mmap_mode="r")
+        return cls(embeddings, ids["node_ids"], ids["ref_doc_ids"])
+
+    @property
+    def client(self) -> None:
+        return None
+
+    def add(self, nodes: List[Any], **kwargs: Any) -> List[str]:
+        if not nodes:
+            return []
+        embeddings = np.asarray([node.get_embedding() for node in nodes], np.float32)
+        if len(self._node_ids):
+            embeddings = np.concatenate([self._embeddings, embeddings])
+        self._embeddings = embeddings
+        self._node_ids.extend(node.node_id for node in nodes)
+        self._ref_doc_ids.extend(node.ref_doc_id or "" for node in nodes)
+        return [node.node_id for node in nodes]
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        keep = [i for i, id in enumerate(self._ref_doc_ids) if id != ref_doc_id]
+        if len(keep) == len(self._ref_doc_ids):
+            return
+        self._embeddings = np.asarray(self._embeddings[keep])
+        self._node_ids = [self._node_ids[i] for i in keep]
+        self._ref_doc_ids = [self._ref_doc_ids[i] for i in keep]
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        if query.filters is not None or query.mode != VectorStoreQueryMode.DEFAULT:
+            raise NotImplementedError(
+                "MmapVectorStore only supports unfiltered default queries"
+            )
+        if not self._node_ids:
+            return VectorStoreQueryResult(similarities=[], ids=[])
+
+        rows = np.arange(len(self._node_ids))
+        embeddings = self._embeddings
+        if query.node_ids is not None:
+            allowed = set(query.node_ids)
+            rows = np.array(
+                [i for i, id in enumerate(self._node_ids) if id in allowed], dtype=int
+            )
+            if not len(rows):
+                return VectorStoreQueryResult(similarities=[], ids=[])
+            embeddings = embeddings[rows]
+
+        query_embedding = np.asarray(query.query_embedding, np.float32)
+        norms = np.linalg.norm(embeddings, axis=1) * np.linalg.norm(query_embedding)
+        similarities = (embeddings @ query_embedding) / np.where(norms > 0, norms, 1)
+
+        k = min(query.similarity_top_k, len(rows))
+        top = np.argpartition(-similarities, k - 1)[:k]
+        top = top[np.argsort(-similarities[top])]
+        return VectorStoreQueryResult(
+            similarities=[float(similarities[i]) for i in top],
+            ids=[self._node_ids[rows[i]] for i in top],
+        )
+
+    def persist(self, persist_path: str, fs: Any = None) -> None:
+        # Saved under this store's own names, whatever the storage context asks
+        base = os.path.join(os.path.dirname(persist_path), VECTOR_STORE_NAME)
+        replace_file(
+            f"{base}.npy",
+            lambda f: np.save(f, np.asarray(self._embeddings, np.float32)),
+            mode="wb",
+        )
+        replace_file(
+            f"{base}.ids.json",
+            lambda f: json.dump(
+                {"node_ids": self._node_ids, "ref_doc_ids": self._ref_doc_ids}, f
+            ),
+        )
+
+
+def fingerprint_directory(path: str, recursive: bool = True) -> str:
+    """
+    Hashes the paths, sizes and modification times of the files under
+    `path`, to tell whether a corpus may have changed without reading it.
+    """
+    entries = []
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        if not recursive:
+            dirs.clear()
+        for name in sorted(files):
+            file_path = os.path.join(root, name)
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                continue
+            entries.append(f"{file_path}:{stat.st_size}:{stat.st_mtime_ns}")
+    return hashlib.sha256("\n".join(entries).encode()).hexdigest()
+
+
+def content_hash(document) -> str:
+    """Hashes a document's text, leaving out metadata such as file dates."""
+    text = document.get_content().encode("utf-8", "surrogatepass")
+    return hashlib.sha256(text).hexdigest()
+
+
+def get_embed_model_id() -> str:
+    embed_model = Settings.embed_model
+    return f"{type(embed_model).__name__}:{getattr(embed_model, 'model_name', '')}"
+
+
+class PersistedIndex:
+    """
+    A LlamaIndex `VectorStoreIndex` persisted in `persist_dir`, with its
+    embeddings in a `MmapVectorStore`, so that pipelines do not re-embed
+    their corpus on every start.
+
+    `refresh` compares a cheap `fingerprint` of the source (e.g.
+    `fingerprint_directory`, or a git tree sha) with the one of the stored
+    index and, if it is unchanged, does not read the documents at all.
+    Otherwise it loads them and only embeds the ones whose content hash
+    changed, removing the ones that are gone. Documents need stable ids
+    (e.g. `SimpleDirectoryReader(..., filename_as_id=True)`). The stored
+    index is only loaded on the first `get`. Changing the embedding model
+    (`Settings.embed_model`) rebuilds it.
+
+    `get` and `refresh` are thread safe, so `pipe` can run in the server's
+    thread pool while `on_startup` refreshes the index.
+    """
+
+    def __init__(self, persist_dir: str):
+        self.persist_dir = persist_dir
+        self.index = None
+        self.lock = threading.RLock()
+        self.last_refresh: Dict[str, int] = {}
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.persist_dir, MANIFEST_FILE)
+
+    def read_manifest(self) -> Optional[dict]:
+        try:
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if manifest.get("embed_model") != get_embed_model_id():
+            print(f"Embedding model changed, rebuilding {self.persist_dir}")
+            return None
+        return manifest
+
+    def write_manifest(self, manifest: dict):
+        # Written after the index, so a crash in between leaves the old
+        # manifest, and the next refresh re-checks every document
+        replace_file(self.manifest_path, lambda f: json.dump(manifest, f))
+
+    def load(self):
+        storage_context = StorageContext.from_defaults(
+            persist_dir=self.persist_dir,
+            vector_store=MmapVectorStore.from_persist_dir(self.persist_dir),
+        )
+        return load_index_from_storage(storage_context)
+
+    def get(self):
+        """Returns the index, loading it from disk on first use."""
+        with self.lock:
+            if self.index is None:
+                if self.read_manifest() is None:
+                    raise RuntimeError(f"No index persisted in {self.persist_dir}")
+                self.index = self.load()
+            return self.index
+
+    def refresh(
+        self,
+        load_documents: Callable[[], List],
+        fingerprint: Optional[str] = None,
+    ) -> Dict[str, int]:
+        """
+        Brings the index up to date with the documents returned by
+        `load_documents`, unless the stored `fingerprint` matches. Returns
+        the number of documents inserted, updated, deleted and unchanged.
+        """
+        with self.lock:
+            manifest = self.read_manifest()
+            if (
+                manifest is not None
+                and fingerprint is not None
+                and manifest.get("fingerprint") == fingerprint
+            ):
+                self.last_refresh = {"unchanged": len(manifest["documents"])}
+                return self.last_refresh
+
+            loaded = load_documents()
+            documents = list({document.doc_id: document for document in loaded}.values())
+            if len(documents) < len(loaded):
+                print("Documents with duplicate ids, only the last ones are kept")
+            hashes = {document.doc_id: content_hash(document) for document in documents}
+
+            stats = {"inserted": 0, "updated": 0, "deleted": 0, "unchanged": 0}
+            if manifest is None:
+                self.index = VectorStoreIndex.from_documents(
+                    documents,
+                    storage_context=StorageContext.from_defaults(
+                        vector_store=MmapVectorStore()
+                    ),
+                )
+                stats["inserted"] = len(hashes)
+            else:
+                index = self.index if self.index is not None else self.load()
+                stored = manifest["documents"]
+                for doc_id in stored.keys() - hashes.keys():
+                    index.delete_ref_doc(doc_id, delete_from_docstore=True)
+                    stats["deleted"] += 1
+                for document in documents:
+                    stored_hash = stored.get(document.doc_id)
+                    if stored_hash == hashes[document.doc_id]:
+                        stats["unchanged"] += 1
+                        continue
+                    # Also checks the docstore, which may be ahead of the manifest
+                    if stored_hash is None and not index.docstore.get_ref_doc_info(
+                        document.doc_id
+                    ):
+                        index.insert(document)
+                        stats["inserted"] += 1
+                    else:
+                        index.update_ref_doc(document)
+                        stats["updated"] += 1
+                self.index = index
+
+            self.index.storage_context.persist(persist_dir=self.persist_dir)
+            self.write_manifest(
+                {
+                    "embed_model": get_embed_model_id(),
+                    "fingerprint": fingerprint,
+                    "documents": hashes,
+                }
+            )
+            self.last_refresh = stats
+            return stats
@@ -1,16 +1,21 @@
+import enum
+import types
 import uuid
 import time
 
-from typing import List
+from typing import List, Optional
+from pydantic import BaseModel
 from schemas import OpenAIChatMessage
 
 import inspect
-from typing import get_type_hints, Literal, Tuple
+from typing import get_args, get_origin, get_type_hints, Literal, Tuple, Union
 
 
-def stream_message_template(model: str, message: str):
+def stream_message_template(
+    model: str, message: str, completion_id: Optional[str] = None
+):
     return {
-        "id": f"{model}-{str(uuid.uuid4())}",
+        "id": completion_id or f"{model}-{str(uuid.uuid4())}",
         "object": "chat.completion.chunk",
         "created": int(time.time()),
         "model": model,
@@ -82,8 +87,8 @@ def add_or_update_system_message(content: str, messages: List[dict]) -> List[dic
 
 
 def doc_to_dict(docstring):
-    lines = docstring.split("\n")
-    description = lines[1].strip()
+    lines = [line.strip() for line in docstring.split("\n")]
+    description_lines = []
     param_dict = {}
 
     for line in lines:
@@ -91,63 +96,117 @@ def doc_to_dict(docstring):
             line = line.replace(":param", "").strip()
             param, desc = line.split(":", 1)
             param_dict[param.strip()] = desc.strip()
+        elif line.startswith(":"):
+            continue
+        elif line and not param_dict:
+            description_lines.append(line)
+
+    description = " ".join(description_lines) or docstring.strip()
     ret_dict = {"description": description, "params": param_dict}
     return ret_dict
 
 
+JSON_SCHEMA_TYPES = {
+    str: "string",
+    int: "integer",
+    float: "number",
+    bool: "boolean",
+    dict: "object",
+    list: "array",
+    type(None): "null",
+}
+
+
+def get_type_schema(annotation) -> dict:
+    """Converts a type annotation into a JSON schema."""
+    origin = get_origin(annotation)
+    args = get_args(annotation)
+
+    if annotation in JSON_SCHEMA_TYPES:
+        return {"type": JSON_SCHEMA_TYPES[annotation]}
+
+    if origin is Literal:
+        schema = {"enum": list(args)}
+        if args and type(args[0]) in JSON_SCHEMA_TYPES:
+            schema = {"type": JSON_SCHEMA_TYPES[type(args[0])], **schema}
+        return schema
+
+    if origin is Union or origin is types.UnionType:
+        options = [arg for arg in args if arg is not type(None)]
+        if len(options) == 1:
+            # Optional[X]
+            return get_type_schema(options[0])
+        return {"anyOf": [get_type_schema(arg) for arg in options]}
+
+    if origin in (list, tuple, set, frozenset):
+        schema = {"type": "array"}
+        if args and args[0] is not Ellipsis:
+            schema["items"] = get_type_schema(args[0])
+        return schema
+
+    if origin is dict:
+        schema = {"type": "object"}
+        if len(args) == 2:
+            schema["additionalProperties"] = get_type_schema(args[1])
+        return schema
+
+    if inspect.isclass(annotation) and issubclass(annotation, enum.Enum):
+        return {"enum": [member.value for member in annotation]}
+
+    if inspect.isclass(annotation) and issubclass(annotation, BaseModel):
+        return {
+            "type": "object",
+            "properties": {
+                name: {
+                    **get_type_schema(field.annotation),
+                    **({"description": field.description} if field.description else {}),
+                }
+                for name, field in annotation.model_fields.items()
+            },
+            "required": [
+                name
+                for name, field in annotation.model_fields.items()
+                if field.is_required()
+            ],
+        }
+
+    return {"type": getattr(annotation, "__name__", str(annotation)).lower()}
+
+
+def get_tool_spec(function_name: str, function) -> dict:
+    function_doc = doc_to_dict(function.__doc__ or function_name)
+    return {
+        "name": function_name,
+        "description": function_doc.get("description", function_name),
+        "parameters": {
+            "type": "object",
+            "properties": {
+                param_name: {
+                    **get_type_schema(param_annotation),
+                    "description": function_doc.get("params", {}).get(
+                        param_name, param_name
+                    ),
+                }
+                for param_name, param_annotation in get_type_hints(function).items()
+                if param_name != "return"
+            },
+            "required": [
+                name
+                for name, param in inspect.signature(function).parameters.items()
+                if param.default is param.empty
+            ],
+        },
+    }
+
+
 def get_tools_specs(tools) -> List[dict]:
-    function_list = [
-        {"name": func, "function": getattr(tools, func)}
+    """
+    Builds the specs of the public methods of a tools object. This reflects
+    over every method on each call; use `utils.pipelines.tools.ToolSpecCompiler`
+    to build them once.
+    """
+    return [
+        get_tool_spec(func, getattr(tools, func))
         for func in dir(tools)
         if callable(getattr(tools, func)) and not func.startswith("__")
     ]
-
-    specs = []
-
-    for function_item in function_list:
-        function_name = function_item["name"]
-        function = function_item["function"]
-
-        function_doc = doc_to_dict(function.__doc__ or function_name)
-        specs.append(
-            {
-                "name": function_name,
-                # TODO: multi-line desc?
-                "description": function_doc.get("description", function_name),
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        param_name: {
-                            "type": param_annotation.__name__.lower(),
-                            **(
-                                {
-                                    "enum": (
-                                        param_annotation.__args__
-                                        if hasattr(param_annotation, "__args__")
-                                        else None
-                                    )
-                                }
-                                if hasattr(param_annotation, "__args__")
-                                else {}
-                            ),
-                            "description": function_doc.get("params", {}).get(
-                                param_name, param_name
-                            ),
-                        }
-                        for param_name, param_annotation in get_type_hints(
-                            function
-                        ).items()
-                        if param_name != "return"
-                    },
-                    "required": [
-                        name
-                        for name, param in inspect.signature(
-                            function
-                        ).parameters.items()
-                        if param.default is param.empty
-                    ],
-                },
-            }
-        )
-
-    return specs
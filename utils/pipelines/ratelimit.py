@@ -0,0 +1,455 @@
+import threading
+import time
+
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from utils.pipelines.state import RedisStateStore, StateStore
+
+
+class RateLimitBackend:
+    """
+    Interface of the rate limiting backends.
+
+    `windows` is a list of (duration in seconds, request limit); a request is
+    allowed when every window is below its limit. Backends that make network
+    or disk round trips set `blocking`, so that async callers run them in a
+    thread.
+    """
+
+    blocking = False
+
+    def limited(self, key: str, now: Optional[float] = None) -> bool:
+        """Returns whether a window of `key` is full, without recording anything."""
+        raise NotImplementedError
+
+    def record(self, key: str, now: Optional[float] = None, amount: int = 1):
+        """Records `amount` requests for `key`."""
+        raise NotImplementedError
+
+    def hit(self, key: str, now: Optional[float] = None) -> bool:
+        """Records a request unless it is rate limited. Returns whether it was allowed."""
+        if self.limited(key, now):
+            return False
+        self.record(key, now)
+        return True
+
+    def flush(self):
+        """Sends locally batched state to the backend, if any."""
+        pass
+
+
+class SlidingWindowRateLimiter(RateLimitBackend):
+    """
+    Per-key sliding window rate limiter with O(1) amortised checks.
+
+    Each window (duration in seconds, request limit) is split into a fixed
+    number of buckets, kept per key as a ring of counters plus a running
+    total, all stored in a single compact `array`. Requests therefore expire
+    with a granularity of `seconds / buckets`, and checking or recording a
+    request only touches the buckets that expired since the key was last
+    seen. Keys idle for longer than the largest window are evicted.
+
+    Per-key layout: [last_seen, (head, total, count_0 .. count_{buckets-1}) * windows]
+    """
+
+    def __init__(self, windows: List[Tuple[float, int]], buckets: int = 12):
+        self.windows = [(float(seconds), int(limit)) for seconds, limit in windows]
+        self.buckets = buckets
+        self.stride = buckets + 2
+        self.size = 1 + self.stride * len(self.windows)
+        self.max_idle = max((seconds for seconds, _ in self.windows), default=0)
+        # (offset, bucket_seconds, limit) for each window
+        self.layout = [
+            (1 + w * self.stride, seconds / buckets, limit)
+            for w, (seconds, limit) in enumerate(self.windows)
+        ]
+        self.empty = array("I", bytes(4 * self.size))
+        self.keys: "OrderedDict[str, array]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def _advance(self, counters: array, now: float):
+        buckets = self.buckets
+        for offset, bucket_seconds, _ in self.layout:
+            bucket = int(now // bucket_seconds)
+            head = counters[offset]
+            if bucket <= head:
+                continue
+
+            if bucket - head >= buckets:
+                counters[offset + 1 : offset + self.stride] = self.empty[
+                    : self.stride - 1
+                ]
+            else:
+                total = counters[offset + 1]
+                for b in range(head + 1, bucket + 1):
+                    i = offset + 2 + b % buckets
+                    total -= counters[i]
+                    counters[i] = 0
+                counters[offset + 1] = total
+            counters[offset] = bucket
+
+    def _get(self, key: str, now: float) -> Optional[array]:
+        counters = self.keys.get(key)
+        if counters is not None:
+            self._advance(counters, now)
+        return counters
+
+    def _limited(self, counters: array) -> bool:
+        for offset, _, limit in self.layout:
+            if counters[offset + 1] >= limit:
+                return True
+        return False
+
+    def _record(
+        self, key: str, counters: Optional[array], now: float, amount: int = 1
+    ):
+        if counters is None:
+            counters = array("I", self.empty)
+            self._advance(counters, now)
+            self.keys[key] = counters
+        else:
+            self.keys.move_to_end(key)
+
+        counters[0] = int(now)
+        buckets = self.buckets
+        for offset, bucket_seconds, _ in self.layout:
+            counters[offset + 1] += amount
+            counters[offset + 2 + int(now // bucket_seconds) % buckets] += amount
+
+        self.evict_idle(now)
+
+    def migrated(
+        self, windows: List[Tuple[float, int]]
+    ) -> "SlidingWindowRateLimiter":
+        """
+        Returns a limiter with new windows that keeps the counts of every key
+        in the windows whose duration is unchanged, e.g. when only a limit
+        changed. Windows with a new duration start empty.
+        """
+        limiter = SlidingWindowRateLimiter(windows, self.buckets)
+        offsets = {
+            seconds: offset
+            for (seconds, _), (offset, _, _) in zip(self.windows, self.layout)
+        }
+        moves = [
+            (offsets[seconds], offset)
+            for (seconds, _), (offset, _, _) in zip(limiter.windows, limiter.layout)
+            if seconds in offsets
+        ]
+        for key, counters in self.keys.items():
+            migrated = array("I", limiter.empty)
+            migrated[0] = counters[0]
+            for old, new in moves:
+                migrated[new : new + self.stride] = counters[old : old + self.stride]
+            limiter.keys[key] = migrated
+        return limiter
+
+    def evict_idle(self, now: Optional[float] = None) -> int:
+        """Drops keys that have not been seen for longer than the largest window."""
+        now = time.time() if now is None else now
+        evicted = 0
+        while self.keys:
+            key, counters = next(iter(self.keys.items()))
+            if now - counters[0] <= self.max_idle:
+                break
+            del self.keys[key]
+            evicted += 1
+        return evicted
+
+    def count(self, key: str, window: int, now: Optional[float] = None) -> int:
+        """Returns the number of requests recorded for `key` in a window."""
+        counters = self._get(key, time.time() if now is None else now)
+        return counters[2 + window * self.stride] if counters is not None else 0
+
+    def remaining(self, key: str, now: Optional[float] = None) -> float:
+        """Returns how much can still be recorded for `key` before a window is full."""
+        counters = self._get(key, time.time() if now is None else now)
+        return min(
+            (
+                limit - (counters[offset + 1] if counters is not None else 0)
+                for offset, _, limit in self.layout
+            ),
+            default=float("inf"),
+        )
+
+    def limited(self, key: str, now: Optional[float] = None) -> bool:
+        counters = self._get(key, time.time() if now is None else now)
+        return counters is not None and self._limited(counters)
+
+    def record(self, key: str, now: Optional[float] = None, amount: int = 1):
+        """Records `amount` units (requests, tokens) for `key`."""
+        now = time.time() if now is None else now
+        if amount > 0:
+            self._record(key, self._get(key, now), now, amount)
+
+    def hit(self, key: str, now: Optional[float] = None) -> bool:
+        """Records a request unless it is rate limited. Returns whether it was allowed."""
+        now = time.time() if now is None else now
+        counters = self._get(key, now)
+        if counters is not None and self._limited(counters):
+            return False
+        self._record(key, counters, now)
+        return True
+
+
+class StateStoreRateLimiter(RateLimitBackend):
+    """
+    Rate limiter over any `StateStore`, e.g. the SQLite one shared by the
+    workers of a host.
+
+    Each sliding window is approximated from two fixed windows of the same
+    duration: the requests counted in the current one, plus those of the
+    previous one weighted by the part of it still inside the sliding
+    window. A request is counted with an atomic `incr` first and taken back
+    if it went over a limit, so concurrent workers never overshoot.
+    """
+
+    blocking = True
+
+    def __init__(
+        self,
+        store: StateStore,
+        windows: List[Tuple[float, int]],
+        prefix: str = "ratelimit",
+    ):
+        self.store = store
+        self.windows = [(float(seconds), int(limit)) for seconds, limit in windows]
+        self.prefix = prefix
+
+    def _keys(self, key: str, seconds: float, now: float) -> Tuple[str, str, float]:
+        """Keys of the current and previous fixed windows, and the previous one's weight."""
+        index = int(now // seconds)
+        base = f"{self.prefix}:{key}:{int(seconds)}"
+        weight = 1 - (now % seconds) / seconds
+        return f"{base}:{index}", f"{base}:{index - 1}", weight
+
+    def _previous(self, previous_key: str, weight: float) -> float:
+        return int(self.store.get(previous_key) or 0) * weight
+
+    def limited(self, key: str, now: Optional[float] = None) -> bool:
+        now = time.time() if now is None else now
+        for seconds, limit in self.windows:
+            current_key, previous_key, weight = self._keys(key, seconds, now)
+            current = int(self.store.get(current_key) or 0)
+            if current + self._previous(previous_key, weight) >= limit:
+                return True
+        return False
+
+    def record(self, key: str, now: Optional[float] = None, amount: int = 1):
+        now = time.time() if now is None else now
+        if amount <= 0:
+            return
+        for seconds, _ in self.windows:
+            current_key, _, _ = self._keys(key, seconds, now)
+            # Kept while it is the previous window of the next one
+            self.store.incr(current_key, amount, ttl=2 * seconds)
+
+    def hit(self, key: str, now: Optional[float] = None) -> bool:
+        now = time.time() if now is None else now
+        counted = []
+        for seconds, limit in self.windows:
+            current_key, previous_key, weight = self._keys(key, seconds, now)
+            current = self.store.incr(current_key, 1, ttl=2 * seconds)
+            counted.append(current_key)
+            if current + self._previous(previous_key, weight) > limit:
+                for counted_key in counted:
+                    self.store.incr(counted_key, -1)
+                return False
+        return True
+
+
+# Bucketed sliding window over one hash per window, where each field is a
+# bucket index and its value the number of requests in that bucket.
+#
+# KEYS: one hash per window
+# ARGV: mode ("hit" or "sync"), increment, buckets, then for each window:
+#       current bucket, ttl in milliseconds, limit
+#
+# In "hit" mode the request is counted only if every window is below its
+# limit. In "sync" mode the increment (requests already allowed locally) is
+# applied unconditionally. Returns {allowed, total of each window}.
+RATE_LIMIT_SCRIPT = """
+local mode = ARGV[1]
+local incr = tonumber(ARGV[2])
+local buckets = tonumber(ARGV[3])
+local totals = {}
+local allowed = 1
+
+for i, key in ipairs(KEYS) do
+    local base = 4 + (i - 1) * 3
+    local bucket = tonumber(ARGV[base])
+    local fields = redis.call('HGETALL', key)
+    local total = 0
+    for j = 1, #fields, 2 do
+        if tonumber(fields[j]) <= bucket - buckets then
+            redis.call('HDEL', key, fields[j])
+        else
+            total = total + tonumber(fields[j + 1])
+        end
+    end
+    totals[i] = total
+    if mode == 'hit' and total >= tonumber(ARGV[base + 2]) then
+        allowed = 0
+    end
+end
+
+if mode == 'hit' then
+    incr = allowed
+end
+
+if incr > 0 then
+    for i, key in ipairs(KEYS) do
+        local base = 4 + (i - 1) * 3
+        redis.call('HINCRBY', key, ARGV[base], incr)
+        redis.call('PEXPIRE', key, ARGV[base + 1])
+        totals[i] = totals[i] + incr
+    end
+end
+
+table.insert(totals, 1, allowed)
+return totals
+"""
+
+
+class RedisRateLimiter(RateLimitBackend):
+    """
+    Sliding window rate limiter shared by every worker and replica through
+    the server of a `RedisStateStore`.
+
+    With `batch_size=1` every request is checked and counted atomically by a
+    server-side script. With a larger batch size, requests are checked
+    against the totals from the last round trip plus the requests allowed
+    locally since, and the local increments are sent in one round trip once
+    `batch_size` of them are pending for a key or `flush_interval` seconds
+    have passed. This cuts round trips by up to `batch_size` at the cost of
+    letting each worker overshoot a limit by at most `batch_size - 1`.
+    """
+
+    blocking = True
+
+    def __init__(
+        self,
+        store: RedisStateStore,
+        windows: List[Tuple[float, int]],
+        buckets: int = 12,
+        batch_size: int = 1,
+        flush_interval: float = 1.0,
+        prefix: str = "ratelimit",
+    ):
+        self.store = store
+        self.client = store.client
+        self.script = store.register_script(RATE_LIMIT_SCRIPT)
+        self.windows = [(float(seconds), int(limit)) for seconds, limit in windows]
+        self.buckets = buckets
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.prefix = prefix
+
+        # key -> [totals per window, pending increments, synced_at]
+        self.local: Dict[str, list] = {}
+        self.flushed_at = time.time()
+        self.lock = threading.Lock()
+
+    def _keys(self, key: str) -> List[str]:
+        # The hash tag keeps all windows of a key in the same cluster slot
+        return [f"{self.prefix}:{{{key}}}:{int(seconds)}" for seconds, _ in self.windows]
+
+    def _args(self, mode: str, increment: int, now: float) -> list:
+        args = [mode, increment, self.buckets]
+        for seconds, limit in self.windows:
+            args += [int(now // (seconds / self.buckets)), int(seconds * 1000), limit]
+        return args
+
+    def _call(self, key: str, mode: str, increment: int, now: float, client=None):
+        return self.script(
+            keys=self._keys(key),
+            args=self._args(mode, increment, now),
+            client=client,
+        )
+
+    def _sync(self, key: str, state: Optional[list], now: float) -> list:
+        pending = state[1] if state else 0
+        result = self._call(key, "sync", pending, now)
+        state = [[int(total) for total in result[1:]], 0, now]
+        self.local[key] = state
+        return state
+
+    def flush(self, now: Optional[float] = None):
+        """Sends the pending increments of every key in one pipelined round trip."""
+        now = time.time() if now is None else now
+        with self.lock:
+            pending = [(key, state) for key, state in self.local.items() if state[1]]
+            if pending:
+                pipe = self.client.pipeline(transaction=False)
+                for key, state in pending:
+                    self._call(key, "sync", state[1], now, client=pipe)
+                for (key, state), result in zip(pending, pipe.execute()):
+                    self.local[key] = [[int(t) for t in result[1:]], 0, now]
+
+            # Totals older than the flush interval are refreshed on the next hit
+            for key in [
+                key
+                for key, state in self.local.items()
+                if not state[1] and now - state[2] >= self.flush_interval
+            ]:
+                del self.local[key]
+            self.flushed_at = now
+
+    def _state(self, key: str, now: float) -> list:
+        """The local state of `key`, synced if older than the flush interval."""
+        state = self.local.get(key)
+        if state is None or now - state[2] >= self.flush_interval:
+            state = self._sync(key, state, now)
+        return state
+
+    def _full(self, totals: List[int], pending: int = 0) -> bool:
+        return any(
+            total + pending >= limit for total, (_, limit) in zip(totals, self.windows)
+        )
+
+    def limited(self, key: str, now: Optional[float] = None) -> bool:
+        now = time.time() if now is None else now
+        if self.batch_size == 1:
+            result = self._call(key, "sync", 0, now)
+            return self._full([int(total) for total in result[1:]])
+        with self.lock:
+            state = self._state(key, now)
+            return self._full(state[0], state[1])
+
+    def record(self, key: str, now: Optional[float] = None, amount: int = 1):
+        now = time.time() if now is None else now
+        if amount <= 0:
+            return
+        if self.batch_size == 1:
+            self._call(key, "sync", amount, now)
+            return
+        with self.lock:
+            state = self._state(key, now)
+            state[1] += amount
+            if state[1] >= self.batch_size:
+                self._sync(key, state, now)
+        if now - self.flushed_at >= self.flush_interval:
+            self.flush(now)
+
+    def hit(self, key: str, now: Optional[float] = None) -> bool:
+        now = time.time() if now is None else now
+
+        if self.batch_size == 1:
+            return bool(self._call(key, "hit", 1, now)[0])
+
+        with self.lock:
+            state = self._state(key, now)
+            if self._full(state[0], state[1]):
+                return False
+
+            state[1] += 1
+            if state[1] >= self.batch_size:
+                self._sync(key, state, now)
+
+        if now - self.flushed_at >= self.flush_interval:
+            self.flush(now)
+        return True
@@ -0,0 +1,271 @@
+import socket
+import threading
+import time
+
+from collections import OrderedDict
+from typing import Callable, List, Optional
+
+import psutil
+
+from utils.pipelines.supervisor import ProcessSupervisor, http_probe
+
+
+def find_free_port(host: str = "127.0.0.1") -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind((host, 0))
+        return s.getsockname()[1]
+
+
+def process_memory_mb(pid: Optional[int]) -> float:
+    """Resident memory of a process and its children, in MB."""
+    if pid is None:
+        return 0.0
+    try:
+        process = psutil.Process(pid)
+        processes = [process] + process.children(recursive=True)
+    except psutil.NoSuchProcess:
+        return 0.0
+    rss = 0
+    for process in processes:
+        try:
+            rss += process.memory_info().rss
+        except psutil.NoSuchProcess:
+            pass
+    return rss / 2**20
+
+
+class ResidentModel:
+    """A model server in a `ModelResidency`."""
+
+    def __init__(self, name: str, port: int, supervisor: ProcessSupervisor):
+        self.name = name
+        self.port = port
+        self.supervisor = supervisor
+        # Requests using the server; it is only evicted when there are none
+        self.in_use = 0
+        self.memory_mb = 0.0
+
+
+class ModelResidency:
+    """
+    Keeps up to `max_models` model servers running, one per model, e.g.
+    `mlx_lm.server` processes, so requests alternating between models do
+    not reload one on every switch.
+
+    `command(model_name, port)` returns the command starting a server for a
+    model on a port; each runs under a `ProcessSupervisor`, ready once
+    `probe_path` answers. Servers are kept in least recently used order.
+    Loading a model evicts the least recently used idle servers while there
+    are `max_models` of them, or while their resident memory (measured with
+    psutil) plus that of the new model (as last measured, or the mean of
+    the resident ones) would exceed `memory_budget_mb` (0 disables it). A
+    model is always loaded when no other one is resident, even if it does
+    not fit. With a budget, no other model is loaded while one whose size
+    was never measured is loading, as it may take the whole budget.
+
+    `acquire` returns a ready server, and must be paired with `release`;
+    servers with requests are never evicted. Requests for a model that is
+    loading wait for it, and requests that need a slot while every resident
+    server is in use wait for one to be released, up to `ready_timeout`.
+    """
+
+    def __init__(
+        self,
+        command: Callable[[str, int], List[str]],
+        max_models: int = 2,
+        memory_budget_mb: float = 0,
+        ready_timeout: float = 300.0,
+        host: str = "127.0.0.1",
+        probe_path: str = "/health",
+        name: str = "model",
+    ):
+        self.command = command
+        self.max_models = max_models
+        self.memory_budget_mb = memory_budget_mb
+        self.ready_timeout = ready_timeout
+        self.host = host
+        self.probe_path = probe_path
+        self.name = name
+
+        self.models: "OrderedDict[str, ResidentModel]" = OrderedDict()
+        # Last measured memory of each model, to know whether it will fit
+        self.memory_by_model = {}
+        self.condition = threading.Condition()
+
+        self.hits = 0
+        self.loads = 0
+        self.evictions = 0
+        self.waits = 0
+
+    def url(self, model: ResidentModel) -> str:
+        return f"http://{self.host}:{model.port}"
+
+    def acquire(self, model_name: str, timeout: Optional[float] = None) -> ResidentModel:
+        """
+        Returns the ready server of `model_name`, loading it if needed.
+        Raises TimeoutError if it is not ready within `timeout` seconds
+        (`ready_timeout` by default).
+        """
+        timeout = self.ready_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        evicted = []
+        loaded = False
+        with self.condition:
+            while True:
+                model = self.models.get(model_name)
+                if model is not None:
+                    self.hits += 1
+                    break
+                if self._loading_unmeasured():
+                    self.waits += 1
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError(
+                            f"No {self.name} server free for {model_name} within {timeout}s"
+                        )
+                    # Readiness is not notified, so it is polled
+                    self.condition.wait(min(remaining, 0.05))
+                    continue
+                evicted += self._make_room(model_name)
+                if not self.models or not self._needs_room(model_name):
+                    model = self._load(model_name)
+                    loaded = True
+                    break
+                # Every resident server is in use
+                self.waits += 1
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self.condition.wait(remaining):
+                    raise TimeoutError(
+                        f"No {self.name} server free for {model_name} within {timeout}s"
+                    )
+            model.in_use += 1
+            self.models.move_to_end(model_name)
+
+        # Evicted servers free their memory before the new one takes it
+        for old in evicted:
+            old.supervisor.stop()
+        if loaded:
+            self._start(model)
+
+        if not model.supervisor.wait_ready(max(deadline - time.monotonic(), 0)):
+            self.release(model)
+            logs = "\n".join(model.supervisor.logs.tail(5))
+            raise TimeoutError(f"{model_name} was not ready within {timeout}s\n{logs}")
+        self.measure(model)
+        return model
+
+    def release(self, model: ResidentModel):
+        with self.condition:
+            model.in_use -= 1
+            self.condition.notify_all()
+
+    def preload(self, model_name: str):
+        """Starts loading `model_name` without waiting for it to be ready."""
+        evicted = []
+        model = None
+        with self.condition:
+            if model_name not in self.models and not self._loading_unmeasured():
+                evicted = self._make_room(model_name)
+                if not self.models or not self._needs_room(model_name):
+                    model = self._load(model_name)
+        for old in evicted:
+            old.supervisor.stop()
+        if model is not None:
+            self._start(model)
+
+    def measure(self, model: ResidentModel):
+        model.memory_mb = process_memory_mb(model.supervisor.pid)
+        with self.condition:
+            self.memory_by_model[model.name] = model.memory_mb
+
+    def memory_mb(self) -> float:
+        return sum(model.memory_mb for model in list(self.models.values()))
+
+    def _expected_memory_mb(self, model_name: str) -> float:
+        if model_name in self.memory_by_model:
+            return self.memory_by_model[model_name]
+        known = list(self.memory_by_model.values())
+        return sum(known) / len(known) if known else 0.0
+
+    def _resident_memory_mb(self, model: ResidentModel) -> float:
+        memory_mb = process_memory_mb(model.supervisor.pid)
+        if not model.supervisor.ready.is_set():
+            # Still loading, so likely to grow to its usual size
+            memory_mb = max(memory_mb, self._expected_memory_mb(model.name))
+        return memory_mb
+
+    def _loading_unmeasured(self) -> bool:
+        """Whether a server of unknown size is loading, with a memory budget."""
+        if not self.memory_budget_mb:
+            return False
+        return any(
+            not model.supervisor.ready.is_set()
+            and model.name not in self.memory_by_model
+            for model in self.models.values()
+        )
+
+    def _needs_room(self, model_name: str) -> bool:
+        if len(self.models) >= self.max_models:
+            return True
+        if not self.memory_budget_mb:
+            return False
+        for model in self.models.values():
+            model.memory_mb = self._resident_memory_mb(model)
+        needed = self.memory_mb() + self._expected_memory_mb(model_name)
+        return needed > self.memory_budget_mb
+
+    def _make_room(self, model_name: str) -> List[ResidentModel]:
+        """Removes idle servers, least recently used first, until the model fits."""
+        evicted = []
+        while self.models and self._needs_room(model_name):
+            idle = next((m for m in self.models.values() if not m.in_use), None)
+            if idle is None:
+                break
+            del self.models[idle.name]
+            evicted.append(idle)
+            self.evictions += 1
+            print(f"[{self.name}] evicting {idle.name} ({idle.memory_mb:.0f} MB)")
+        return evicted
+
+    def _load(self, model_name: str) -> ResidentModel:
+        port = find_free_port(self.host)
+        supervisor = ProcessSupervisor(
+            self.command(model_name, port),
+            name=f"{self.name}:{model_name}",
+            probe=http_probe(f"http://{self.host}:{port}{self.probe_path}"),
+            ready_timeout=self.ready_timeout,
+        )
+        model = ResidentModel(model_name, port, supervisor)
+        self.models[model_name] = model
+        self.loads += 1
+        print(f"[{self.name}] loading {model_name} on port {port}")
+        return model
+
+    def _start(self, model: ResidentModel):
+        with self.condition:
+            # Unless it was stopped meanwhile, e.g. by `stop`
+            if self.models.get(model.name) is model:
+                model.supervisor.start()
+
+    def stop(self):
+        """Stops every server, e.g. on shutdown or before changing the command."""
+        with self.condition:
+            models = list(self.models.values())
+            self.models.clear()
+            self.condition.notify_all()
+        for model in models:
+            model.supervisor.stop()
+
+    def stats(self) -> dict:
+        with self.condition:
+            resident = {
+                name: {"in_use": m.in_use, "memory_mb": round(m.memory_mb, 1)}
+                for name, m in self.models.items()
+            }
+        return {
+            "resident": resident,
+            "hits": self.hits,
+            "loads": self.loads,
+            "evictions": self.evictions,
+            "waits": self.waits,
+        }
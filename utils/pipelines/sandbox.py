@@ -0,0 +1,224 @@
+import json
+import os
+import queue
+import select
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+from typing import Iterator, Optional
+
+WORKER_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "sandbox_worker.py"
+)
+
+
+class SandboxWorker:
+    """A `sandbox_worker.py` process, and the JSON lines protocol to it."""
+
+    def __init__(self, memory_mb: int):
+        self.process = subprocess.Popen(
+            [sys.executable, WORKER_PATH, str(memory_mb)],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            # Its own process group, so kill also stops processes the code started
+            start_new_session=True,
+        )
+        self.buffer = b""
+        self.executions = 0
+
+    def send(self, message: dict):
+        self.process.stdin.write(json.dumps(message).encode() + b"\n")
+        self.process.stdin.flush()
+
+    def receive(self, deadline: float) -> Optional[dict]:
+        """
+        Returns the next message, or None if none came before `deadline`.
+        Raises EOFError if the worker exited.
+        """
+        fd = self.process.stdout.fileno()
+        while b"\n" not in self.buffer:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0 or not select.select([fd], [], [], timeout)[0]:
+                return None
+            data = os.read(fd, 65536)
+            if not data:
+                raise EOFError(f"Sandbox worker exited with {self.process.wait()}")
+            self.buffer += data
+        line, self.buffer = self.buffer.split(b"\n", 1)
+        return json.loads(line)
+
+    def kill(self):
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+        self.process.wait()
+        for pipe in (self.process.stdin, self.process.stdout):
+            try:
+                pipe.close()
+            except OSError:
+                pass
+
+
+class Execution:
+    """
+    The run of one code in a `SandboxPool`. Iterating over it runs the code
+    and yields its output as it prints it; afterwards, `returncode` is set
+    (None if it timed out or its worker died), and `stderr` holds what it
+    wrote there, e.g. the traceback of an error.
+    """
+
+    def __init__(self, pool: "SandboxPool", code: str):
+        self.pool = pool
+        self.code = code
+        self.returncode: Optional[int] = None
+        self.stderr = ""
+        self.timed_out = False
+        self.crashed = False
+
+    def __iter__(self) -> Iterator[str]:
+        pool = self.pool
+        worker = pool.acquire()
+        finished = False
+        stderr = []
+        try:
+            worker.send({"code": self.code, "cpu_seconds": pool.cpu_seconds})
+            deadline = time.monotonic() + pool.timeout
+            while True:
+                message = worker.receive(deadline)
+                if message is None:
+                    self.timed_out = True
+                    break
+                if "out" in message:
+                    yield message["out"]
+                elif "err" in message:
+                    stderr.append(message["err"])
+                elif "done" in message:
+                    self.returncode = message["done"]
+                    finished = True
+                    break
+        except (EOFError, OSError) as e:
+            # E.g. killed by the CPU limit, or the code called os._exit
+            self.crashed = True
+            stderr.append(str(e))
+        finally:
+            self.stderr = "".join(stderr)
+            # Also when the caller stopped reading early, in which case the
+            # worker may still be running the code
+            pool.release(
+                worker,
+                healthy=finished,
+                timed_out=self.timed_out,
+                crashed=self.crashed,
+            )
+
+    def output(self) -> str:
+        """Runs the code and returns all of its output."""
+        return "".join(self)
+
+
+class SandboxPool:
+    """
+    A pool of warm Python worker processes that run code sent to them over
+    a pipe, so executions do not pay for interpreter startup.
+
+    Each worker limits its address space to `memory_mb` and each execution
+    to `cpu_seconds` of CPU time (with `resource` rlimits, where available),
+    and an execution is stopped after `timeout` seconds of wall time by
+    killing its worker. Code runs in fresh globals, but in a process that
+    earlier code ran in, so workers are replaced after `max_executions`
+    runs, or after any timeout or crash. The replacement is started right
+    away, so it is warm by the time it is needed.
+
+    This limits resources; it is not a security boundary. Code can still
+    read files, use the network and change the worker's modules.
+    """
+
+    def __init__(
+        self,
+        size: int = 4,
+        max_executions: int = 100,
+        timeout: float = 10.0,
+        cpu_seconds: float = 5.0,
+        memory_mb: int = 512,
+    ):
+        self.size = size
+        self.max_executions = max_executions
+        self.timeout = timeout
+        self.cpu_seconds = cpu_seconds
+        self.memory_mb = memory_mb
+
+        self.idle: "queue.Queue[SandboxWorker]" = queue.Queue()
+        self.lock = threading.Lock()
+        self.running = False
+
+        self.executions = 0
+        self.recycled = 0
+        self.timeouts = 0
+        self.crashes = 0
+
+    def start(self):
+        with self.lock:
+            if self.running:
+                return
+            self.running = True
+            for _ in range(self.size):
+                self.idle.put(SandboxWorker(self.memory_mb))
+
+    def stop(self):
+        with self.lock:
+            self.running = False
+        while True:
+            try:
+                self.idle.get_nowait().kill()
+            except queue.Empty:
+                break
+
+    def acquire(self) -> SandboxWorker:
+        if not self.running:
+            raise RuntimeError("The sandbox pool is not running")
+        try:
+            return self.idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise TimeoutError(f"No sandbox worker free within {self.timeout}s")
+
+    def release(
+        self,
+        worker: SandboxWorker,
+        healthy: bool,
+        timed_out: bool = False,
+        crashed: bool = False,
+    ):
+        worker.executions += 1
+        with self.lock:
+            self.executions += 1
+            self.timeouts += timed_out
+            self.crashes += crashed
+            reuse = (
+                self.running and healthy and worker.executions < self.max_executions
+            )
+        if reuse:
+            self.idle.put(worker)
+            return
+
+        worker.kill()
+        with self.lock:
+            if self.running:
+                self.recycled += 1
+                self.idle.put(SandboxWorker(self.memory_mb))
+
+    def run(self, code: str) -> Execution:
+        return Execution(self, code)
+
+    def stats(self) -> dict:
+        return {
+            "executions": self.executions,
+            "recycled": self.recycled,
+            "timeouts": self.timeouts,
+            "crashes": self.crashes,
+            "idle": self.idle.qsize(),
+        }
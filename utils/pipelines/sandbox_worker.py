@@ -0,0 +1,124 @@
+"""
+Worker of `utils.pipelines.sandbox.SandboxPool`, run as a script:
+
+    python sandbox_worker.py <memory_mb>
+
+It reads JSON lines `{"code": ..., "cpu_seconds": ...}` from stdin and runs
+each code in fresh globals, writing JSON lines back on stdout: `{"ready":
+true}` once started, then for each code `{"out": ...}` and `{"err": ...}`
+chunks as it prints, and `{"done": returncode}`. It only imports the
+standard library, so it starts quickly.
+"""
+
+import json
+import math
+import os
+import sys
+import traceback
+
+try:
+    import resource
+except ImportError:  # Not available on Windows, which runs without limits
+    resource = None
+
+
+class StreamWriter:
+    """A text stream sending what is written as `{key: text}` messages."""
+
+    def __init__(self, send, key: str, buffer_size: int = 4096):
+        self.send = send
+        self.key = key
+        self.buffer_size = buffer_size
+        self.buffer = []
+        self.size = 0
+
+    def write(self, text: str) -> int:
+        if not isinstance(text, str):
+            raise TypeError(f"write() argument must be str, not {type(text).__name__}")
+        self.buffer.append(text)
+        self.size += len(text)
+        # Line buffered, so output streams as the code prints it
+        if "\n" in text or self.size >= self.buffer_size:
+            self.flush()
+        return len(text)
+
+    def flush(self):
+        if self.buffer:
+            self.send({self.key: "".join(self.buffer)})
+            self.buffer = []
+            self.size = 0
+
+    def isatty(self) -> bool:
+        return False
+
+    def writable(self) -> bool:
+        return True
+
+
+def limit_cpu(cpu_seconds: float):
+    """Lets the next code use `cpu_seconds` more CPU time; past it, SIGXCPU kills us."""
+    if resource is None or not cpu_seconds:
+        return
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    used = usage.ru_utime + usage.ru_stime
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    soft = math.ceil(used + cpu_seconds)
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def get_returncode(exit: SystemExit) -> int:
+    if exit.code is None:
+        return 0
+    if isinstance(exit.code, int):
+        return exit.code
+    print(exit.code, file=sys.stderr)
+    return 1
+
+
+def main():
+    memory_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 0
+
+    # Keeps the protocol pipes to ourselves, so code writing to file
+    # descriptors 0 to 2 (or child processes it starts) cannot corrupt them
+    commands = os.fdopen(os.dup(0), "r", encoding="utf-8")
+    replies = os.fdopen(os.dup(1), "w", encoding="utf-8")
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in (0, 1, 2):
+        os.dup2(devnull, fd)
+
+    def send(message: dict):
+        replies.write(json.dumps(message) + "\n")
+        replies.flush()
+
+    if resource is not None and memory_mb:
+        limit = memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+    send({"ready": True})
+    for line in commands:
+        request = json.loads(line)
+        limit_cpu(request.get("cpu_seconds", 0))
+
+        sys.stdout = StreamWriter(send, "out")
+        sys.stderr = StreamWriter(send, "err")
+        returncode = 0
+        try:
+            code = compile(request["code"], "<code>", "exec")
+            exec(code, {"__name__": "__main__", "__builtins__": __builtins__})
+        except SystemExit as e:
+            returncode = get_returncode(e)
+        except BaseException:
+            traceback.print_exc()
+            returncode = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            sys.stdout = sys.__stdout__
+            sys.stderr = sys.__stderr__
+        send({"done": returncode})
+
+
+if __name__ == "__main__":
+    main()
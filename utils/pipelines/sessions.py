@@ -0,0 +1,153 @@
+import time
+
+from collections import OrderedDict
+from typing import Any, Callable, Iterator, List, Optional
+
+
+class SessionStore:
+    """
+    Bounded per-session state (e.g. chat id -> trace), for filters that keep
+    objects between `inlet` and `outlet`.
+
+    Entries are kept in least recently used order and dropped once there are
+    more than `max_size` of them, or once they have not been accessed for
+    `ttl` seconds (`ttl=None` disables expiry). Because every access moves an
+    entry to the end, the oldest entries are always at the front, so the
+    sweep on each write only ever looks at the entries it removes.
+    `on_evict(key, value, reason)` is called for entries dropped by either
+    limit, with reason "size" or "ttl", e.g. to close the objects they hold.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 10000,
+        ttl: Optional[float] = 3600,
+        on_evict: Optional[Callable[[Any, Any, str], None]] = None,
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.on_evict = on_evict
+        # key -> [value, last access time]
+        self.entries: "OrderedDict[Any, List]" = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = {"size": 0, "ttl": 0}
+
+    def configure(self, max_size: int, ttl: Optional[float]):
+        """Changes the limits, evicting entries that no longer fit."""
+        self.max_size = max_size
+        self.ttl = ttl
+        self.expire()
+        self._evict_overflow()
+
+    def _evict(self, reason: str, key=None):
+        if key is None:
+            key, (value, _) = self.entries.popitem(last=False)
+        else:
+            value, _ = self.entries.pop(key)
+        self.evictions[reason] += 1
+        if self.on_evict:
+            try:
+                self.on_evict(key, value, reason)
+            except Exception as e:
+                print(f"Error evicting session {key}: {e}")
+
+    def _evict_overflow(self):
+        while len(self.entries) > self.max_size:
+            self._evict("size")
+
+    def expire(self, now: Optional[float] = None) -> int:
+        """Drops the entries that were not accessed within the ttl."""
+        if self.ttl is None:
+            return 0
+        deadline = (time.time() if now is None else now) - self.ttl
+        expired = 0
+        while self.entries:
+            _, touched = next(iter(self.entries.values()))
+            if touched > deadline:
+                break
+            self._evict("ttl")
+            expired += 1
+        return expired
+
+    def get(self, key, default=None):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+
+        now = time.time()
+        if self.ttl is not None and entry[1] <= now - self.ttl:
+            self._evict("ttl", key)
+            self.misses += 1
+            return default
+
+        self.hits += 1
+        entry[1] = now
+        self.entries.move_to_end(key)
+        return entry[0]
+
+    def set(self, key, value):
+        now = time.time()
+        self.expire(now)
+        self.entries[key] = [value, now]
+        self.entries.move_to_end(key)
+        self._evict_overflow()
+
+    def pop(self, key, default=None):
+        entry = self.entries.get(key)
+        if entry is None:
+            return default
+        if self.ttl is not None and entry[1] <= time.time() - self.ttl:
+            self._evict("ttl", key)
+            return default
+        del self.entries[key]
+        return entry[0]
+
+    def setdefault(self, key, default=None):
+        value = self.get(key, self)
+        if value is self:
+            self.set(key, default)
+            return default
+        return value
+
+    def __contains__(self, key) -> bool:
+        entry = self.entries.get(key)
+        if entry is None:
+            return False
+        return self.ttl is None or entry[1] > time.time() - self.ttl
+
+    def __getitem__(self, key):
+        value = self.get(key, self)
+        if value is self:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def __delitem__(self, key):
+        del self.entries[key]
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __iter__(self) -> Iterator:
+        return iter(list(self.entries))
+
+    def values(self) -> list:
+        return [value for value, _ in self.entries.values()]
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self.entries),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": dict(self.evictions),
+        }
@@ -0,0 +1,237 @@
+import heapq
+import os
+import sqlite3
+import threading
+import time
+
+from typing import Optional
+
+from config import PIPELINES_STATE_STORE
+
+
+class StateStore:
+    """
+    Key/value store that pipelines can use to share state between workers.
+
+    Values are strings, counters are integers stored as strings. Every write
+    accepts an optional `ttl` in seconds after which the key expires.
+    """
+
+    def get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        raise NotImplementedError
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        """
+        Atomically increments a counter and returns its new value. The ttl is
+        only applied when the counter is created.
+        """
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+
+class MemoryStateStore(StateStore):
+    """
+    Process-local store, only shared between the threads of one worker.
+
+    Keys written with a ttl are also kept in a heap by expiry time, and each
+    write drops the keys that expired, so keys that are never read again
+    (e.g. one per chat) do not accumulate.
+    """
+
+    def __init__(self):
+        self.data = {}
+        # (expires_at, key); entries for keys since rewritten are skipped
+        self.expiries = []
+        self.lock = threading.Lock()
+
+    def _get_entry(self, key: str):
+        entry = self.data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.time():
+            del self.data[key]
+            return None
+        return entry
+
+    def _put(self, key: str, value: str, expires_at: Optional[float]):
+        now = time.time()
+        while self.expiries and self.expiries[0][0] <= now:
+            _, expired_key = heapq.heappop(self.expiries)
+            entry = self.data.get(expired_key)
+            if entry is not None and entry[1] is not None and entry[1] <= now:
+                del self.data[expired_key]
+
+        self.data[key] = (value, expires_at)
+        if expires_at is not None:
+            heapq.heappush(self.expiries, (expires_at, key))
+
+    def get(self, key: str) -> Optional[str]:
+        with self.lock:
+            entry = self._get_entry(key)
+            return entry[0] if entry else None
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        with self.lock:
+            self._put(key, str(value), time.time() + ttl if ttl else None)
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        with self.lock:
+            entry = self._get_entry(key)
+            if entry is None:
+                value = amount
+                expires_at = time.time() + ttl if ttl else None
+                self._put(key, str(value), expires_at)
+            else:
+                value = int(entry[0]) + amount
+                # Same expiry, so it is already in the heap
+                self.data[key] = (str(value), entry[1])
+            return value
+
+    def delete(self, key: str):
+        with self.lock:
+            self.data.pop(key, None)
+
+
+class SQLiteStateStore(StateStore):
+    """
+    Store backed by a SQLite database, shared by all workers on one host.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection().execute(
+            "CREATE TABLE IF NOT EXISTS state "
+            "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(
+                self.path, timeout=10, isolation_level=None
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self.local.connection = connection
+        return connection
+
+    def get(self, key: str) -> Optional[str]:
+        row = (
+            self._connection()
+            .execute(
+                "SELECT value FROM state WHERE key = ? "
+                "AND (expires_at IS NULL OR expires_at > ?)",
+                (key, time.time()),
+            )
+            .fetchone()
+        )
+        return row[0] if row else None
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        self._connection().execute(
+            "INSERT OR REPLACE INTO state (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, str(value), time.time() + ttl if ttl else None),
+        )
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        now = time.time()
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute(
+                "DELETE FROM state WHERE key = ? AND expires_at <= ?", (key, now)
+            )
+            row = connection.execute(
+                "INSERT INTO state (key, value, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + ? "
+                "RETURNING value",
+                (key, str(amount), now + ttl if ttl else None, amount),
+            ).fetchone()
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return int(row[0])
+
+    def delete(self, key: str):
+        self._connection().execute("DELETE FROM state WHERE key = ?", (key,))
+
+
+# Increments a counter and sets its expiry only when it has none yet.
+REDIS_INCR_SCRIPT = """
+local value = redis.call('INCRBY', KEYS[1], ARGV[1])
+if tonumber(ARGV[2]) > 0 and redis.call('PTTL', KEYS[1]) < 0 then
+    redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return value
+"""
+
+
+class RedisStateStore(StateStore):
+    """
+    Store backed by any server speaking the Redis protocol. Requires the
+    `redis` package.
+    """
+
+    def __init__(self, url: str):
+        import redis
+
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.incr_script = self.client.register_script(REDIS_INCR_SCRIPT)
+
+    def get(self, key: str) -> Optional[str]:
+        return self.client.get(key)
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        self.client.set(key, value, px=int(ttl * 1000) if ttl else None)
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        return int(
+            self.incr_script(keys=[key], args=[amount, int(ttl * 1000) if ttl else 0])
+        )
+
+    def delete(self, key: str):
+        self.client.delete(key)
+
+    def register_script(self, script: str):
+        """Registers a Lua script to run on the server, e.g. for atomic updates."""
+        return self.client.register_script(script)
+
+
+def create_state_store(url: str) -> StateStore:
+    """
+    Creates a store from a url:
+
+    - `memory` (default): process-local
+    - `sqlite:///state.db` (relative) or `sqlite:////abs/state.db`: shared by
+      the workers of one host
+    - `redis://host:port/db`: shared across hosts
+    """
+    if not url or url == "memory":
+        return MemoryStateStore()
+    if url.startswith("sqlite://"):
+        return SQLiteStateStore(url[len("sqlite:///") :])
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisStateStore(url)
+    raise ValueError(f"Unsupported state store: {url}")
+
+
+_state_store: Optional[StateStore] = None
+_state_store_lock = threading.Lock()
+
+
+def get_state_store() -> StateStore:
+    """Returns the store configured with `PIPELINES_STATE_STORE`."""
+    global _state_store
+    if _state_store is None:
+        with _state_store_lock:
+            if _state_store is None:
+                _state_store = create_state_store(PIPELINES_STATE_STORE)
+    return _state_store
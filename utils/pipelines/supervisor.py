@@ -0,0 +1,222 @@
+import os
+import signal
+import subprocess
+import threading
+import time
+
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+import requests
+
+
+class LogRing:
+    """The last `max_lines` lines of a process's output, shared between threads."""
+
+    def __init__(self, max_lines: int = 1000):
+        self.lines = deque(maxlen=max_lines)
+        self.lock = threading.Lock()
+
+    def append(self, line: str):
+        with self.lock:
+            self.lines.append(line)
+
+    def tail(self, n: Optional[int] = None) -> List[str]:
+        with self.lock:
+            lines = list(self.lines)
+        return lines if n is None else lines[-n:]
+
+
+def http_probe(url: str, timeout: float = 2.0) -> Callable[[], bool]:
+    """A readiness probe passing once `url` answers with a status below 500."""
+
+    def probe() -> bool:
+        try:
+            return requests.get(url, timeout=timeout).status_code < 500
+        except requests.RequestException:
+            return False
+
+    return probe
+
+
+class ProcessSupervisor:
+    """
+    Runs `command` as a child process from a background thread, for
+    pipelines that front a local server (e.g. a LiteLLM proxy or an MLX
+    model server).
+
+    - `ready` is set once `probe` passes, polled every `probe_interval`
+      seconds; a process that is not ready within `ready_timeout` seconds is
+      killed and started again.
+    - stdout and stderr are drained concurrently, so neither pipe can fill
+      up and block the child, into a `LogRing` of the last `max_log_lines`
+      lines (and printed with a `[name]` prefix if `echo` is set).
+    - A process that exits while not stopped is started again after a
+      backoff doubling from `backoff_initial` to `backoff_max` seconds; it
+      is reset once a process gets ready. `generation` counts the starts,
+      e.g. to invalidate what was cached from a previous process.
+
+    The process gets its own process group, so `stop` also ends the
+    processes it started.
+    """
+
+    def __init__(
+        self,
+        command: List[str],
+        name: str = "process",
+        probe: Optional[Callable[[], bool]] = None,
+        ready_timeout: float = 60.0,
+        probe_interval: float = 0.25,
+        backoff_initial: float = 1.0,
+        backoff_max: float = 60.0,
+        max_log_lines: int = 1000,
+        echo: bool = True,
+        env: Optional[Dict[str, str]] = None,
+    ):
+        self.command = command
+        self.name = name
+        self.probe = probe
+        self.ready_timeout = ready_timeout
+        self.probe_interval = probe_interval
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.echo = echo
+        self.env = env
+
+        self.logs = LogRing(max_log_lines)
+        self.ready = threading.Event()
+        self.stopping = threading.Event()
+        self.lock = threading.Lock()
+        self.process: Optional[subprocess.Popen] = None
+        self._thread: Optional[threading.Thread] = None
+
+        self.generation = 0
+        self.restarts = 0
+        self.last_returncode: Optional[int] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def pid(self) -> Optional[int]:
+        process = self.process
+        return process.pid if process is not None else None
+
+    def start(self):
+        """Starts supervising the process, without waiting for it to be ready."""
+        if self.running:
+            return
+        self.stopping.clear()
+        self._thread = threading.Thread(
+            target=self._supervise, name=f"supervisor-{self.name}", daemon=True
+        )
+        self._thread.start()
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        return self.ready.wait(timeout)
+
+    def stop(self, timeout: float = 10.0):
+        """Stops the process (SIGTERM, then SIGKILL after `timeout`) for good."""
+        self.stopping.set()
+        self._terminate(timeout)
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _terminate(self, timeout: float):
+        with self.lock:
+            process = self.process
+        if process is None or process.poll() is not None:
+            return
+        for sig, wait in ((signal.SIGTERM, timeout), (signal.SIGKILL, None)):
+            try:
+                os.killpg(process.pid, sig)
+            except (ProcessLookupError, PermissionError):
+                return
+            try:
+                process.wait(wait)
+                return
+            except subprocess.TimeoutExpired:
+                print(f"[{self.name}] did not stop within {timeout}s, killing it")
+
+    def _drain(self, stream):
+        for line in iter(stream.readline, b""):
+            text = line.decode(errors="replace").rstrip()
+            self.logs.append(text)
+            if self.echo:
+                print(f"[{self.name}] {text}")
+        stream.close()
+
+    def _wait_ready(self, process: subprocess.Popen) -> bool:
+        deadline = time.monotonic() + self.ready_timeout
+        while not self.stopping.is_set():
+            if process.poll() is not None:
+                return False
+            if self.probe is None or self.probe():
+                return True
+            if time.monotonic() >= deadline:
+                print(f"[{self.name}] not ready in {self.ready_timeout}s, restarting")
+                self._terminate(5.0)
+                return False
+            self.stopping.wait(self.probe_interval)
+        return False
+
+    def _supervise(self):
+        backoff = self.backoff_initial
+        while not self.stopping.is_set():
+            try:
+                process = subprocess.Popen(
+                    self.command,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    env=self.env,
+                    start_new_session=True,
+                )
+            except OSError as e:
+                print(f"[{self.name}] failed to start: {e}")
+                self.logs.append(str(e))
+            else:
+                with self.lock:
+                    self.process = process
+                    self.generation += 1
+                drains = [
+                    threading.Thread(target=self._drain, args=(stream,), daemon=True)
+                    for stream in (process.stdout, process.stderr)
+                ]
+                for drain in drains:
+                    drain.start()
+
+                if self._wait_ready(process):
+                    self.ready.set()
+                    backoff = self.backoff_initial
+                if self.stopping.is_set():
+                    # stop may have run before this process was recorded
+                    self._terminate(5.0)
+                self.last_returncode = process.wait()
+                self.ready.clear()
+                for drain in drains:
+                    drain.join(1.0)
+
+            if self.stopping.is_set():
+                break
+            self.restarts += 1
+            print(
+                f"[{self.name}] exited with {self.last_returncode}, "
+                f"restarting in {backoff}s"
+            )
+            self.stopping.wait(backoff)
+            backoff = min(backoff * 2, self.backoff_max)
+
+        with self.lock:
+            self.process = None
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "ready": self.ready.is_set(),
+            "pid": self.pid,
+            "generation": self.generation,
+            "restarts": self.restarts,
+            "last_returncode": self.last_returncode,
+        }
@@ -0,0 +1,77 @@
+import json
+import os
+
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows, where multi-worker mode is not supported.
+    fcntl = None
+
+
+class PipelineSync:
+    """
+    File-based generation counters used to broadcast pipeline changes between
+    uvicorn workers.
+
+    The state file holds a `pipelines` generation, bumped whenever pipelines
+    are added, deleted or reloaded, and a `valves` generation per pipeline id,
+    bumped whenever its valves are updated. Each worker remembers the last
+    state it applied and polls the file for changes.
+    """
+
+    def __init__(self, directory: str):
+        self.path = os.path.join(directory, ".sync.json")
+        self.lock_path = os.path.join(directory, ".sync.lock")
+        self.last_mtime = None
+
+    @contextmanager
+    def lock(self):
+        with open(self.lock_path, "a") as f:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def read(self) -> dict:
+        try:
+            with open(self.path, "r") as f:
+                state = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            state = {}
+        return {"pipelines": state.get("pipelines", 0), "valves": state.get("valves", {})}
+
+    def _write(self, state: dict):
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.path)
+
+    def bump_pipelines(self) -> dict:
+        with self.lock():
+            state = self.read()
+            state["pipelines"] += 1
+            self._write(state)
+        return state
+
+    def bump_valves(self, pipeline_id: str) -> dict:
+        with self.lock():
+            state = self.read()
+            state["valves"][pipeline_id] = state["valves"].get(pipeline_id, 0) + 1
+            self._write(state)
+        return state
+
+    def changed(self) -> bool:
+        """Cheap check (a single stat) for whether the state file was written."""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self.last_mtime:
+            return False
+        self.last_mtime = mtime
+        return True
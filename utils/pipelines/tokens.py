@@ -0,0 +1,95 @@
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+
+# Approximate overhead of the chat format, as counted by OpenAI models
+TOKENS_PER_MESSAGE = 3
+TOKENS_PER_REPLY = 3
+# Used when no tokenizer is installed; about right for English text
+CHARS_PER_TOKEN = 4
+
+
+def get_message_text(message: dict) -> str:
+    """Returns the text of a message, joining the text parts of multimodal content."""
+    content = message.get("content") or ""
+    if isinstance(content, list):
+        return "\n".join(
+            item.get("text", "") for item in content if item.get("type") == "text"
+        )
+    return content
+
+
+def get_usage_tokens(message: dict) -> Tuple[Optional[int], Optional[int]]:
+    """
+    Returns (prompt tokens, completion tokens) reported in the `usage` of an
+    assistant message, for both OpenAI and Ollama style fields.
+    """
+    usage = message.get("usage") or {}
+    if not isinstance(usage, dict):
+        return None, None
+    input_tokens = usage.get("prompt_eval_count") or usage.get("prompt_tokens")
+    output_tokens = usage.get("eval_count") or usage.get("completion_tokens")
+    return input_tokens, output_tokens
+
+
+class TokenEstimator:
+    """
+    Estimates the prompt tokens of chat messages with a local tokenizer.
+
+    Uses `tiktoken` with the given encoding when it is installed, and a
+    characters-per-token heuristic otherwise. Chat clients resend the whole
+    history on every turn, so token counts are cached per message text in a
+    bounded LRU: only messages not seen before are tokenized, and estimating
+    a long conversation costs one dictionary lookup per earlier message.
+    """
+
+    def __init__(self, encoding: str = "cl100k_base", cache_size: int = 100_000):
+        self.encoding_name = encoding
+        self.cache_size = cache_size
+        self.cache: "OrderedDict[int, int]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+        try:
+            import tiktoken
+
+            self.encoding = tiktoken.get_encoding(encoding)
+        except Exception as e:
+            print(f"Token estimation falls back to {CHARS_PER_TOKEN} chars per token: {e}")
+            self.encoding = None
+
+    def tokenize_count(self, text: str) -> int:
+        if self.encoding is None:
+            return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    def count(self, text: str) -> int:
+        """Returns the number of tokens in `text`, from the cache when possible."""
+        if not text:
+            return 0
+        if self.encoding is None:
+            # The heuristic is cheaper than a cache lookup
+            return self.tokenize_count(text)
+
+        # Keyed by the string hash rather than the text, so the cache does not
+        # keep conversations alive; a collision only skews an estimate.
+        key = hash(text)
+        tokens = self.cache.get(key)
+        if tokens is not None:
+            self.hits += 1
+            self.cache.move_to_end(key)
+            return tokens
+
+        self.misses += 1
+        tokens = self.tokenize_count(text)
+        self.cache[key] = tokens
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return tokens
+
+    def count_messages(self, messages: List[dict]) -> int:
+        """Estimates the prompt tokens of a list of chat messages."""
+        return TOKENS_PER_REPLY + sum(
+            TOKENS_PER_MESSAGE + self.count(get_message_text(message))
+            for message in messages
+        )
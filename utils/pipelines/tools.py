@@ -0,0 +1,272 @@
+import asyncio
+import json
+import re
+
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from utils.pipelines.main import get_tools_specs
+from utils.pipelines.sessions import SessionStore
+
+
+class ToolSpecCompiler:
+    """
+    Builds the specs of a tools object once per tools class, in both the
+    prompt and the OpenAI `tools` formats, and renders them into a prompt
+    template once per (class, template).
+
+    Specs only depend on the methods, signatures and docstrings of the
+    class, so they are reused across instances and requests. Call `clear`
+    when they may change (e.g. on valve updates, which can swap the tools
+    or the prompt). The returned specs are shared; do not modify them.
+    """
+
+    def __init__(self):
+        self.specs: Dict[type, List[dict]] = {}
+        self.openai_specs: Dict[type, List[dict]] = {}
+        self.prompts: Dict[Tuple[type, str], str] = {}
+
+    def compile(self, tools) -> List[dict]:
+        key = type(tools)
+        specs = self.specs.get(key)
+        if specs is None:
+            specs = self.specs[key] = get_tools_specs(tools)
+        return specs
+
+    def openai_tools(self, tools) -> List[dict]:
+        """Returns the specs in the format of OpenAI's `tools` parameter."""
+        key = type(tools)
+        openai_tools = self.openai_specs.get(key)
+        if openai_tools is None:
+            openai_tools = self.openai_specs[key] = [
+                {"type": "function", "function": spec} for spec in self.compile(tools)
+            ]
+        return openai_tools
+
+    def render(self, tools, template: str) -> str:
+        """Returns `template` with the specs, as indented JSON, in place of `{}`."""
+        key = (type(tools), template)
+        prompt = self.prompts.get(key)
+        if prompt is None:
+            prompt = self.prompts[key] = template.format(
+                json.dumps(self.compile(tools), indent=2)
+            )
+        return prompt
+
+    def clear(self):
+        self.specs.clear()
+        self.openai_specs.clear()
+        self.prompts.clear()
+
+
+class ToolCacheConfig:
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+
+def cached_tool(ttl: float = 60, max_entries: int = 1000):
+    """
+    Marks a `Tools` method as idempotent, so `function_calling_blueprint`
+    serves repeated calls with the same arguments from a cache for `ttl`
+    seconds, keeping at most `max_entries` results per tool.
+
+    Only use it for tools whose result depends on nothing but their
+    arguments (not on the user or the current time).
+    """
+
+    def decorator(function):
+        function.__tool_cache__ = ToolCacheConfig(ttl, max_entries)
+        return function
+
+    return decorator
+
+
+class ToolResultCache:
+    """
+    Results of `cached_tool` tools, in one bounded TTL store per tool, keyed
+    by the call's arguments. Concurrent calls with the same arguments share
+    one execution (they count as misses). Failed calls (None results) are
+    not cached.
+    """
+
+    def __init__(self):
+        self.stores: Dict[str, SessionStore] = {}
+        self.pending: Dict[Tuple[str, str], asyncio.Future] = {}
+
+    def get_store(self, name: str, config: ToolCacheConfig) -> SessionStore:
+        store = self.stores.get(name)
+        if store is None:
+            store = self.stores[name] = SessionStore(
+                max_size=config.max_entries, ttl=config.ttl
+            )
+        return store
+
+    async def call(
+        self,
+        name: str,
+        parameters: dict,
+        config: ToolCacheConfig,
+        run: Callable[[], Awaitable[Optional[str]]],
+    ) -> Optional[str]:
+        store = self.get_store(name, config)
+        key = json.dumps(parameters, sort_keys=True, default=str)
+
+        result = store.get(key)
+        if result is not None:
+            return result
+
+        pending = self.pending.get((name, key))
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future = self.pending[(name, key)] = asyncio.get_running_loop().create_future()
+        try:
+            result = await run()
+            if result is not None:
+                store.set(key, result)
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Marks it retrieved, callers that await it still get the error
+            future.exception()
+            raise
+        finally:
+            self.pending.pop((name, key), None)
+
+    def stats(self) -> Dict[str, dict]:
+        stats = {}
+        for name, store in self.stores.items():
+            calls = store.hits + store.misses
+            stats[name] = {
+                "hits": store.hits,
+                "misses": store.misses,
+                "hit_ratio": round(store.hits / calls, 3) if calls else 0.0,
+                "size": len(store),
+            }
+        return stats
+
+    def clear(self):
+        self.stores.clear()
+
+
+def tool_patterns(*patterns: str):
+    r"""
+    Adds regular expressions that mark a message as a plausible call of a
+    `Tools` method, for requests its docstring words do not cover (e.g.
+    `r"\d\s*[-+*/]\s*\d"` for a calculator).
+    """
+
+    def decorator(function):
+        function.__tool_patterns__ = [
+            *getattr(function, "__tool_patterns__", []),
+            *patterns,
+        ]
+        return function
+
+    return decorator
+
+
+# Words that say nothing about which tool a message needs
+ROUTER_STOPWORDS = frozenset(
+    """
+    a an and are as at be by can could do does for from get give has have how i
+    if in is it its me my of on or please return returns should tell than that
+    the their then there this to want was what when where which who why will
+    with would you your default empty found not string value result
+    """.split()
+)
+
+WORD = re.compile(r"[^\W_]+")
+
+
+def normalize_word(word: str) -> str:
+    """Lowercases a word and strips common English suffixes."""
+    word = word.lower()
+    for suffix in ("ing", "ed", "es", "s"):
+        if len(word) > len(suffix) + 3 and word.endswith(suffix):
+            return word[: -len(suffix)]
+    return word
+
+
+def get_keywords(text: str) -> set:
+    return {
+        normalize_word(word)
+        for word in WORD.findall(text.replace("_", " "))
+        if len(word) > 2 and word.lower() not in ROUTER_STOPWORDS
+    }
+
+
+class ToolRouter:
+    """
+    Decides locally whether a message could need any tool, so the task model
+    is only asked when one is plausible.
+
+    A message is plausible when it shares a keyword with a tool (from its
+    name, description, parameter descriptions and enum values) or matches
+    one of the tool's `tool_patterns`. Otherwise, if a `classifier` is given
+    (a callable returning the probability that a message needs a tool), it
+    decides with `threshold`. Skipped messages and the task-model latency
+    they saved are counted.
+    """
+
+    def __init__(
+        self,
+        tools,
+        specs: List[dict],
+        classifier: Optional[Callable[[str], float]] = None,
+        threshold: float = 0.5,
+    ):
+        self.classifier = classifier
+        self.threshold = threshold
+
+        self.keywords = set()
+        patterns = []
+        for spec in specs:
+            self.keywords |= get_keywords(spec["name"])
+            self.keywords |= get_keywords(spec["description"])
+            for param in spec["parameters"]["properties"].values():
+                self.keywords |= get_keywords(param.get("description", ""))
+                for value in param.get("enum", []):
+                    self.keywords |= get_keywords(str(value))
+            function = getattr(tools, spec["name"])
+            patterns.extend(getattr(function, "__tool_patterns__", []))
+        self.pattern = re.compile("|".join(patterns), re.IGNORECASE) if patterns else None
+
+        self.checked = 0
+        self.skipped = 0
+        self.task_model_calls = 0
+        self.task_model_seconds = 0.0
+
+    def plausible(self, text: str) -> bool:
+        self.checked += 1
+        if get_keywords(text) & self.keywords:
+            return True
+        if self.pattern is not None and self.pattern.search(text):
+            return True
+        if self.classifier is not None and self.classifier(text) >= self.threshold:
+            return True
+        self.skipped += 1
+        return False
+
+    def record_task_model_call(self, seconds: float):
+        self.task_model_calls += 1
+        self.task_model_seconds += seconds
+
+    def stats(self) -> dict:
+        mean = (
+            self.task_model_seconds / self.task_model_calls
+            if self.task_model_calls
+            else 0.0
+        )
+        return {
+            "checked": self.checked,
+            "skipped": self.skipped,
+            "skip_ratio": round(self.skipped / self.checked, 3) if self.checked else 0.0,
+            "mean_task_model_ms": round(mean * 1000, 1),
+            # Estimated from the latency of the task-model calls that were made
+            "saved_ms": round(self.skipped * mean * 1000, 1),
+        }
@@ -0,0 +1,328 @@
+import asyncio
+import hashlib
+import re
+
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+import aiohttp
+
+
+# Paragraphs are translated separately, so repeated ones are served from cache
+PARAGRAPH_SEPARATOR = re.compile(r"(\n\s*\n)")
+
+# Whitespace after a sentence end (optionally followed by a closing quote or
+# bracket), after a CJK full stop, or a line break
+SENTENCE_SEPARATOR = re.compile(
+    r"((?:(?<=[.!?])|(?<=[.!?][\"'\u201d\u2019)\]]))\s+|(?<=[\u3002\uff01\uff1f])\s*|\n\s*)"
+)
+
+
+class TranslationBackend:
+    """
+    A translation API, called through a pooled HTTP session. Backends that
+    accept several texts per request set `max_batch_size` above 1.
+    """
+
+    max_batch_size = 1
+
+    def __init__(self, max_connections: int = 16, timeout: float = 60):
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.session: Optional[aiohttp.ClientSession] = None
+
+    def get_session(self) -> aiohttp.ClientSession:
+        # Created lazily, as the session is bound to the running event loop
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        return self.session
+
+    async def translate_batch(
+        self, texts: List[str], source: str, target: str
+    ) -> List[str]:
+        raise NotImplementedError
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+
+class LibreTranslateBackend(TranslationBackend):
+    """LibreTranslate's `/translate`, which accepts a list of texts as `q`."""
+
+    max_batch_size = 32
+
+    def __init__(self, url: str, api_key: Optional[str] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.url = url.rstrip("/")
+        self.api_key = api_key
+
+    async def translate_batch(
+        self, texts: List[str], source: str, target: str
+    ) -> List[str]:
+        payload = {"q": texts, "source": source, "target": target, "format": "text"}
+        if self.api_key:
+            payload["api_key"] = self.api_key
+
+        async with self.get_session().post(f"{self.url}/translate", json=payload) as r:
+            r.raise_for_status()
+            data = await r.json()
+
+        translated = data["translatedText"]
+        return translated if isinstance(translated, list) else [translated]
+
+
+class OpenAITranslateBackend(TranslationBackend):
+    """
+    Translation by an OpenAI compatible chat model, one request per text.
+    The model keeps the context of a whole message, so it is best sent
+    unsplit, with `TranslationService.translate`.
+    """
+
+    def __init__(self, base_url: str, api_key: str, model: str, **kwargs):
+        super().__init__(**kwargs)
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.model = model
+
+    async def translate_batch(
+        self, texts: List[str], source: str, target: str
+    ) -> List[str]:
+        return list(
+            await asyncio.gather(*(self.translate(text, target) for text in texts))
+        )
+
+    async def translate(self, text: str, target: str) -> str:
+        payload = {
+            "messages": [
+                {
+                    "role": "system",
+                    "content": f"Translate the following text to {target}. Provide only the translated text and nothing else.",
+                },
+                {"role": "user", "content": text},
+            ],
+            "model": self.model,
+        }
+        headers = {"Authorization": f"Bearer {self.api_key}"}
+
+        async with self.get_session().post(
+            f"{self.base_url}/chat/completions", json=payload, headers=headers
+        ) as r:
+            r.raise_for_status()
+            response = await r.json()
+        return response["choices"][0]["message"]["content"]
+
+
+class TranslationService:
+    """
+    Translates through a backend with a bounded LRU cache keyed by
+    (sha256 of the text, source, target).
+
+    Texts missing from the cache are deduplicated and sent in batches of the
+    backend's `max_batch_size`, and concurrent requests for a text already
+    being translated wait for that translation instead of sending another.
+    Failed translations are not cached; the exception is raised to the caller.
+    If the request sending a batch is cancelled, the other requests waiting
+    for its texts get a RuntimeError.
+    """
+
+    def __init__(self, backend: TranslationBackend, cache_size: int = 10000):
+        self.backend = backend
+        self.cache_size = cache_size
+        self.cache: "OrderedDict[Tuple[bytes, str, str], str]" = OrderedDict()
+        self.pending: Dict[Tuple[bytes, str, str], asyncio.Future] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.requests = 0
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self.cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "requests": self.requests,
+        }
+
+    def _put(self, key, translated: str):
+        self.cache[key] = translated
+        self.cache.move_to_end(key)
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    async def _send(self, keys: list, texts: List[str], source: str, target: str):
+        futures = [self.pending[key] for key in keys]
+        try:
+            self.requests += 1
+            translated = await self.backend.translate_batch(texts, source, target)
+            if len(translated) != len(texts):
+                raise ValueError(
+                    f"Expected {len(texts)} translations, got {len(translated)}"
+                )
+            for key, future, text in zip(keys, futures, translated):
+                self._put(key, text)
+                future.set_result(text)
+        except Exception as e:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+                    # Marks it retrieved, callers that await it still get the error
+                    future.exception()
+        except BaseException:
+            # e.g. the caller was cancelled: other requests waiting for these
+            # texts get an error they fall back on, rather than waiting forever
+            # or being cancelled themselves
+            for future in futures:
+                if not future.done():
+                    future.set_exception(RuntimeError("Translation was cancelled"))
+                    future.exception()
+            raise
+        finally:
+            for key in keys:
+                self.pending.pop(key, None)
+
+    async def translate_many(
+        self, texts: List[str], source: str, target: str
+    ) -> List[str]:
+        keys = [
+            (hashlib.sha256(text.encode("utf-8")).digest(), source, target)
+            for text in texts
+        ]
+
+        results: Dict[Tuple[bytes, str, str], asyncio.Future] = {}
+        missing = {}
+        loop = asyncio.get_running_loop()
+        for key, text in zip(keys, texts):
+            if key in results:
+                continue
+            if key in self.cache:
+                self.hits += 1
+                self.cache.move_to_end(key)
+                future = loop.create_future()
+                future.set_result(self.cache[key])
+            elif key in self.pending:
+                self.hits += 1
+                future = self.pending[key]
+            else:
+                self.misses += 1
+                future = self.pending[key] = loop.create_future()
+                missing[key] = text
+            results[key] = future
+
+        missing_keys = list(missing)
+        batch_size = max(1, self.backend.max_batch_size)
+        await asyncio.gather(
+            *(
+                self._send(
+                    missing_keys[i : i + batch_size],
+                    [missing[key] for key in missing_keys[i : i + batch_size]],
+                    source,
+                    target,
+                )
+                for i in range(0, len(missing_keys), batch_size)
+            )
+        )
+
+        return [await results[key] for key in keys]
+
+    async def translate(self, text: str, source: str, target: str) -> str:
+        return (await self.translate_many([text], source, target))[0]
+
+    async def translate_text(
+        self,
+        text: str,
+        source: str,
+        target: str,
+        separator: re.Pattern = PARAGRAPH_SEPARATOR,
+    ) -> str:
+        """
+        Translates a message paragraph by paragraph (or by the segments of
+        another `separator` pattern), keeping the separators and the
+        whitespace around each segment.
+        """
+        if not text or not text.strip():
+            return text
+
+        parts = separator.split(text)
+        segments = [part.strip() for part in parts[::2] if part.strip()]
+        translated = iter(await self.translate_many(segments, source, target))
+
+        output = []
+        for i, part in enumerate(parts):
+            if i % 2 == 1 or not part.strip():
+                output.append(part)
+                continue
+            stripped = part.strip()
+            start = part.index(stripped)
+            output.append(
+                part[:start] + next(translated) + part[start + len(stripped) :]
+            )
+        return "".join(output)
+
+    async def close(self):
+        await self.backend.close()
+
+
+class StreamTranslation:
+    """
+    Translates a streamed message sentence by sentence.
+
+    `feed(text)` appends a chunk. Each time the buffer holds complete
+    sentences, they are sent for translation in the background while the
+    stream goes on; `ready()` returns the translations that have arrived, in
+    the order of the text, and `finish()` translates the rest and waits for
+    everything. A failed translation yields the original text.
+    """
+
+    def __init__(self, service: TranslationService, source: str, target: str):
+        self.service = service
+        self.source = source
+        self.target = target
+        self.buffer = ""
+        self.pending: Deque[asyncio.Task] = deque()
+
+    async def _translate(self, text: str) -> str:
+        try:
+            return await self.service.translate_text(
+                text, self.source, self.target, separator=SENTENCE_SEPARATOR
+            )
+        except Exception as e:
+            print(f"Error translating text: {e}")
+            return text
+
+    def _submit(self, text: str):
+        self.pending.append(asyncio.ensure_future(self._translate(text)))
+
+    def feed(self, text: str):
+        self.buffer += text
+
+        end = 0
+        for match in SENTENCE_SEPARATOR.finditer(self.buffer):
+            end = match.end()
+        if end:
+            complete, self.buffer = self.buffer[:end], self.buffer[end:]
+            self._submit(complete)
+
+    def ready(self) -> str:
+        output = []
+        while self.pending and self.pending[0].done():
+            output.append(self.pending.popleft().result())
+        return "".join(output)
+
+    async def finish(self) -> str:
+        if self.buffer:
+            self._submit(self.buffer)
+            self.buffer = ""
+
+        output = []
+        while self.pending:
+            output.append(await self.pending.popleft())
+        return "".join(output)
+
+    def cancel(self):
+        while self.pending:
+            self.pending.popleft().cancel()